@@ -14,8 +14,19 @@ OUTPUT_FILE=$TMP_PATH/output.log
 #     tar -zxvf logs.tar.gz 
 # fi
 
-rm $OUTPUT_FILE
+rm -f $OUTPUT_FILE $TMP_PATH/desenitize.csv
 touch $OUTPUT_FILE
+
+# without the container when KLEE and the desenitizer are built on this machine:
+# one process for all queries, timings per query in desenitize.csv
+BUILD_DIR=$PWD/build
+if [ -x $BUILD_DIR/desenitizer ] && [ -f $BUILD_DIR/whole.bc ] && command -v ${KLEE:-klee} > /dev/null; then
+    cd scripts/klee_scripts
+    ./desenitize.py $LOG_PATH/Q{1..22}.log -b $BUILD_DIR -d $TMP_PATH/desen -o $TMP_PATH/desenitize.csv \
+        --jobs ${Z3_JOBS:-8} 2>&1 | tee $OUTPUT_FILE
+    exit ${PIPESTATUS[0]}
+fi
+
 # docker run --entrypoint /home/klee/entrypoint-min.sh -v $LOG_PATH:/home/klee/001-log -v $OUTPUT_FILE:/home/klee/output.log zhaoxuyang13/klee-desen:1.0
 # docker run --entrypoint /home/klee/entrypoint-without-one.sh -v $LOG_PATH:/home/klee/001-log -v $OUTPUT_FILE:/home/klee/output.log zhaoxuyang13/klee-desen:1.0
 # logs is built in docker image, for simplicity 
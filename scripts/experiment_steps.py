@@ -9,6 +9,8 @@ import datetime
 import time
 import math
 import re
+import json
+import psycopg2
 from util_py3.ssh_util import *
 from util_py3.prop_util import *
 from util_py3.graph_util import *
@@ -63,18 +65,45 @@ def startVMs(propFile = START_VM_CONFIG):
     executeNonBlockingCommandNoOutput("cd %s && bash %s" %(vmScriptPath, DBVMScriptName))
     executeNonBlockingCommandNoOutput("cd %s && bash %s" %(vmScriptPath, OpsVMScriptName))
 
-    time.sleep(10)
-    
     print("vm started, waiting for postgres-server to be ready for connection")
     
-    while True:
-        output = executeCommandWithOutputReturn("pg_isready  -h %s -p %s" % (pgIp, pgPort))
-        # print(output)
-        if b'accepting connections' in output:
-            break
-        time.sleep(1)
-    # time.sleep(5)
+    waitForPostgres(pgIp, pgPort)
     print("VM started and postgres-server is ready for connection")
+
+# polls postgres until it accepts connections, instead of sleeping a fixed time
+def waitForPostgres(pgIp, pgPort, timeout = 600):
+    deadline = time.time() + timeout
+    delay = 0.1
+    while True:
+        try:
+            psycopg2.connect(host = pgIp, port = pgPort, user = "postgres", dbname = "postgres", connect_timeout = 2).close()
+            return
+        except psycopg2.OperationalError:
+            if time.time() > deadline:
+                raise
+            time.sleep(delay)
+            delay = min(delay * 2, 2)
+
+# splits a query file into its setup statements and the query to time: the
+# statements before psql's \timing, or all but the last one without it
+def splitQueryFile(path):
+    text = open(path, "r").read()
+    if "\\timing" in text:
+        setup, query = text.split("\\timing", 1)
+    else:
+        statements = [stmt for stmt in text.split(";") if stmt.strip()]
+        setup, query = ";".join(statements[:-1]), statements[-1]
+    setup = [stmt.strip() for stmt in setup.split(";") if stmt.strip()]
+    return setup, query.strip().rstrip(";")
+
+# runs a query through EXPLAIN ANALYZE and returns its planning + execution
+# time in ms as measured by the server, without the transfer of its rows
+def explainAnalyzeTime(cur, query):
+    cur.execute("EXPLAIN (ANALYZE, TIMING OFF, FORMAT JSON) " + query)
+    plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Planning Time"] + plan[0]["Execution Time"]
  
 # build the HEDB project, load corresponding schema and data.    
 def prepBenchmark(propFile = DEFAULT_TPCH_CONFIG):
@@ -130,31 +159,34 @@ def runBenchmark(propFile = DEFAULT_TPCH_CONFIG):
     #
     sqlsPath = properties['sqls_path']
     results = []
+    # one session for every query, instead of a psql process per run
+    conn = psycopg2.connect(host = pgIp, port = pgPort, user = "postgres", dbname = "test")
+    conn.autocommit = True
+    cur = conn.cursor()
     for i in range(1,23):
         queryName = "Q%d.sql" % i
         queryTimes = []
+        setup, query = splitQueryFile("%s/%s" % (sqlsPath, queryName))
     
         for j in range(4):
-            output = executeCommandWithOutputReturn("psql -h %s -p %s -U postgres -d test -f %s/%s" %(pgIp, pgPort, sqlsPath, queryName))
-
-            # print(queryNazme)
-            # print(output)
-            time_match = re.match(r'.*Time: ([0-9\.]*) ms.*', str(output))
-            assert(time_match is not None)
-            queryTime = time_match.group(1)
-            queryTimes.append(queryTime)
-            time.sleep(1)
+            # the modes of the query file, set again for every run like psql did
+            for stmt in setup:
+                cur.execute(stmt)
+                if cur.description:
+                    cur.fetchall()
+            queryTime = explainAnalyzeTime(cur, query)
+            queryTimes.append("%.3f" % queryTime)
             
-        # print(queryTime)
+        print("%s: %s ms" % (queryName, ", ".join(queryTimes)))
         results.append({
             "query": i, 
             "times": queryTimes ## need to compute average
         })
         
+    cur.close()
+    conn.close()
     print(results)
     return results
-    dataFile = tmpResultPath
-    saveData(results, "scripts/tmp", experimentName)
 
 def graphData(propFile = DEFAULT_TPCH_CONFIG):
    
@@ -0,0 +1,169 @@
+#!/usr/bin/python3
+
+# Desensitizes the record logs of several queries in one process, instead of
+# desenitize.sh in a container per run: the desenitizer streams each log into
+# ktests, KLEE turns them into .smt2 files, and one pool of z3 processes,
+# started once, solves the files of every query. Every stage is timed per
+# query, along with what one op costs when it is desensitized alone, and the
+# timings are written as CSV for run_experiment.py.
+# $ ./desenitize.py ~/001-log/Q{1..22}.log -b ../../build -o desenitize.csv --jobs 8
+
+import os
+import re
+import sys
+import csv
+import time
+import shutil
+import argparse
+import subprocess
+from os.path import abspath, basename, join, splitext
+
+import run_desenitizer
+from run_z3 import SolutionCache, solve_files, start_pool
+
+KLEE = os.environ.get("KLEE", "klee")
+KLEE_FLAGS = [
+    "--write-smt2s",
+    "--entry-point=ops_wrapper",
+    "--warnings-only-to-file", "--output-stats=0",
+    "--posix-runtime", "--libc=uclibc",
+    "--use-forked-solver=0",
+    "--named-seed-matching", "--only-replay-seeds",
+    "--always-output-seeds=0", "--use-branch-cache=0",
+]
+
+COLUMNS = ["query", "records", "ktests", "smt2", "desenitize_s", "klee_s", "z3_s", "klee_ms_per_op", "z3_ms_per_op"]
+
+def natural_keys(text):
+    return [int(c) if c.isdigit() else c for c in re.split(r'(\d+)', text)]
+
+def run_klee(whole_bc, seeds, output_dir):
+    """replays `seeds` (a ktest file or a directory of them), returns seconds"""
+    shutil.rmtree(output_dir, ignore_errors=True)
+    seed = "--seed-dir=" if os.path.isdir(seeds) else "--seed-file="
+    cmd = [KLEE] + KLEE_FLAGS + [seed + seeds, "--output-dir=" + output_dir, whole_bc]
+    start = time.time()
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.time() - start
+
+def smt2_files(output_dir):
+    files = [f for f in os.listdir(output_dir) if f.endswith(".smt2")]
+    files.sort(key=natural_keys)
+    return [join(output_dir, f) for f in files]
+
+class Desensitizer():
+    """
+    Runs the stages of desenitize.sh in `work_dir` for one log after another,
+    with the z3 pool kept across logs.
+    """
+
+    def __init__(self, build_dir, work_dir, desen_jobs=8, z3_jobs=1, timeout=0, cache_path=None,
+                 templates=False, sample=8) -> None:
+        self.desenitizer = join(abspath(build_dir), "desenitizer")
+        self.whole_bc = join(abspath(build_dir), "whole.bc")
+        self.work_dir = abspath(work_dir)
+        self.desen_jobs = desen_jobs
+        self.z3_jobs = z3_jobs
+        self.timeout = timeout
+        cache_path = cache_path and abspath(cache_path)
+        self.cache = SolutionCache(cache_path) if cache_path else None
+        self.templates = templates
+        self.sample = sample
+        # every worker imports z3 and opens the cache once, not once per query
+        self.pool = start_pool(z3_jobs, cache_path, templates)
+
+    def klee_per_op(self, ktests):
+        """ms of KLEE replaying a single ktest, the cost of an op without batching"""
+        files = sorted(os.listdir(ktests), key=natural_keys)
+        files = [f for f in files if f.endswith(".ktest")][:self.sample]
+        seconds = [run_klee(self.whole_bc, join(ktests, f), "klee-output-sample") for f in files]
+        shutil.rmtree("klee-output-sample", ignore_errors=True)
+        return 1000 * sum(seconds) / len(seconds) if seconds else 0
+
+    def solve(self, filepaths, output_file):
+        """(seconds, ms solving one file on average)"""
+        start = time.time()
+        solved = []
+        with open(output_file, "w+") as f:
+            for file_hash, res, source, seconds in solve_files(filepaths, 1, self.z3_jobs, self.timeout,
+                                                               self.cache and self.cache.path, self.templates, self.pool):
+                if res is None:
+                    raise RuntimeError("not able to generate enough output")
+                if self.cache is not None and source == "cache":
+                    self.cache.hit += 1
+                elif self.cache is not None:
+                    self.cache.miss += 1
+                    if res != "timeout":
+                        self.cache.put(file_hash, res)
+                if source == "solver":
+                    solved.append(seconds)
+                f.write(res + "\n")
+        if self.cache is not None:
+            # visible to the workers for the next queries
+            self.cache.db.commit()
+        return time.time() - start, 1000 * sum(solved) / len(solved) if solved else 0
+
+    def run(self, log_file, output_file):
+        """timings of one log as a row of COLUMNS"""
+        query = splitext(basename(log_file))[0]
+        log_file = abspath(log_file)
+        output_file = abspath(output_file)
+        cwd = os.getcwd()
+        os.makedirs(self.work_dir, exist_ok=True)
+        os.chdir(self.work_dir)
+        try:
+            records, ktests, _, _, desen_s = run_desenitizer.run(self.desenitizer, log_file, self.desen_jobs)
+            klee_s = run_klee(self.whole_bc, "ktests", "klee-output-tmp")
+            filepaths = smt2_files("klee-output-tmp")
+            z3_s, z3_ms = self.solve(filepaths, output_file)
+            klee_ms = self.klee_per_op("ktests") if self.sample else 1000 * klee_s / max(ktests, 1)
+        finally:
+            os.chdir(cwd)
+        return {
+            "query": query,
+            "records": records,
+            "ktests": ktests,
+            "smt2": len(filepaths),
+            "desenitize_s": round(desen_s, 3),
+            "klee_s": round(klee_s, 3),
+            "z3_s": round(z3_s, 3),
+            "klee_ms_per_op": round(klee_ms, 3),
+            "z3_ms_per_op": round(z3_ms, 3),
+        }
+
+    def close(self):
+        self.pool.shutdown()
+        if self.cache is not None:
+            self.cache.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("logs", help="Record logs of the ops server, one per query", nargs="+")
+    parser.add_argument("-b", "--build-dir", help="Directory of desenitizer and whole.bc", default="../../build")
+    parser.add_argument("-w", "--work-dir", help="Directory of ktests and KLEE outputs (default: the build dir)")
+    parser.add_argument("-d", "--desen-dir", help="Directory of the Qx-desen.log outputs", default="desen")
+    parser.add_argument("-o", "--output", help="CSV of the timings of every query", default="desenitize.csv")
+    parser.add_argument("--desen-jobs", help="Threads of the desenitizer", type=int, default=8)
+    parser.add_argument("-j", "--jobs", help="Processes solving .smt2 files, kept across queries", type=int, default=1)
+    parser.add_argument("--timeout", help="Seconds per .smt2 file before writing `timeout` instead of its solution", type=float, default=0)
+    parser.add_argument("--cache", help="SQLite file caching solutions across runs (default: no cache, to time the solver)")
+    parser.add_argument("--templates", help="Reuse solutions of constraints that only differ in their constants", action="store_true")
+    parser.add_argument("--sample", help="ktests replayed one by one per query to time KLEE per op, 0 to divide the batch time", type=int, default=8)
+    args = parser.parse_args()
+
+    os.makedirs(args.desen_dir, exist_ok=True)
+    desensitizer = Desensitizer(args.build_dir, args.work_dir or args.build_dir, args.desen_jobs, args.jobs,
+                                args.timeout, args.cache, args.templates, args.sample)
+    with open(args.output, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        writer.writeheader()
+        for log_file in sorted(args.logs, key=natural_keys):
+            row = desensitizer.run(log_file, join(args.desen_dir, "%s-desen.log" % splitext(basename(log_file))[0]))
+            writer.writerow(row)
+            f.flush()
+            print("%s: %d ktests, %d smt2, desenitizer %.2f s, klee %.2f s, z3 %.2f s, %.1f + %.1f ms per op" % (
+                  row["query"], row["ktests"], row["smt2"], row["desenitize_s"], row["klee_s"], row["z3_s"],
+                  row["klee_ms_per_op"], row["z3_ms_per_op"]), file=sys.stderr)
+    desensitizer.close()
+    if args.cache:
+        print("cache", desensitizer.cache.stats())
@@ -0,0 +1,52 @@
+#!/usr/bin/python3
+
+# Runs the desenitizer over a record log into ./ktests, with live progress
+# and the throughput of each stage at the end.
+# $ ./run_desenitizer.py ../build/desenitizer Q1.log --jobs 8 --dedup
+
+import os
+import re
+import sys
+import time
+import shutil
+import argparse
+import subprocess
+
+PROGRESS = re.compile(r"desenitizer: (\d+) records, (\d+) ktests, (\d+) duplicates, (\d+) skipped, ([\d.]+) records/s")
+
+def run(desenitizer, log_file, jobs=8, dedup=False, clean=True):
+    """returns (records, ktests, duplicates, skipped, seconds)"""
+    if clean:
+        shutil.rmtree("ktests", ignore_errors=True)
+    os.makedirs("ktests", exist_ok=True)
+
+    cmd = [desenitizer, "-j", str(jobs)] + (["-d"] if dedup else []) + [log_file]
+    start = time.time()
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    counts = (0, 0, 0, 0)
+    for line in proc.stderr:
+        m = PROGRESS.match(line)
+        if not m:
+            sys.stderr.write(line)
+            continue
+        counts = tuple(int(g) for g in m.groups()[:4])
+        print("\r%d records, %d ktests, %d duplicates, %d skipped, %s records/s" % (counts + (m.group(5),)),
+              end="" if sys.stderr.isatty() else "\n", file=sys.stderr)
+    if sys.stderr.isatty():
+        print(file=sys.stderr)
+    if proc.wait() != 0:
+        raise RuntimeError("%s exited with %d" % (" ".join(cmd), proc.returncode))
+    return counts + (time.time() - start,)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("desenitizer", help="Path of the desenitizer binary")
+    parser.add_argument("log_file", help="Record log of the ops server")
+    parser.add_argument("-j", "--jobs", help="Threads decrypting requests", type=int, default=8)
+    parser.add_argument("-d", "--dedup", help="One ktest per distinct request, see ktests/index.log", action="store_true")
+    parser.add_argument("--keep", help="Do not empty ./ktests first", action="store_true")
+    args = parser.parse_args()
+
+    records, ktests, duplicates, skipped, seconds = run(args.desenitizer, args.log_file, args.jobs, args.dedup, not args.keep)
+    print("records: %d, ktests: %d, duplicates: %d, skipped: %d" % (records, ktests, duplicates, skipped))
+    print("done in %.2f s, %.1f records/s, %.1f ktests/s" % (seconds, records / seconds, ktests / seconds))
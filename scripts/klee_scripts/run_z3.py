@@ -5,42 +5,104 @@ from z3 import *
 import io
 import time
 from os import listdir
-from os.path import isfile, join
+from os.path import isfile, join, dirname, abspath
 import re 
 import hashlib
+import random
+import functools
+import sqlite3
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 # smt2_file = sys.argv[1]
 filename = "desen.log"
 # set_param("parallel.enable", True)
 
 def solve(smt2_file, iters):
-    s = Solver()
-    constraints = parse_smt2_file(smt2_file)
-    # print(constraints)
+    return solve_constraints(parse_smt2_file(smt2_file), iters, smt2_file)
 
-    s.add(constraints)
-    
-    # loop for $iter different solutions
-    for i in range(iters):
-        if s.check() != sat:
-            print("not able to generate enough output 1" + smt2_file)
-            exit(1)
+IGNORED = ("model_version", "op", "type", "array-ext")
+# constants of ShapeTemplates
+PARAMETER = "shape!"
 
-        m = s.model()
+def projected_terms(constraints):
+    # what a model of the user data consists of: the bytes of the KLEE arrays
+    # the constraints select, and other bit-vector constants
+    terms = {}
+    seen = set()
+    todo = list(constraints)
+    while todo:
+        e = todo.pop()
+        if e.get_id() in seen:
+            continue
+        seen.add(e.get_id())
+        if is_select(e) and is_const(e.arg(0)) and e.arg(0).decl().name() not in IGNORED and is_bv_value(e.arg(1)):
+            terms[e.get_id()] = e
+        elif is_bv(e) and is_const(e) and e.decl().kind() == Z3_OP_UNINTERPRETED and e.decl().name() not in IGNORED:
+            terms[e.get_id()] = e
+        todo.extend(e.children())
+    return sorted(terms.values(), key=str)
 
-        if not m:
-            return "no constraints"
-            
+def enumerate_models(constraints, iters, mode="block", timeout=0, seed=0, xors=0):
+    """
+    Yields up to `iters` models that differ on projected_terms(), raises TimeoutError when a check times out.
+    block: one incremental clause per model, excluding its values of the projected terms.
+    restart: checks again with a new random seed, and a random bound on one projected term
+    since z3 alone tends to return the same model whatever the seed.
+    hash: checks under `xors` random parity constraints on the bits of the projected terms.
+    """
+    s = Solver()
+    if timeout:
+        s.set("timeout", int(timeout * 1000))
+    s.add(constraints)
+    terms = projected_terms(constraints)
+    bits = [Extract(i, i, t) for t in terms for i in range(t.size())]
+    xors = min(xors or iters.bit_length(), len(bits))
+    rng = random.Random(seed)
+    seen = set()
+    # restart and hash may find the same model again
+    attempts = iters if mode == "block" else 8 * iters
 
-        c = []
-        for v in m:
-            name = v.name()
-            if name != "model_version" and name != "op" and name != "type" and name != "array-ext":
-                c.append((v() != m[v]))  
-        # print(c)
-        s.add(Not(And(c)))
+    for i in range(attempts):
+        randomized = mode != "block" and i > 0 and terms
+        if randomized:
+            s.push()
+        if randomized and mode == "restart":
+            s.set("random_seed", rng.randrange(1 << 31))
+            t = rng.choice(terms)
+            bound = rng.randrange(1 << t.size())
+            s.add(ULE(t, bound) if rng.random() < 0.5 else UGE(t, bound))
+        if randomized and mode == "hash":
+            for _ in range(xors):
+                subset = [b for b in bits if rng.random() < 0.5]
+                if subset:
+                    s.add(functools.reduce(lambda a, b: a ^ b, subset) == rng.randrange(2))
+        res = s.check()
+        m = s.model() if res == sat else None
+        if randomized:
+            s.pop()
+            if res == unsat:
+                # cells too small for the models left
+                xors = max(xors - 1, 0)
+                continue
+        if res == unknown:
+            raise TimeoutError
+        if res != sat:
+            return
 
+        values = tuple(m.eval(t, model_completion=True).as_long() for t in terms)
+        if values not in seen:
+            seen.add(values)
+            yield m
+            if len(seen) == iters:
+                return
+        if not terms:
+            return
+        if mode == "block":
+            s.add(Or([t != v for t, v in zip(terms, values)]))
 
+def format_model(m):
     def print_to_string(*args, **kwargs):
         output = io.StringIO()
         print(*args, file=output, **kwargs)
@@ -53,26 +115,234 @@ def solve(smt2_file, iters):
     # print result
     for v in m:
         name = v.name()
-        if name != "model_version" and name != "op" and name != "type" and name != "array-ext":
+        if name not in IGNORED and not name.startswith(PARAMETER):
             out += print_to_string(name, m[v], sep=",") + ";"
 
     out = out.replace("\n", "").replace(" ","")
     return out
+
+def solve_constraints(constraints, iters, smt2_file="", timeout=0):
+    # the last of $iter different solutions
+    m = None
+    n = 0
+    try:
+        for m in enumerate_models(constraints, iters, timeout=timeout):
+            n += 1
+            if not m:
+                return "no constraints"
+    except TimeoutError:
+        return "timeout"
+    if n < iters:
+        print("not able to generate enough output 1" + smt2_file)
+        exit(1)
+    return format_model(m)
 # with open(filename, 'a') as f:
 #     f.write(out + "\n")
 
-def calc_hash(file):
-    hash_md5 = hashlib.md5()
-    with open(file, "rb") as f:
-        for byte_block in iter(lambda: f.read(4096),b""):
-            hash_md5.update(byte_block)
-    return hash_md5.hexdigest()
+def constraint_hash(constraints, iters):
+    # z3 prints the same constraints the same way whatever the whitespace,
+    # comments and let-bindings of the .smt2 file, and the order of its asserts
+    hash_sha256 = hashlib.sha256(str(iters).encode())
+    for c in sorted(c.sexpr() for c in constraints):
+        hash_sha256.update(c.encode())
+        hash_sha256.update(b"\0")
+    return hash_sha256.hexdigest()
+
+class SolutionCache():
+    """
+    Solutions of solve() persisted in a SQLite file, keyed by constraint_hash(),
+    so that repeated desensitization runs only solve new constraints.
+    """
+
+    def __init__(self, path, commit_every=1000):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS solutions (hash TEXT PRIMARY KEY, solution TEXT NOT NULL)")
+        self.commit_every = commit_every
+        self.pending = 0
+        self.hit = 0
+        self.miss = 0
+
+    def get(self, key):
+        row = self.db.execute("SELECT solution FROM solutions WHERE hash = ?", (key,)).fetchone()
+        if row is None:
+            self.miss += 1
+            return None
+        self.hit += 1
+        return row[0]
+
+    def put(self, key, solution):
+        self.db.execute("INSERT OR IGNORE INTO solutions VALUES (?, ?)", (key, solution))
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            self.db.commit()
+            self.pending = 0
+
+    def stats(self):
+        total = self.hit + self.miss
+        return "hit: %d, miss: %d, hit rate: %.1f%%" % (self.hit, self.miss, 100.0 * self.hit / total if total else 0)
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+class ShapeTemplates():
+    """
+    Constraints that only differ in their bit-vector constants (e.g. the same
+    UDF on other data) share a shape, in which every distinct constant is a
+    parameter. A shape keeps one incremental solver and its latest solutions:
+    a new instance first evaluates those solutions on its constraints, and
+    only solves for its parameter values when none of them fits.
+    """
+
+    def __init__(self, keep=8):
+        self.shapes = {} # key -> (solver, parameters, solutions)
+        self.keep = keep
+        self.reused = 0
+        self.solved = 0
+
+    def canonicalize(self, constraints):
+        """(shape key, shape constraints, parameters, their values in constraints)"""
+        memo = {}
+        values = []
+        parameters = []
+
+        def abstract(e, is_index=False):
+            if is_bv_value(e) and not is_index:
+                key = ("value", e.get_id())
+                if key not in memo:
+                    memo[key] = BitVec("%sk%d" % (PARAMETER, len(parameters)), e.size())
+                    parameters.append(memo[key])
+                    values.append(e)
+                return memo[key]
+            if not is_app(e) or e.num_args() == 0:
+                return e
+            if e.get_id() in memo:
+                return memo[e.get_id()]
+            args = [abstract(a, is_select(e) and i == 1) for i, a in enumerate(e.children())]
+            memo[e.get_id()] = e.decl()(*args)
+            return memo[e.get_id()]
+
+        shape = [abstract(c) for c in constraints]
+        key = hashlib.sha256("\0".join(c.sexpr() for c in shape).encode()).hexdigest()
+        return key, shape, parameters, values
+
+    def fits(self, constraints, terms, values):
+        if not terms:
+            return False
+        ground = substitute(And(list(constraints)), *[(t, BitVecVal(v, t.size())) for t, v in zip(terms, values)])
+        return is_true(simplify(ground))
+
+    def solve(self, constraints, smt2_file="", timeout=0):
+        key, shape, parameters, values = self.canonicalize(constraints)
+        if key not in self.shapes:
+            s = Solver()
+            if timeout:
+                s.set("timeout", int(timeout * 1000))
+            s.add(shape)
+            self.shapes[key] = (s, parameters, deque(maxlen=self.keep))
+        s, parameters, solutions = self.shapes[key]
+
+        terms = projected_terms(constraints)
+        for term_values, out in solutions:
+            if self.fits(constraints, terms, term_values):
+                self.reused += 1
+                return out
+
+        s.push()
+        s.add([p == v for p, v in zip(parameters, values)])
+        res = s.check()
+        m = s.model() if res == sat else None
+        s.pop()
+        if res == unknown and timeout:
+            return "timeout"
+        if res != sat:
+            print("not able to generate enough output 1" + smt2_file)
+            exit(1)
+        self.solved += 1
+        if not m:
+            return "no constraints"
+        out = format_model(m)
+        solutions.appendleft((tuple(m.eval(t, model_completion=True).as_long() for t in terms), out))
+        return out
+
+worker_cache = None
+worker_templates = None
+
+def init_worker(cache_path, templates=False):
+    global worker_cache, worker_templates
+    if cache_path:
+        worker_cache = SolutionCache(cache_path)
+    if templates:
+        worker_templates = ShapeTemplates()
+
+def solve_task(filepath, iters, timeout):
+    """
+    (hash, solution, where it came from: cache, template or solver, seconds) of
+    one file, solution is None when it is unsat
+    """
+    start = time.time()
+    constraints = parse_smt2_file(filepath)
+    file_hash = constraint_hash(constraints, iters)
+    if worker_cache is not None:
+        res = worker_cache.get(file_hash)
+        if res is not None:
+            return file_hash, res, "cache", time.time() - start
+    try:
+        if worker_templates is not None and iters == 1:
+            reused = worker_templates.reused
+            res = worker_templates.solve(constraints, filepath, timeout)
+            return file_hash, res, "template" if worker_templates.reused > reused else "solver", time.time() - start
+        return file_hash, solve_constraints(constraints, iters, filepath, timeout), "solver", time.time() - start
+    except SystemExit:
+        return file_hash, None, "solver", time.time() - start
+
+def solve_files(filepaths, iters, jobs, timeout, cache_path, templates=False, pool=None):
+    """
+    Yields solve_task() of every file in order. With jobs > 1, files are solved
+    by a pool of processes, with at most 4 * jobs files in flight. A `pool` made
+    with start_pool() is reused instead of starting one for these files.
+    """
+    if pool is not None:
+        yield from solve_in_pool(pool, filepaths, iters, jobs, timeout)
+        return
+    if jobs == 1:
+        init_worker(cache_path, templates)
+        for filepath in filepaths:
+            yield solve_task(filepath, iters, timeout)
+        return
+    with start_pool(jobs, cache_path, templates) as pool:
+        yield from solve_in_pool(pool, filepaths, iters, jobs, timeout)
+
+def start_pool(jobs, cache_path, templates=False):
+    return ProcessPoolExecutor(jobs, initializer=init_worker, initargs=(cache_path, templates))
+
+def solve_in_pool(pool, filepaths, iters, jobs, timeout):
+    todo = iter(filepaths)
+    pending = deque()
+    for filepath in todo:
+        pending.append(pool.submit(solve_task, filepath, iters, timeout))
+        if len(pending) == 4 * jobs:
+            break
+    while pending:
+        result = pending.popleft().result()
+        filepath = next(todo, None)
+        if filepath is not None:
+            pending.append(pool.submit(solve_task, filepath, iters, timeout))
+        yield result
 
 if __name__ == "__main__":
-    n = len(sys.argv)
-    assert(n >= 2)
-    smt2_dir = sys.argv[1]
-    outputfile_name = sys.argv[2]
+    parser = argparse.ArgumentParser()
+    parser.add_argument("smt2_dir", help="Directory of .smt2 files")
+    parser.add_argument("outputfile_name", help="One solution per line, in the natural order of the files")
+    parser.add_argument("--cache", help="SQLite file caching solutions across runs (default: z3-cache.sqlite next to smt2_dir)")
+    parser.add_argument("--no-cache", help="Solve every file", action="store_true")
+    parser.add_argument("-j", "--jobs", help="Processes solving files in parallel", type=int, default=1)
+    parser.add_argument("--templates", help="Reuse solutions of constraints that only differ in their constants", action="store_true")
+    parser.add_argument("--timeout", help="Seconds per file before writing `timeout` instead of its solution", type=float, default=0)
+    args = parser.parse_args()
+    smt2_dir = args.smt2_dir
+    outputfile_name = args.outputfile_name
     files = [f for f in listdir(smt2_dir) if f.endswith(".smt2")]
     print("files num,", len(files))
     def atoi(text):
@@ -81,27 +351,44 @@ if __name__ == "__main__":
         return [ atoi(c) for c in re.split(r'(\d+)', text)]
     files.sort(key=natural_keys)
 
-    cache = {}
-    hit = 0
-    miss = 0
-    print("files num", len(files))
-    with open(outputfile_name, "w+") as f:
-        for file in files:
-            filepath = join(smt2_dir, file)
-            # print(filepath)
-            if 0: # this branch is for cached
-                file_hash = calc_hash(filepath)
-                if file_hash not in cache:
-                    miss += 1
-                    res = solve(filepath, 1)
-                    cache[file_hash] = res 
-                else :
-                    hit += 1   
-                f.write(cache[file_hash]+"\n")    
-            else: # this branch is no optimize
-                f.write(solve(filepath, 1)+"\n")    
-
-            
-    # print("done hit: ",hit, ", miss: ",miss)
-        
-        
+    cache = None
+    if not args.no_cache:
+        # next to smt2_dir, which desenitize.sh recreates for every run
+        cache = SolutionCache(args.cache or join(dirname(abspath(smt2_dir)), "z3-cache.sqlite"))
+    start = time.time()
+    last_progress = start
+    done = timeouts = reused = 0
+    filepaths = [join(smt2_dir, file) for file in files]
+    try:
+        with open(outputfile_name, "w+") as f:
+            for file_hash, res, source, _ in solve_files(filepaths, 1, args.jobs, args.timeout, cache and cache.path, args.templates):
+                if res is None:
+                    exit(1)
+                reused += source == "template"
+                if cache is not None:
+                    if source == "cache":
+                        cache.hit += 1
+                    else:
+                        cache.miss += 1
+                        if res != "timeout":
+                            cache.put(file_hash, res)
+                timeouts += res == "timeout"
+                f.write(res+"\n")
+                done += 1
+
+                now = time.time()
+                if now - last_progress >= 1 or done == len(filepaths):
+                    last_progress = now
+                    print("\r%d/%d files, %.1f files/s, %d from templates, %d timeouts" % (
+                          done, len(filepaths), done / (now - start), reused, timeouts),
+                          end="" if sys.stderr.isatty() else "\n", file=sys.stderr)
+        if sys.stderr.isatty():
+            print(file=sys.stderr)
+
+        print("done in %.2f s" % (time.time() - start))
+        if cache is not None:
+            print("cache", cache.stats())
+    finally:
+        # also when a file is unsat, so the solutions of this run are kept
+        if cache is not None:
+            cache.close()
@@ -1,60 +1,43 @@
 #!/usr/bin/python3
 
 import sys
-from z3 import *
-import io
 import time
-n = len(sys.argv)
-assert(n >= 3)
+import argparse
+from os.path import dirname, abspath
+from z3 import *
+
+sys.path.insert(0, dirname(abspath(__file__)))
+from run_z3 import enumerate_models, format_model
+
+parser = argparse.ArgumentParser()
+parser.add_argument("smt2_file", help="Constraints of one operation")
+parser.add_argument("iters", help="Distinct models to print, one per line", type=int)
+parser.add_argument("--mode", help="block: exclude each model incrementally, restart: new random seed per check, "
+                    "hash: random parity constraints per check", choices=("block", "restart", "hash"), default="block")
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument("--xors", help="Parity constraints per check in hash mode (default: bits of iters)", type=int, default=0)
+parser.add_argument("--timeout", help="Seconds per check", type=float, default=0)
+args = parser.parse_args()
 
-smt2_file = sys.argv[1]
-iters = int(sys.argv[2])
 filename = "desen.log"
 # set_param("parallel.enable", True)
 
-s = Solver()
-constraints = parse_smt2_file(smt2_file)
+constraints = parse_smt2_file(args.smt2_file)
 # print(constraints)
 
-s.add(constraints)
-
-# loop for $iter different solutions
-for i in range(iters):
-    if s.check() != sat:
-        print("not able to generate enough output")
-        exit(1)
-
-    m = s.model()
-
-    if not m:
-        print("not able to generate enough output")
-        exit(1)
-
-    c = []
-    for v in m:
-        name = v.name()
-        if name != "model_version" and name != "op" and name != "type" and name != "array-ext":
-            c.append((v() != m[v]))  
-    # print(c)
-    s.add(Not(And(c)))
-
-
-def print_to_string(*args, **kwargs):
-    output = io.StringIO()
-    print(*args, file=output, **kwargs)
-    contents = output.getvalue()
-    output.close()
-    return contents
-
-out = ""
-
-# print result
-for v in m:
-    name = v.name()
-    if name != "model_version" and name != "op" and name != "type" and name != "array-ext":
-        out += print_to_string(name, m[v], sep=",") + ";"
-
-out = out.replace("\n", "").replace(" ","")
-print(out)
+start = time.time()
+n = 0
+try:
+    for m in enumerate_models(constraints, args.iters, args.mode, args.timeout, args.seed, args.xors):
+        print(format_model(m))
+        n += 1
+except TimeoutError:
+    print("timeout", file=sys.stderr)
+seconds = time.time() - start
+print("%d models in %.3f s, %.1f models/s" % (n, seconds, n / seconds if seconds else 0), file=sys.stderr)
+
+if n < args.iters:
+    print("not able to generate enough output")
+    exit(1)
 # with open(filename, 'a') as f:
-#     f.write(out + "\n")
\ No newline at end of file
+#     f.write(out + "\n")
@@ -171,9 +171,11 @@ def run_desenitize_steps(skip_execution=False):
     print("run desenitize experiment")
     
     tmp_path = Path("scripts/tmp")
+    # ms per op measured once in the container, when desenitize.csv is missing
     KLEE_TIME_PER_OPS = 839.703
     Z3_TIME_PER_OPS = 13.79175
-    # run desenitize experiment, result is in scripts/tmp/time.log
+    # run desenitize experiment, result is in scripts/tmp/desenitize.csv
+    # (native run) or scripts/tmp/time.log (container)
     if not skip_execution:
         executeCommand("scripts/desenitize_test.sh")
     
@@ -181,14 +183,20 @@ def run_desenitize_steps(skip_execution=False):
     # collect data
     before_opt = []
     after_opt = []
-    with open("scripts/tmp/time.log", "r") as f:
-        lines = f.readlines()
-        lines = [line.strip() for line in lines if line.strip() != ""] # remove empty lines
-        cnt = len(lines) // 3
-        for i in range(0, cnt * 2, 2):
-            after_opt.append((parseTime(lines[i+1]) + parseTime(lines[i])) * 1000) # to milliseconds
-        for i in range(cnt * 2, cnt * 3):
-            before_opt.append(int(lines[i]) * KLEE_TIME_PER_OPS + int(lines[i]) * Z3_TIME_PER_OPS)
+    if (tmp_path / "desenitize.csv").exists():
+        times = pd.read_csv(tmp_path / "desenitize.csv")
+        # desensitizing the batch of every query vs. every op alone, in milliseconds
+        after_opt = ((times["klee_s"] + times["z3_s"]) * 1000).tolist()
+        before_opt = (times["ktests"] * (times["klee_ms_per_op"] + times["z3_ms_per_op"])).tolist()
+    else:
+        with open("scripts/tmp/time.log", "r") as f:
+            lines = f.readlines()
+            lines = [line.strip() for line in lines if line.strip() != ""] # remove empty lines
+            cnt = len(lines) // 3
+            for i in range(0, cnt * 2, 2):
+                after_opt.append((parseTime(lines[i+1]) + parseTime(lines[i])) * 1000) # to milliseconds
+            for i in range(cnt * 2, cnt * 3):
+                before_opt.append(int(lines[i]) * KLEE_TIME_PER_OPS + int(lines[i]) * Z3_TIME_PER_OPS)
     # create a array of length 22 with initial value 0, move before_opt to the end 
    
     # before_opt = [0] + before_opt + [0] * 16 
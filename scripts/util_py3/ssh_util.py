@@ -35,6 +35,12 @@ from tqdm import tqdm
 # getFile
 # getFileHosts
 
+# Every ssh/scp to a host goes through one connection (OpenSSH ControlMaster)
+# that stays open 10 minutes after its last command, instead of a new
+# handshake per command
+SSH_OPTIONS = "-o StrictHostKeyChecking=no -o ControlMaster=auto -o ControlPath=~/.ssh/cm-%C -o ControlPersist=10m"
+os.makedirs(os.path.expanduser("~/.ssh"), mode=0o700, exist_ok=True)
+
 # Executes a command, call is blocking
 # Throws a CalledProcessError if
 # doesn't succeed.
@@ -51,9 +57,9 @@ def executeCommandWithOutputReturn(command, printCmd=True):
 def executeRemoteCommandWithOutputReturn(host, command, key=None, flags=""):
     flags = "" if len(flags) == 0 else flags + " "
     if not key:
-        cmd = "ssh -o StrictHostKeyChecking=no -t " + flags + host + " \"" + command + "\""
+        cmd = "ssh " + SSH_OPTIONS + " -t " + flags + host + " \"" + command + "\""
     else:
-        cmd = "ssh -o StrictHostKeyChecking=no -t -i " + key + " " + flags + host + " \"" + command + "\""
+        cmd = "ssh " + SSH_OPTIONS + " -t -i " + key + " " + flags + host + " \"" + command + "\""
     return executeCommandWithOutputReturn(cmd)
 
 # Returns network interface of the remote host
@@ -91,9 +97,9 @@ def executeCommandNoCheck(command, printfn=print):
 def executeRemoteCommand(host, command, key=None, flags="", printfn=print):
     flags = "" if len(flags) == 0 else flags + " "
     if not key:
-        cmd = "ssh -o StrictHostKeyChecking=no -t " + flags + host + " \"" + command + "\""
+        cmd = "ssh " + SSH_OPTIONS + " -t " + flags + host + " \"" + command + "\""
     else:
-        cmd = "ssh -o StrictHostKeyChecking=no -i " + key + " " + flags + host + " \"" + command + "\""
+        cmd = "ssh " + SSH_OPTIONS + " -i " + key + " " + flags + host + " \"" + command + "\""
     executeCommand(cmd, printfn)
 
 
@@ -106,7 +112,7 @@ def executeRemoteCommandNoCheck(host, command, key=None, printfn=print, tty=Fals
     key_flag = ""
     if key:
         key_flag = f"-i {key}"
-    cmd = f"ssh -o StrictHostKeyChecking=no {tty_flag} {key_flag} {host} \"{command}\""
+    cmd = f"ssh {SSH_OPTIONS} {tty_flag} {key_flag} {host} \"{command}\""
     #printfn("[" + cmd + "]")
     executeCommand(cmd, printfn)
 
@@ -117,9 +123,9 @@ def executeRemoteCommandNoCheck(host, command, key=None, printfn=print, tty=Fals
 def executeSequenceBlockingRemoteCommand(hosts, command, key=None):
     for h in hosts:
         if not key:
-            cmd = "ssh -o StrictHostKeyChecking=no -t " + h + "'" + command + "'"
+            cmd = "ssh " + SSH_OPTIONS + " -t " + h + "'" + command + "'"
         else:
-            cmd = "ssh -o StrictHostKeyChecking=no -t -i " + \
+            cmd = "ssh " + SSH_OPTIONS + " -t -i " + \
                   key + " " + h + "'" + command + "'"
         subprocess.check_call(cmd, shell=True)
 
@@ -131,9 +137,9 @@ def executeParallelBlockingRemoteCommand(hosts, command, key=None, printCmd=True
     thread_list = list()
     for h in hosts:
         if not key:
-            cmd = "ssh -o StrictHostKeyChecking=no -t " + h + " '" + command + "'"
+            cmd = "ssh " + SSH_OPTIONS + " -t " + h + " '" + command + "'"
         else:
-            cmd = "ssh -o StrictHostKeyChecking=no -i " + \
+            cmd = "ssh " + SSH_OPTIONS + " -i " + \
                   key + " " + h + " '" + command + "'"
         t = threading.Thread(target=executeCommand, args=(cmd, tqdm.write, printCmd, h))
         thread_list.append(t)
@@ -226,9 +232,9 @@ def mkdirCmd(directory):
 # Creates Directory on remote host
 def mkdirRemote(host, directory, key=None):
     if not key:
-        cmd = "ssh -o StrictHostKeyChecking=no " + host + " \'mkdir -p " + directory + " \'"
+        cmd = "ssh " + SSH_OPTIONS + " " + host + " \'mkdir -p " + directory + " \'"
     else:
-        cmd = "ssh -o StrictHostKeyChecking=no -i " + key + \
+        cmd = "ssh " + SSH_OPTIONS + " -i " + key + \
               " " + host + " \'mkdir -p " + directory + " \'"
     executeCommand(cmd)
 
@@ -238,9 +244,9 @@ def mkdirRemote(username, host, directory, key=None):
 
 def mkdirRemoteCmd(username, host, directory, key=None):
     if not key:
-        cmd = f"ssh -o StrictHostKeyChecking=no {username}@{host} 'mkdir -p {directory}'"
+        cmd = f"ssh {SSH_OPTIONS} {username}@{host} 'mkdir -p {directory}'"
     else:
-        cmd = f"ssh -o StrictHostKeyChecking=no -i {key} {username}@{host} 'mkdir -p {directory}'"
+        cmd = f"ssh {SSH_OPTIONS} -i {key} {username}@{host} 'mkdir -p {directory}'"
     return cmd
 
 
@@ -280,27 +286,27 @@ def rmdirRemoteHosts(hosts, directory, key=None):
 # Deletes remote dir, command fails if it does not exist
 def rmdirRemote(host, directory, key=None):
     if not key:
-        cmd = "ssh -o StrictHostKeyChecking=no " + host + " \'rm -r " + directory + "\'"
+        cmd = "ssh " + SSH_OPTIONS + " " + host + " \'rm -r " + directory + "\'"
     else:
-        cmd = "ssh -o StrictHostKeyChecking=no -i " + key + " " + host + " \'rm -r " + directory + "\'"
+        cmd = "ssh " + SSH_OPTIONS + " -i " + key + " " + host + " \'rm -r " + directory + "\'"
     executeCommand(cmd)
 
 
 # Deletes remote dir, if it exists, otherwise, do nothing
 def rmdirRemoteIfExists(host, directory, key=None):
     if not key:
-        cmd = "ssh -o StrictHostKeyChecking=no " + host + " \'rm -r " + directory + "\'"
+        cmd = "ssh " + SSH_OPTIONS + " " + host + " \'rm -r " + directory + "\'"
     else:
-        cmd = "ssh -o StrictHostKeyChecking=no -i " + key + " " + host + " \'rm -r " + directory + "\'"
+        cmd = "ssh " + SSH_OPTIONS + " -i " + key + " " + host + " \'rm -r " + directory + "\'"
     executeCommandNoCheck(cmd)
 
 
 # Deletes remote dir, if it exists, otherwise, do nothing
 def rmfileRemoteIfExists(host, filee, key=None):
     if not key:
-        cmd = "ssh -o StrictHostKeyChecking=no " + host + " \'rm " + filee + "\'"
+        cmd = "ssh " + SSH_OPTIONS + " " + host + " \'rm " + filee + "\'"
     else:
-        cmd = "ssh -o StrictHostKeyChecking=no -i " + key + " " + host + " \'rm " + filee + "\'"
+        cmd = "ssh " + SSH_OPTIONS + " -i " + key + " " + host + " \'rm " + filee + "\'"
     executeCommandNoCheck(cmd)
 
 
@@ -317,7 +323,7 @@ def gitSetOriginCmd(directory, origin):
     return cmd
 
 def gitRemoteSetOrigin(directory, origin, host, key):
-    cmd = "ssh -o StrictHostKeyChecking=no -i " + key + " -A " + host + "'" + gitSetOriginCmd(directory, origin) + "'"
+    cmd = "ssh " + SSH_OPTIONS + " -i " + key + " -A " + host + "'" + gitSetOriginCmd(directory, origin) + "'"
     executeCommand(cmd)
 
 def gitPullCmd(directory, remote="origin", branch="main"):
@@ -325,7 +331,7 @@ def gitPullCmd(directory, remote="origin", branch="main"):
     return cmd
 
 def gitPullRemote(directory, host, key, remote="origin", branch="main"):
-    cmd = "ssh -o StrictHostKeyChecking=no -i " + key + " -A " + host + "'" + gitPullCmd(directory, remote, branch) + "'"
+    cmd = "ssh " + SSH_OPTIONS + " -i " + key + " -A " + host + "'" + gitPullCmd(directory, remote, branch) + "'"
     executeCommand(cmd)
 
 # Updates repository (SVN)
@@ -340,18 +346,18 @@ def getDirectory(local_dir, hosts, remote_dir, key=None, printfn=print):
     printfn(str(hosts))
     for h in hosts:
         if not key:
-            cmd = "scp -o StrictHostKeyChecking=no -r " + \
+            cmd = "scp " + SSH_OPTIONS + " -r " + \
                   h + ":" + remote_dir + " " + local_dir
         else:
-            cmd = "scp -o StrictHostKeyChecking=no -i " + key + \
+            cmd = "scp " + SSH_OPTIONS + " -i " + key + \
                   " -r " + h + ":" + remote_dir + " " + local_dir
         executeCommand(cmd, printfn)
 
 def getDirectoryCmd(local_dir, username, host, remote_dir, key=None):
     if not key:
-        cmd = f"scp -o StrictHostKeyChecking=no -r {username}@{host}:{remote_dir} {local_dir}"
+        cmd = f"scp {SSH_OPTIONS} -r {username}@{host}:{remote_dir} {local_dir}"
     else:
-        cmd = f"scp -o StrictHostKeyChecking=no -i {key} -r {username}@{host}:{remote_dir} {local_dir}"
+        cmd = f"scp {SSH_OPTIONS} -i {key} -r {username}@{host}:{remote_dir} {local_dir}"
     return cmd
 
 # Downloads folder remote_dir from all hosts in to local_dir
@@ -368,26 +374,26 @@ def getDirectory(local_dir, username, hosts, remote_dir, key=None, printfn=print
 def getFile(local_dir, hosts, remote_file, key=None):
     for h in hosts:
         if not key:
-            cmd = f"scp  -o StrictHostKeyChecking=no {h}:{remote_file} {local_dir}"
+            cmd = f"scp  {SSH_OPTIONS} {h}:{remote_file} {local_dir}"
         else:
-            cmd = f"scp  -o StrictHostKeyChecking=no -i {key} {h}:{remote_file} {local_dir}"
+            cmd = f"scp  {SSH_OPTIONS} -i {key} {h}:{remote_file} {local_dir}"
         executeCommand(cmd)
 
 
 # Sends file to remote host
 def sendFile(local_file, h, remote_dir, key=None, printfn=print):
     if not key:
-        cmd = f"scp -o StrictHostKeyChecking=no {local_file} {h}:{remote_dir}"
+        cmd = f"scp {SSH_OPTIONS} {local_file} {h}:{remote_dir}"
     else:
-        cmd = f"scp -o StrictHostKeyChecking=no -i {key} {local_file} {h}:{remote_dir}"
+        cmd = f"scp {SSH_OPTIONS} -i {key} {local_file} {h}:{remote_dir}"
     executeCommand(cmd, printfn)
 
 
 def sendFileCmd(local_file, h, username, remote_dir, key=None):
     if not key:
-        cmd = f"scp -o StrictHostKeyChecking=no {local_file} {username}@{h}:{remote_dir}"
+        cmd = f"scp {SSH_OPTIONS} {local_file} {username}@{h}:{remote_dir}"
     else:
-        cmd = f"scp -o StrictHostKeyChecking=no -i {key} {local_file} {username}@{h}:{remote_dir}"
+        cmd = f"scp {SSH_OPTIONS} -i {key} {local_file} {username}@{h}:{remote_dir}"
     return cmd
 
 # Sends file to remote host
@@ -400,9 +406,9 @@ def sendFileHosts(local_file, hosts, remote_dir, key=None):
     threads = []
     for h in hosts:
         if not key:
-            cmd = f"scp -o StrictHostKeyChecking=no {local_file} {h}:{remote_dir}"
+            cmd = f"scp {SSH_OPTIONS} {local_file} {h}:{remote_dir}"
         else:
-            cmd = f"scp -o StrictHostKeyChecking=no -i {key} {local_file} {h}:{remote_dir}"
+            cmd = f"scp {SSH_OPTIONS} -i {key} {local_file} {h}:{remote_dir}"
         t = executeNonBlockingCommand(cmd)
         t.start()
         threads.append(t)
@@ -0,0 +1,149 @@
+#pragma once
+
+#include <atomic>
+#include <pthread.h>
+#include <stdint.h>
+#include <string>
+#include <unistd.h> // pid
+
+/*
+ * Leakage logging shared by the integrity zone (interface.cpp) and the
+ * privacy zone (ops_server.cpp).
+ *
+ * By default every operation is appended to `path` as a base64 text line,
+ *     [type] op var1 var2 ... res
+ * which is what tools/solvers/log_check.py tails.
+ *
+ * With HEDB_LEAKAGE_LOG=binary, operations are written as fixed-size
+ * LeakageRecord's into `<path without .log>-<pid>.bin` through a mmaped
+ * window (like Recorder::get_write_buffer), and read back by
+ * tools/solvers/leakage_log.py as a NumPy structured array.
+ *
+ * With HEDB_LEAKAGE_LOG_ASYNC=<records>, the query path only copies each
+ * record into a lock-free ring of that many records, and a writer thread
+ * of the process formats and writes them, flushing at least every
+ * HEDB_LEAKAGE_LOG_FLUSH_MS (10) ms. On a full ring the query path waits
+ * for the writer, or drops the record with HEDB_LEAKAGE_LOG_POLICY=drop.
+ */
+
+#define LEAKAGE_CIPHER_LENGTH 32 // sizeof(EncInt) == sizeof(EncFloat)
+#define LEAKAGE_CHUNK_RECORDS (128 * 1024) // 14MB per mmaped window
+#define LEAKAGE_TEXT_BUFFER (64 * 1024)
+
+enum LeakageOp : uint8_t {
+    LEAK_NONE = 0, // unwritten tail of the file
+    LEAK_PLUS,
+    LEAK_MINUS,
+    LEAK_MULT,
+    LEAK_DIV,
+    LEAK_MOD,
+    LEAK_EXP,
+    LEAK_SUM,
+    LEAK_AVG,
+    LEAK_MAX,
+    LEAK_MIN,
+    LEAK_EQ,
+    LEAK_NE,
+    LEAK_LT,
+    LEAK_LE,
+    LEAK_GT,
+    LEAK_GE,
+};
+
+/* record flags */
+#define LEAKAGE_ITEM 0x1 // one operand of a bulk op, `left` holds the item
+#define LEAKAGE_BOOL 0x2 // comparison, `cond` holds the result instead of `res`
+#define LEAKAGE_DROPPED 0x4 // end of a bulk op that lost items to a full ring, discard it
+
+struct LeakageRecord {
+    uint64_t timestamp; // ns, CLOCK_MONOTONIC
+    uint8_t type; // 'i', 'f', or 0 when the writer logs untyped lines
+    uint8_t op; // LeakageOp
+    uint8_t flags;
+    uint8_t cond;
+    uint32_t pid;
+    uint8_t left[LEAKAGE_CIPHER_LENGTH];
+    uint8_t right[LEAKAGE_CIPHER_LENGTH];
+    uint8_t res[LEAKAGE_CIPHER_LENGTH];
+};
+static_assert(sizeof(LeakageRecord) == 112, "LeakageRecord layout is read by tools/solvers/leakage_log.py");
+
+struct LeakageStats {
+    uint64_t records; // records written to the log
+    uint64_t bytes; // bytes written to the log
+    uint64_t dropped; // records dropped on a full ring
+    uint64_t logging_ns; // time the query path spent in the logging calls
+    uint64_t blocked_ns; // part of logging_ns waiting for a full ring
+    uint64_t writer_ns; // time the writer thread spent formatting and writing
+};
+
+class LeakageLog {
+    std::string path;
+    bool typed; // prefix every text line with the type tag
+    bool binary;
+    pid_t pid; // process owning write_fd, 0 before its first record
+    int write_fd;
+    /* text backend */
+    char* text_buf;
+    size_t text_len;
+    std::string bulk_line; // items of the bulk op being written
+    /* binary backend */
+    LeakageRecord* window;
+    unsigned long window_start; // index of window[0] in the file
+    unsigned long cursor; // records written
+    /* query path */
+    LeakageRecord scratch;
+    uint64_t op_start;
+    uint8_t bulk_type;
+    LeakageOp bulk_op;
+    unsigned long bulk_queued; // items of this bulk op handed to the writer
+    bool dropping_bulk;
+    /* asynchronous writer */
+    LeakageRecord* ring;
+    size_t ring_size; // power of 2
+    bool drop; // drop records on a full ring instead of waiting
+    unsigned long flush_ms;
+    std::atomic<uint64_t> head; // next slot filled by the query path
+    std::atomic<uint64_t> tail; // next slot drained by the writer
+    std::atomic<bool> stopping;
+    bool writer_running;
+    pthread_t writer;
+    /* counters */
+    std::atomic<uint64_t> records, bytes, dropped, logging_ns, blocked_ns, writer_ns;
+
+    void open_sink();
+    void release_sink(bool owner);
+    /* (re)open the sink and the writer on the first record of a process */
+    void ensure_process();
+    void start_writer();
+    static void* writer_main(void* arg);
+    void drain();
+
+    /* next free record of the binary window, remaps it and extends the file when it is full */
+    LeakageRecord* next_record();
+    void append(const char* str, size_t length);
+    void flush_text();
+    size_t write_text(const LeakageRecord& record);
+    size_t write_record(const LeakageRecord& record);
+
+    /* slot for a new record, nullptr when it is dropped */
+    LeakageRecord* begin(uint8_t type, LeakageOp op, uint8_t flags, bool wait);
+    void commit(LeakageRecord* record);
+
+public:
+    LeakageLog(const char* path, bool typed);
+    ~LeakageLog();
+    LeakageLog(const LeakageLog&) = delete;
+    LeakageLog& operator=(const LeakageLog&) = delete;
+
+    /* op l r res */
+    void calc(uint8_t type, LeakageOp op, const void* left, const void* right, const void* res, size_t size);
+    /* op l r True/False */
+    void cmp(uint8_t type, LeakageOp op, const void* left, const void* right, bool res, size_t size);
+    /* op item item ... res */
+    void bulk_begin(uint8_t type, LeakageOp op);
+    void bulk_item(const void* item, size_t size);
+    void bulk_end(const void* res, size_t size);
+    LeakageStats stats() const;
+    void close();
+};
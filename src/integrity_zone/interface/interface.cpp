@@ -2,6 +2,7 @@
 #include <ctype.h>
 #include <extension.hpp>
 #include <interface.hpp>
+#include <leakage_log.h>
 #include <pthread.h>
 #include <recorder.hpp>
 #include <replayer.hpp>
@@ -28,13 +29,13 @@ char record_name_prefix[MAX_NAME_LENGTH];
 char record_names[MAX_RECORDS_NUM][MAX_NAME_LENGTH];
 
 uint64_t current_log_size = 0;
-ofstream outfile("/tmp/integrity_zone.log", ios::app); // leakage logging for I-Zone
+LeakageLog leakage_log("/tmp/integrity_zone.log", true); // leakage logging for I-Zone
 
 void exit_handler()
 {
     TEEInvoker* invoker = TEEInvoker::getInstance();
     delete invoker;
-    outfile.close();
+    leakage_log.close();
 }
 
 #define SHM_SIZE (16 * 1024 * 1024) // TODO: merge this into one header
@@ -1,4 +1,5 @@
 #include "base64.h"
+#include "leakage_log.h"
 #include <enc_float_ops.hpp>
 #include <extension.hpp>
 #include <string>
@@ -7,14 +8,7 @@
 using namespace std;
 
 extern bool clientMode;
-extern ofstream outfile;
-
-static string b64_float(EncFloat* in)
-{
-    char b64_float4[ENC_FLOAT_B64_LENGTH + 1] = { 0 };
-    toBase64((const unsigned char*)in, sizeof(EncFloat), b64_float4);
-    return b64_float4;
-}
+extern LeakageLog leakage_log;
 
 #ifdef __cplusplus
 extern "C" {
@@ -163,18 +157,18 @@ Datum enc_float4_sum_bulk(PG_FUNCTION_ARGS)
     int counter = 1; // sum will be at array[0]
     int error;
 
-    outfile << "f SUM "; /// logging
+    leakage_log.bulk_begin('f', LEAK_SUM); /// logging
 
     ArrayMetaState* my_extra = (ArrayMetaState*)fcinfo->flinfo->fn_extra;
     ArrayIterator array_iterator = array_create_iterator(v, 0, my_extra);
 
     array_iterate(array_iterator, &value, &isnull);
     *sum = *DatumGetEncFloat(value);
-    outfile << b64_float(sum) << " "; /// logging
+    leakage_log.bulk_item(sum, sizeof(EncFloat)); /// logging
     sum_array[0] = *sum;
     while (array_iterate(array_iterator, &value, &isnull)) {
         sum_array[counter] = *DatumGetEncFloat(value);
-        outfile << b64_float(&sum_array[counter]) << " "; /// logging
+        leakage_log.bulk_item(&sum_array[counter], sizeof(EncFloat)); /// logging
         counter++;
         if (counter == BULK_SIZE) {
             error = enc_float_sum_bulk(BULK_SIZE, sum_array, sum);
@@ -188,7 +182,7 @@ Datum enc_float4_sum_bulk(PG_FUNCTION_ARGS)
         if (error) print_error("%s %d", __func__, error);
     }
 
-    outfile << b64_float(sum) << endl; /// logging
+    leakage_log.bulk_end(sum, sizeof(EncFloat)); /// logging
     PG_RETURN_POINTER(sum);
 }
 
@@ -206,14 +200,14 @@ Datum enc_float4_avg_bulk(PG_FUNCTION_ARGS)
     EncFloat num_array[BULK_SIZE]; // nitems of '1'
     int counter; // sum will be at array[0]
 
-    outfile << "f AVG "; /// logging
+    leakage_log.bulk_begin('f', LEAK_AVG); /// logging
 
     ArrayMetaState* my_extra = (ArrayMetaState*)fcinfo->flinfo->fn_extra;
     ArrayIterator array_iterator = array_create_iterator(v, 0, my_extra);
 
     array_iterate(array_iterator, &value, &isnull);
     sum = *DatumGetEncFloat(value);
-    outfile << b64_float(&sum) << " "; /// logging
+    leakage_log.bulk_item(&sum, sizeof(EncFloat)); /// logging
     sum_array[0] = sum;
     counter = 1;
 
@@ -225,7 +219,7 @@ Datum enc_float4_avg_bulk(PG_FUNCTION_ARGS)
     }
     while (array_iterate(array_iterator, &value, &isnull)) {
         sum_array[counter] = *DatumGetEncFloat(value);
-        outfile << b64_float(&sum_array[counter]) << " "; /// logging
+        leakage_log.bulk_item(&sum_array[counter], sizeof(EncFloat)); /// logging
         num_array[counter] = unit;
         counter++;
         if (counter == BULK_SIZE) {
@@ -247,7 +241,7 @@ Datum enc_float4_avg_bulk(PG_FUNCTION_ARGS)
     error = enc_float_div(&sum, &num, res);
     if (error) print_error("%s %d", __func__, error);
 
-    outfile << b64_float(res) << endl; /// logging
+    leakage_log.bulk_end(res, sizeof(EncFloat)); /// logging
     PG_RETURN_POINTER(res);
 }
 
@@ -406,7 +400,7 @@ Datum enc_float4_max(PG_FUNCTION_ARGS)
     int error = enc_float_cmp(f1, f2, &cmp);
     if (error) print_error("%s %d", __func__, error);
 
-    outfile << "f MAX " << b64_float(f1) << " " << b64_float(f2) << " " << b64_float(cmp == 1 ? f1 : f2) << endl;
+    leakage_log.calc('f', LEAK_MAX, f1, f2, cmp == 1 ? f1 : f2, sizeof(EncFloat));
 
     if (cmp == 1)
         PG_RETURN_POINTER(f1);
@@ -425,7 +419,7 @@ Datum enc_float4_min(PG_FUNCTION_ARGS)
     int error = enc_float_cmp(f1, f2, &cmp);
     if (error) print_error("%s %d", __func__, error);
 
-    outfile << "f MIN " << b64_float(f1) << " " << b64_float(f2) << " " << b64_float(cmp == 1 ? f1 : f2) << endl;
+    leakage_log.calc('f', LEAK_MIN, f1, f2, cmp == 1 ? f1 : f2, sizeof(EncFloat));
 
     if (cmp == 1)
         PG_RETURN_POINTER(f2);
@@ -442,7 +436,7 @@ Datum enc_float4_add(PG_FUNCTION_ARGS)
     int error = enc_float_add(f1, f2, f);
     if (error) print_error("%s %d", __func__, error);
 
-    outfile << "f + " << b64_float(f1) << " " << b64_float(f2) << " " << b64_float(f) << endl;
+    leakage_log.calc('f', LEAK_PLUS, f1, f2, f, sizeof(EncFloat));
 
     PG_RETURN_POINTER(f);
 }
@@ -461,7 +455,7 @@ Datum enc_float4_subs(PG_FUNCTION_ARGS)
     int error = enc_float_sub(f1, f2, f);
     if (error) print_error("%s %d", __func__, error);
 
-    outfile << "f - " << b64_float(f1) << " " << b64_float(f2) << " " << b64_float(f) << endl;
+    leakage_log.calc('f', LEAK_MINUS, f1, f2, f, sizeof(EncFloat));
 
     PG_RETURN_POINTER(f);
 }
@@ -480,7 +474,7 @@ Datum enc_float4_mult(PG_FUNCTION_ARGS)
     int error = enc_float_mult(f1, f2, f);
     if (error) print_error("%s %d", __func__, error);
 
-    outfile << "f * " << b64_float(f1) << " " << b64_float(f2) << " " << b64_float(f) << endl;
+    leakage_log.calc('f', LEAK_MULT, f1, f2, f, sizeof(EncFloat));
 
     PG_RETURN_POINTER(f);
 }
@@ -500,7 +494,7 @@ Datum enc_float4_div(PG_FUNCTION_ARGS)
     int error = enc_float_div(f1, f2, f);
     if (error) print_error("%s %d", __func__, error);
 
-    outfile << "f / " << b64_float(f1) << " " << b64_float(f2) << " " << b64_float(f) << endl;
+    leakage_log.calc('f', LEAK_DIV, f1, f2, f, sizeof(EncFloat));
 
     PG_RETURN_POINTER(f);
 }
@@ -520,7 +514,7 @@ Datum enc_float4_exp(PG_FUNCTION_ARGS)
     int error = enc_float_pow(f1, f2, f);
     if (error) print_error("%s %d", __func__, error);
 
-    outfile << "f ^ " << b64_float(f1) << " " << b64_float(f2) << " " << b64_float(f) << endl;
+    leakage_log.calc('f', LEAK_EXP, f1, f2, f, sizeof(EncFloat));
 
     PG_RETURN_POINTER(f);
 }
@@ -540,7 +534,7 @@ Datum enc_float4_mod(PG_FUNCTION_ARGS)
     int error = enc_float_mod(f1, f2, f);
     if (error) print_error("%s %d", __func__, error);
 
-    outfile << "f % " << b64_float(f1) << " " << b64_float(f2) << " " << b64_float(f) << endl;
+    leakage_log.calc('f', LEAK_MOD, f1, f2, f, sizeof(EncFloat));
 
     PG_RETURN_POINTER(f);
 }
@@ -561,7 +555,7 @@ Datum enc_float4_eq(PG_FUNCTION_ARGS)
     if (error) print_error("%s %d", __func__, error);
 
     ret = cmp == 0;
-    outfile << "f == " << b64_float(f1) << " " << b64_float(f2) << " " << (ret == true ? "True" : "False") << endl;
+    leakage_log.cmp('f', LEAK_EQ, f1, f2, ret, sizeof(EncFloat));
 
     PG_RETURN_BOOL(ret);
 }
@@ -583,7 +577,7 @@ Datum enc_float4_ne(PG_FUNCTION_ARGS)
     if (error) print_error("%s %d", __func__, error);
 
     ret = cmp != 0;
-    outfile << "f != " << b64_float(f1) << " " << b64_float(f2) << " " << (ret == true ? "True" : "False") << endl;
+    leakage_log.cmp('f', LEAK_NE, f1, f2, ret, sizeof(EncFloat));
 
     PG_RETURN_BOOL(ret);
 }
@@ -605,7 +599,7 @@ Datum enc_float4_lt(PG_FUNCTION_ARGS)
     if (error) print_error("%s %d", __func__, error);
 
     ret = cmp == -1;
-    outfile << "f < " << b64_float(f1) << " " << b64_float(f2) << " " << (ret == true ? "True" : "False") << endl;
+    leakage_log.cmp('f', LEAK_LT, f1, f2, ret, sizeof(EncFloat));
 
     PG_RETURN_BOOL(ret);
 }
@@ -627,7 +621,7 @@ Datum enc_float4_le(PG_FUNCTION_ARGS)
     if (error) print_error("%s %d", __func__, error);
 
     ret = cmp <= 0;
-    outfile << "f <= " << b64_float(f1) << " " << b64_float(f2) << " " << (ret == true ? "True" : "False") << endl;
+    leakage_log.cmp('f', LEAK_LE, f1, f2, ret, sizeof(EncFloat));
 
     PG_RETURN_BOOL(ret);
 }
@@ -649,7 +643,7 @@ Datum enc_float4_gt(PG_FUNCTION_ARGS)
     if (error) print_error("%s %d", __func__, error);
 
     ret = cmp == 1;
-    outfile << "f > " << b64_float(f1) << " " << b64_float(f2) << " " << (ret == true ? "True" : "False") << endl;
+    leakage_log.cmp('f', LEAK_GT, f1, f2, ret, sizeof(EncFloat));
 
     PG_RETURN_BOOL(ret);
 }
@@ -671,7 +665,7 @@ Datum enc_float4_ge(PG_FUNCTION_ARGS)
     if (error) print_error("%s %d", __func__, error);
 
     ret = cmp >= 0;
-    outfile << "f >= " << b64_float(f1) << " " << b64_float(f2) << " " << (ret == true ? "True" : "False") << endl;
+    leakage_log.cmp('f', LEAK_GE, f1, f2, ret, sizeof(EncFloat));
 
     PG_RETURN_BOOL(ret);
 }
@@ -691,10 +685,8 @@ Datum enc_float4_cmp(PG_FUNCTION_ARGS)
     if (error) print_error("%s %d", __func__, error);
 
     {
-        if (0 == cmp) outfile << "f == ";
-        else if (-1 == cmp) outfile << "f < ";
-        else if (1 == cmp) outfile << "f > ";
-        outfile << b64_float(f1) << " " << b64_float(f2) << " True" << endl;
+        LeakageOp op = 0 == cmp ? LEAK_EQ : (-1 == cmp ? LEAK_LT : LEAK_GT);
+        leakage_log.cmp('f', op, f1, f2, true, sizeof(EncFloat));
     }
 
     PG_RETURN_INT32(cmp);
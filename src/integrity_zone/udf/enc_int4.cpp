@@ -1,4 +1,5 @@
 #include "base64.h"
+#include "leakage_log.h"
 #include <enc_float_ops.hpp>
 #include <enc_int_ops.hpp>
 #include <extension.hpp>
@@ -8,14 +9,7 @@
 using namespace std;
 
 extern bool clientMode;
-extern ofstream outfile;
-
-static string b64_int(EncInt* in)
-{
-    char b64_int4[ENC_INT_B64_LENGTH + 1] = { 0 };
-    toBase64((const unsigned char*)in, sizeof(EncInt), b64_int4);
-    return b64_int4;
-}
+extern LeakageLog leakage_log;
 
 #ifdef __cplusplus
 extern "C" {
@@ -116,7 +110,7 @@ Datum enc_int4_add(PG_FUNCTION_ARGS)
     int error = enc_int_add(left, right, result);
     if (error) print_error("%s %d", __func__, error);
 
-    outfile << "i + " << b64_int(left) << " " << b64_int(right) << " " << b64_int(result) << endl;
+    leakage_log.calc('i', LEAK_PLUS, left, right, result, sizeof(EncInt));
     PG_RETURN_CSTRING(result);
 }
 
@@ -129,7 +123,7 @@ Datum enc_int4_sub(PG_FUNCTION_ARGS)
     int error = enc_int_sub(left, right, result);
     if (error) print_error("%s %d", __func__, error);
 
-    outfile << "i - " << b64_int(left) << " " << b64_int(right) << " " << b64_int(result) << endl;
+    leakage_log.calc('i', LEAK_MINUS, left, right, result, sizeof(EncInt));
     PG_RETURN_CSTRING(result);
 }
 
@@ -142,7 +136,7 @@ Datum enc_int4_mult(PG_FUNCTION_ARGS)
     int error = enc_int_mult(left, right, result);
     if (error) print_error("%s %d", __func__, error);
 
-    outfile << "i * " << b64_int(left) << " " << b64_int(right) << " " << b64_int(result) << endl;
+    leakage_log.calc('i', LEAK_MULT, left, right, result, sizeof(EncInt));
     PG_RETURN_CSTRING(result);
 }
 
@@ -155,7 +149,7 @@ Datum enc_int4_div(PG_FUNCTION_ARGS)
     int error = enc_int_div(left, right, result);
     if (error) print_error("%s %d", __func__, error);
 
-    outfile << "i / " << b64_int(left) << " " << b64_int(right) << " " << b64_int(result) << endl;
+    leakage_log.calc('i', LEAK_DIV, left, right, result, sizeof(EncInt));
     PG_RETURN_CSTRING(result);
 }
 
@@ -168,7 +162,7 @@ Datum enc_int4_pow(PG_FUNCTION_ARGS)
     int error = enc_int_pow(left, right, result);
     if (error) print_error("%s %d", __func__, error);
 
-    outfile << "i ^ " << b64_int(left) << " " << b64_int(right) << " " << b64_int(result) << endl;
+    leakage_log.calc('i', LEAK_EXP, left, right, result, sizeof(EncInt));
     PG_RETURN_CSTRING(result);
 }
 
@@ -181,7 +175,7 @@ Datum enc_int4_mod(PG_FUNCTION_ARGS)
     int error = enc_int_mod(left, right, result);
     if (error) print_error("%s %d", __func__, error);
 
-    outfile << "i % " << b64_int(left) << " " << b64_int(right) << " " << b64_int(result) << endl;
+    leakage_log.calc('i', LEAK_MOD, left, right, result, sizeof(EncInt));
     PG_RETURN_CSTRING(result);
 }
 
@@ -195,10 +189,8 @@ Datum enc_int4_cmp(PG_FUNCTION_ARGS)
     if (error) print_error("%s %d", __func__, error);
 
     {
-        if (0 == res) outfile << "i == ";
-        else if (-1 == res) outfile << "i < ";
-        else if (1 == res) outfile << "i > ";
-        outfile << b64_int(left) << " " << b64_int(right) << " True" << endl;
+        LeakageOp op = 0 == res ? LEAK_EQ : (-1 == res ? LEAK_LT : LEAK_GT);
+        leakage_log.cmp('i', op, left, right, true, sizeof(EncInt));
     }
     PG_RETURN_INT32(res);
 }
@@ -218,7 +210,7 @@ Datum enc_int4_eq(PG_FUNCTION_ARGS)
     else
         cmp = false;
 
-    outfile << "i == " << b64_int(left) << " " << b64_int(right) << " " << (cmp == true ? "True" : "False") << endl;
+    leakage_log.cmp('i', LEAK_EQ, left, right, cmp, sizeof(EncInt));
     PG_RETURN_BOOL(cmp);
 }
 
@@ -237,7 +229,7 @@ Datum enc_int4_ne(PG_FUNCTION_ARGS)
     else
         cmp = true;
 
-    outfile << "i != " << b64_int(left) << " " << b64_int(right) << " " << (cmp == true ? "True" : "False") << endl;
+    leakage_log.cmp('i', LEAK_NE, left, right, cmp, sizeof(EncInt));
     PG_RETURN_BOOL(cmp);
 }
 
@@ -256,7 +248,7 @@ Datum enc_int4_lt(PG_FUNCTION_ARGS)
     else
         cmp = false;
 
-    outfile << "i < " << b64_int(left) << " " << b64_int(right) << " " << (cmp == true ? "True" : "False") << endl;
+    leakage_log.cmp('i', LEAK_LT, left, right, cmp, sizeof(EncInt));
     PG_RETURN_BOOL(cmp);
 }
 
@@ -275,7 +267,7 @@ Datum enc_int4_le(PG_FUNCTION_ARGS)
     else
         cmp = false;
 
-    outfile << "i <= " << b64_int(left) << " " << b64_int(right) << " " << (cmp == true ? "True" : "False") << endl;
+    leakage_log.cmp('i', LEAK_LE, left, right, cmp, sizeof(EncInt));
     PG_RETURN_BOOL(cmp);
 }
 
@@ -294,7 +286,7 @@ Datum enc_int4_gt(PG_FUNCTION_ARGS)
     else
         cmp = false;
 
-    outfile << "i > " << b64_int(left) << " " << b64_int(right) << " " << (cmp == true ? "True" : "False") << endl;
+    leakage_log.cmp('i', LEAK_GT, left, right, cmp, sizeof(EncInt));
     PG_RETURN_BOOL(cmp);
 }
 
@@ -313,7 +305,7 @@ Datum enc_int4_ge(PG_FUNCTION_ARGS)
     else
         cmp = false;
 
-    outfile << "i >= " << b64_int(left) << " " << b64_int(right) << " " << (cmp == true ? "True" : "False") << endl;
+    leakage_log.cmp('i', LEAK_GE, left, right, cmp, sizeof(EncInt));
     PG_RETURN_BOOL(cmp);
 }
 
@@ -326,7 +318,7 @@ Datum enc_int4_sum(PG_FUNCTION_ARGS)
     int error = enc_int_add(left, right, sum);
     if (error) print_error("%s %d", __func__, error);
 
-    outfile << "i SUM " << b64_int(left) << " " << b64_int(right) << " " << b64_int(sum) << endl;
+    leakage_log.calc('i', LEAK_SUM, left, right, sum, sizeof(EncInt));
     PG_RETURN_CSTRING(sum);
 }
 
@@ -341,7 +333,7 @@ Datum enc_int4_sum_bulk(PG_FUNCTION_ARGS)
     int counter = 1;
     int error;
 
-    outfile << "i SUM "; /// logging
+    leakage_log.bulk_begin('i', LEAK_SUM); /// logging
 
     // TODO: two copies happens here, for array of encint.
     ArrayMetaState* my_extra = (ArrayMetaState*)fcinfo->flinfo->fn_extra;
@@ -349,11 +341,11 @@ Datum enc_int4_sum_bulk(PG_FUNCTION_ARGS)
 
     array_iterate(array_iterator, &value, &isnull);
     *sum = *DatumGetEncInt(value);
-    outfile << b64_int(sum) << " "; /// logging
+    leakage_log.bulk_item(sum, sizeof(EncInt)); /// logging
     sum_array[0] = *sum;
     while (array_iterate(array_iterator, &value, &isnull)) {
         sum_array[counter] = *DatumGetEncInt(value);
-        outfile << b64_int(&sum_array[counter]) << " "; /// logging
+        leakage_log.bulk_item(&sum_array[counter], sizeof(EncInt)); /// logging
         counter++;
         if (counter == BULK_SIZE) {
             error = enc_int_sum_bulk(BULK_SIZE, sum_array, sum);
@@ -367,7 +359,7 @@ Datum enc_int4_sum_bulk(PG_FUNCTION_ARGS)
         if (error) print_error("%s %d", __func__, error);
     }
 
-    outfile << b64_int(sum) << endl; /// logging
+    leakage_log.bulk_end(sum, sizeof(EncInt)); /// logging
     PG_RETURN_CSTRING(sum);
 }
 
@@ -385,14 +377,14 @@ Datum enc_int4_avg_bulk(PG_FUNCTION_ARGS)
     EncInt num_array[BULK_SIZE]; // nitems of '1'
     int counter; // sum will be at array[0]
 
-    outfile << "i AVG "; /// logging
+    leakage_log.bulk_begin('i', LEAK_AVG); /// logging
 
     ArrayMetaState* my_extra = (ArrayMetaState*)fcinfo->flinfo->fn_extra;
     ArrayIterator array_iterator = array_create_iterator(v, 0, my_extra);
 
     array_iterate(array_iterator, &value, &isnull);
     sum = *DatumGetEncInt(value);
-    outfile << b64_int(&sum) << " "; /// logging
+    leakage_log.bulk_item(&sum, sizeof(EncInt)); /// logging
     sum_array[0] = sum;
     counter = 1;
 
@@ -404,7 +396,7 @@ Datum enc_int4_avg_bulk(PG_FUNCTION_ARGS)
     }
     while (array_iterate(array_iterator, &value, &isnull)) {
         sum_array[counter] = *DatumGetEncInt(value);
-        outfile << b64_int(&sum_array[counter]) << " "; /// logging
+        leakage_log.bulk_item(&sum_array[counter], sizeof(EncInt)); /// logging
         num_array[counter] = unit;
         counter++;
         if (counter == BULK_SIZE) {
@@ -427,7 +419,7 @@ Datum enc_int4_avg_bulk(PG_FUNCTION_ARGS)
     error = enc_int_div(&sum, &num, res);
     if (error) print_error("%s %d", __func__, error);
 
-    outfile << b64_int(res) << endl; /// logging
+    leakage_log.bulk_end(res, sizeof(EncInt)); /// logging
     PG_RETURN_CSTRING(res);
 }
 
@@ -440,7 +432,7 @@ Datum enc_int4_max(PG_FUNCTION_ARGS)
     int error = enc_int_cmp(left, right, &res);
     if (error) print_error("%s %d", __func__, error);
 
-    outfile << "i MAX " << b64_int(left) << " " << b64_int(right) << " " << b64_int(res == 1 ? left : right) << endl;
+    leakage_log.calc('i', LEAK_MAX, left, right, res == 1 ? left : right, sizeof(EncInt));
     PG_RETURN_POINTER(res == 1 ? left : right);
 }
 
@@ -453,7 +445,7 @@ Datum enc_int4_min(PG_FUNCTION_ARGS)
     int error = enc_int_cmp(left, right, &res);
     if (error) print_error("%s %d", __func__, error);
 
-    outfile << "i MIN " << b64_int(left) << " " << b64_int(right) << " " << b64_int(res == 1 ? right : left) << endl;
+    leakage_log.calc('i', LEAK_MIN, left, right, res == 1 ? right : left, sizeof(EncInt));
     PG_RETURN_POINTER(res == 1 ? right : left);
 }
 
@@ -12,8 +12,12 @@
 #include <time.h>
 #include <unistd.h>
 
+#include <atomic>
 #include <map>
 #include <queue>
+#include <string>
+#include <unordered_map>
+#include <vector>
 using namespace std;
 
 #include <crypto.h>
@@ -70,13 +74,10 @@ static int write_string(FILE* f, const char* value)
     return 1;
 }
 
-int kTest_toFile(KTest* bo, const char* path)
+static int kTest_toStream(KTest* bo, FILE* f)
 {
-    FILE* f = fopen(path, "wb");
     unsigned i;
 
-    if (!f)
-        goto error;
     if (fwrite(KTEST_MAGIC, strlen(KTEST_MAGIC), 1, f) != 1)
         goto error;
     if (!write_uint32(f, KTEST_VERSION))
@@ -106,16 +107,36 @@ int kTest_toFile(KTest* bo, const char* path)
             goto error;
     }
 
-    fclose(f);
-
     return 1;
 error:
-    if (f)
-        fclose(f);
-
     return 0;
 }
 
+int kTest_toFile(KTest* bo, const char* path)
+{
+    FILE* f = fopen(path, "wb");
+    if (!f)
+        return 0;
+    int ok = kTest_toStream(bo, f);
+    fclose(f);
+    return ok;
+}
+
+/* the kTest file as bytes, to hash and write it later */
+static int kTest_toBuffer(KTest* bo, string* out)
+{
+    char* buf = NULL;
+    size_t size = 0;
+    FILE* f = open_memstream(&buf, &size);
+    if (!f)
+        return 0;
+    int ok = kTest_toStream(bo, f);
+    fclose(f);
+    out->assign(buf, size);
+    free(buf);
+    return ok;
+}
+
 /* use following api to generate a ktest file */
 
 #define MAX 64
@@ -169,8 +190,16 @@ int decrypt_bytes(uint8_t* pSrc, size_t src_len, uint8_t* pDst, size_t exp_dst_l
 
 #define STR_SYMBOL_SIZE 500
 
-uint32_t max_str_len = 0;
-int gen_ktest_file(BaseRequest* base_req, const char* name)
+atomic<uint32_t> max_str_len(0);
+static void update_max_str_len(uint32_t len)
+{
+    uint32_t cur = max_str_len.load();
+    while (len > cur && !max_str_len.compare_exchange_weak(cur, len))
+        ;
+}
+
+/* decrypts the request and serializes it as a kTest file into `out` */
+static int gen_ktest(BaseRequest* base_req, string* out)
 {
     // base_req->reqType = - base_req->reqType;
 
@@ -298,7 +327,7 @@ int gen_ktest_file(BaseRequest* base_req, const char* name)
         push_string(&b, "text_substring_str", STR_SYMBOL_SIZE, (const char*)str.data);
         push_int(&b, "text_substring_start", start);
         push_int(&b, "text_substring_length", length);
-        max_str_len = max(max_str_len, str.len);
+        update_max_str_len(str.len);
         break;
     }
     case CMD_STRING_CONCAT: {
@@ -312,8 +341,8 @@ int gen_ktest_file(BaseRequest* base_req, const char* name)
         right.data[right.len] = '\0';
         push_string(&b, "text_concat_left", STR_SYMBOL_SIZE, (const char*)left.data);
         push_string(&b, "text_concat_right", STR_SYMBOL_SIZE, (const char*)right.data);
-        max_str_len = max(max_str_len, left.len);
-        max_str_len = max(max_str_len, right.len);
+        update_max_str_len(left.len);
+        update_max_str_len(right.len);
         break;
     }
     case CMD_STRING_LIKE:
@@ -328,15 +357,15 @@ int gen_ktest_file(BaseRequest* base_req, const char* name)
         right.data[right.len] = '\0';
         push_string(&b, "text_cmp_left", STR_SYMBOL_SIZE, (const char*)left.data);
         push_string(&b, "text_cmp_right", STR_SYMBOL_SIZE, (const char*)right.data);
-        max_str_len = max(max_str_len, left.len);
-        max_str_len = max(max_str_len, right.len);
+        update_max_str_len(left.len);
+        update_max_str_len(right.len);
         break;
     }
     default:
         break;
     }
 
-    if (!kTest_toFile(&b, name))
+    if (!kTest_toBuffer(&b, out))
         assert(0);
 
     for (int i = 0; i < (int)b.numObjects; ++i) {
@@ -347,6 +376,17 @@ int gen_ktest_file(BaseRequest* base_req, const char* name)
 
     return 0;
 }
+
+int gen_ktest_file(BaseRequest* base_req, const char* name)
+{
+    string ktest;
+    gen_ktest(base_req, &ktest);
+    FILE* f = fopen(name, "wb");
+    if (!f || fwrite(ktest.data(), 1, ktest.size(), f) != ktest.size())
+        assert(0);
+    fclose(f);
+    return 0;
+}
 // #define KTEST_FILEPATH "gen.ktest"
 int gen_tmp_constraints(BaseRequest* base_req, const char* filename, int line_id)
 {
@@ -528,86 +568,257 @@ static int retrieve_request_from_file(FILE* f, char* req_buffer)
     return 0;
 }
 
+/*
+ * The main thread retrieves requests in order into a bounded queue, NUM_THREAD
+ * workers decrypt them into kTest bytes, and a writer takes them back in recnum
+ * order from a priority queue, writes ktests/<recnum>-gen.ktest and a line of
+ * ktests/index.log per record:
+ *     recnum hash ktest    -- ktest is the one of the first identical request with -d
+ *     recnum skip          -- float calc, not desensitized
+ */
+#define NUM_THREAD 8
+#define QUEUE_SIZE 256 // requests retrieved ahead of the workers
+#define REORDER_WINDOW 4096 // records decrypted ahead of the writer
+
+struct Job {
+    int recnum;
+    char req_buffer[sizeof(EncIntBulkRequestData)];
+};
+
+struct Done {
+    int recnum;
+    bool skip;
+    uint64_t hash;
+    string ktest;
+    bool operator<(const Done& other) const { return recnum > other.recnum; } // min-heap
+};
+
 pthread_mutex_t mutex;
+pthread_cond_t job_ready, job_free, done_ready, done_free;
+Job* jobs;
+int job_head = 0, job_tail = 0; // recnums pushed and popped
+bool eof = false;
+priority_queue<Done> done_queue;
+int next_recnum = 0; // next record for the writer
+
+bool dedup = false;
+unordered_map<uint64_t, int> seen; // kTest hash -> first recnum
+FILE* index_file;
+atomic<long> ktests(0), duplicates(0), skipped(0);
+
 int recnum = 0;
 FILE* f;
 const char* outfile_suffix = "desen.log";
+
+static uint64_t fnv1a(const string& data)
+{
+    uint64_t hash = 14695981039346656037ULL;
+    for (unsigned char c : data) {
+        hash ^= c;
+        hash *= 1099511628211ULL;
+    }
+    return hash;
+}
+
 void* thread_entry(void* arg)
 {
     // int id = (long long)arg;
-    char req_buffer[sizeof(EncIntBulkRequestData)];
-    BaseRequest* br = (BaseRequest*)req_buffer;
+    Job job;
+    BaseRequest* br = (BaseRequest*)job.req_buffer;
+
+    while (1) {
+        pthread_mutex_lock(&mutex);
+        while (job_tail == job_head && !eof)
+            pthread_cond_wait(&job_ready, &mutex);
+        if (job_tail == job_head) {
+            pthread_mutex_unlock(&mutex);
+            break;
+        }
+        memcpy(&job, &jobs[job_tail % QUEUE_SIZE], sizeof(job));
+        job_tail++;
+        pthread_cond_signal(&job_free);
+        pthread_mutex_unlock(&mutex);
+
+        Done done;
+        done.recnum = job.recnum;
+        done.skip = br->reqType > 100 && br->reqType <= 110; // float just skip
+        done.hash = 0;
+        if (!done.skip) {
+            gen_ktest(br, &done.ktest);
+            done.hash = fnv1a(done.ktest);
+        }
+
+        pthread_mutex_lock(&mutex);
+        while (done.recnum >= next_recnum + REORDER_WINDOW)
+            pthread_cond_wait(&done_free, &mutex);
+        done_queue.push(std::move(done));
+        pthread_cond_signal(&done_ready);
+        pthread_mutex_unlock(&mutex);
+    }
+    return 0;
+}
 
+void* writer_entry(void* arg)
+{
     char ktest_file[30];
-    // sprintf(ktest_file, "%d-gen.ktest", id);
-    int cur_rec_num;
+    struct timespec start, now, last;
+    clock_gettime(CLOCK_MONOTONIC, &start);
+    last = start;
+
     while (1) {
-        // pthread_mutex_lock(&mutex);
-        int resp = retrieve_request_from_file(f, req_buffer);
-        cur_rec_num = recnum++;
-        // pthread_mutex_unlock(&mutex);
+        pthread_mutex_lock(&mutex);
+        while ((done_queue.empty() || done_queue.top().recnum != next_recnum) && !(eof && next_recnum == job_head))
+            pthread_cond_wait(&done_ready, &mutex);
+        if (eof && next_recnum == job_head) {
+            pthread_mutex_unlock(&mutex);
+            break;
+        }
+        Done done = done_queue.top();
+        done_queue.pop();
+        next_recnum++;
+        pthread_cond_broadcast(&done_free);
+        pthread_mutex_unlock(&mutex);
+
+        if (done.skip) {
+            skipped++;
+            fprintf(index_file, "%d skip\n", done.recnum);
+        } else {
+            int first = done.recnum;
+            if (dedup) {
+                auto it = seen.emplace(done.hash, done.recnum).first;
+                first = it->second;
+            }
+            sprintf(ktest_file, "ktests/%d-gen.ktest", first);
+            if (first == done.recnum) {
+                FILE* out = fopen(ktest_file, "wb");
+                if (!out || fwrite(done.ktest.data(), 1, done.ktest.size(), out) != done.ktest.size())
+                    assert(0);
+                fclose(out);
+                ktests++;
+            } else {
+                duplicates++;
+            }
+            fprintf(index_file, "%d %016llx %s\n", done.recnum, (unsigned long long)done.hash, ktest_file);
+        }
+
+        clock_gettime(CLOCK_MONOTONIC, &now);
+        if (now.tv_sec > last.tv_sec) {
+            last = now;
+            double seconds = (now.tv_sec - start.tv_sec) + (now.tv_nsec - start.tv_nsec) / 1e9;
+            fprintf(stderr, "desenitizer: %d records, %ld ktests, %ld duplicates, %ld skipped, %.1f records/s\n",
+                next_recnum, ktests.load(), duplicates.load(), skipped.load(), next_recnum / seconds);
+        }
+    }
+
+    clock_gettime(CLOCK_MONOTONIC, &now);
+    double seconds = (now.tv_sec - start.tv_sec) + (now.tv_nsec - start.tv_nsec) / 1e9;
+    fprintf(stderr, "desenitizer: %d records, %ld ktests, %ld duplicates, %ld skipped, %.1f records/s, done in %.3f s\n",
+        next_recnum, ktests.load(), duplicates.load(), skipped.load(), seconds > 0 ? next_recnum / seconds : 0, seconds);
+    return 0;
+}
 
+/* retrieves every request of the record log in order, the file format only allows one reader */
+static void retrieve_requests()
+{
+    Job* job = (Job*)malloc(sizeof(Job));
+    while (1) {
+        int resp = retrieve_request_from_file(f, job->req_buffer);
         if (resp < 0) {
             if (resp == -2)
-                printf("retrieve request failed %d, max strlen %d\n", resp, max_str_len);
+                printf("retrieve request failed %d\n", resp);
             break;
         }
-        if (br->reqType > 100 && br->reqType <= 110) {
-            continue; // float just skip
-        }
-        // if(br->reqType < 200)
-        //     continue;
-        sprintf(ktest_file, "ktests/%d-gen.ktest", cur_rec_num);
-        gen_ktest_file((BaseRequest*)req_buffer, ktest_file);
-        // gen_tmp_constraints((BaseRequest *)req_buffer, ktest_file);
-
-        /**
-         * priority_queue [recnum, filename]
-         *
-         * producer:
-         * while(1){
-         * lock()
-         * add_to_priority_queue()
-         * unlock()
-         * sig()
-         * wait_for_processing()
-         * }
-         *
-         * consumer:
-         * while(1){
-         *   lock()
-         *   while(priority_queue.front() != cur_pos)
-         *     wait_sig()
-         *   do_following_work
-         * }
-         * map: hash -> string(output)
-         * if(!map.has[hash])
-         *     python gen => insert into map
-         * fprintf(map[hash])
-         *
-         */
+        job->recnum = recnum++;
+
+        pthread_mutex_lock(&mutex);
+        while (job_head - job_tail == QUEUE_SIZE)
+            pthread_cond_wait(&job_free, &mutex);
+        memcpy(&jobs[job_head % QUEUE_SIZE], job, sizeof(Job));
+        job_head++;
+        pthread_cond_signal(&job_ready);
+        pthread_mutex_unlock(&mutex);
     }
-    return 0;
+    free(job);
+
+    pthread_mutex_lock(&mutex);
+    eof = true;
+    pthread_cond_broadcast(&job_ready);
+    pthread_cond_broadcast(&done_ready);
+    pthread_mutex_unlock(&mutex);
+}
+
+static void usage(const char* name)
+{
+    fprintf(stderr, "usage: %s [-j threads] [-d] <record log>\n"
+                    "  -j  workers decrypting requests (default %d)\n"
+                    "  -d  write one ktest per distinct request, ktests/index.log maps the others to it\n",
+        name, NUM_THREAD);
+    exit(1);
 }
 
-#define NUM_THREAD 8
 int main(int argc, char* argv[])
 {
-    assert(argc == 2);
-    f = fopen(argv[1], "r+");
-    thread_entry(0);
-    // pthread_mutex_init(&mutex, NULL);
-    // pthread_t pids[NUM_THREAD];
-    // for(long long i = 0; i < NUM_THREAD; i++){
-    //     if(pthread_create(&pids[i], NULL, thread_entry, (void *)i) != 0){
-    //         printf("pthread create failed\n");
-    //         return -1;
-    //     }
-    // }
-    // for(int i = 0; i < NUM_THREAD; i ++){
-    //     pthread_join(pids[i], NULL);
-    // }
-    // pthread_mutex_destroy(&mutex);
+    int num_thread = NUM_THREAD;
+    int opt;
+    while ((opt = getopt(argc, argv, "j:d")) != -1) {
+        switch (opt) {
+        case 'j':
+            num_thread = atoi(optarg);
+            break;
+        case 'd':
+            dedup = true;
+            break;
+        default:
+            usage(argv[0]);
+        }
+    }
+    if (optind != argc - 1 || num_thread < 1)
+        usage(argv[0]);
+
+    f = fopen(argv[optind], "r+");
+    if (!f) {
+        perror(argv[optind]);
+        return 1;
+    }
+    index_file = fopen("ktests/index.log", "w");
+    if (!index_file) {
+        perror("ktests/index.log");
+        return 1;
+    }
+    jobs = (Job*)malloc(QUEUE_SIZE * sizeof(Job));
+
+    pthread_mutex_init(&mutex, NULL);
+    pthread_cond_init(&job_ready, NULL);
+    pthread_cond_init(&job_free, NULL);
+    pthread_cond_init(&done_ready, NULL);
+    pthread_cond_init(&done_free, NULL);
+    vector<pthread_t> pids(num_thread);
+    for (long long i = 0; i < num_thread; i++) {
+        if (pthread_create(&pids[i], NULL, thread_entry, (void*)i) != 0) {
+            printf("pthread create failed\n");
+            return -1;
+        }
+    }
+    pthread_t writer;
+    if (pthread_create(&writer, NULL, writer_entry, NULL) != 0) {
+        printf("pthread create failed\n");
+        return -1;
+    }
+
+    retrieve_requests();
+    for (int i = 0; i < num_thread; i++) {
+        pthread_join(pids[i], NULL);
+    }
+    pthread_join(writer, NULL);
+    printf("max strlen %d\n", max_str_len.load());
+
+    pthread_mutex_destroy(&mutex);
+    pthread_cond_destroy(&job_ready);
+    pthread_cond_destroy(&job_free);
+    pthread_cond_destroy(&done_ready);
+    pthread_cond_destroy(&done_free);
+    free(jobs);
+    fclose(index_file);
     fclose(f);
     return 0;
 }
@@ -1,19 +1,8 @@
 #include "enc_int_ops.h"
 #include "plain_int_ops.h"
-#include "base64.h"
-#include <string>
-#include <fstream>
-#include <iostream>
-using namespace std;
+#include "leakage_log.h"
 
-extern ofstream outfile;
-
-static string b64_int(EncInt* in)
-{
-    char b64_int4[ENC_INT_B64_LENGTH + 1] = { 0 };
-    toBase64((const unsigned char*)in, sizeof(EncInt), b64_int4);
-    return b64_int4;
-}
+extern LeakageLog leakage_log;
 
 int enc_int32_cmp(EncIntCmpRequestData* req)
 {
@@ -32,10 +21,8 @@ int enc_int32_cmp(EncIntCmpRequestData* req)
     req->cmp = plain_int32_cmp(left, right);
 
     {
-        if (0 == req->cmp) outfile << "== ";
-        else if (-1 == req->cmp) outfile << "< ";
-        else if (1 == req->cmp) outfile << "> ";
-        outfile << b64_int(&req->left) << " " << b64_int(&req->right) << " True" << endl;
+        LeakageOp op = 0 == req->cmp ? LEAK_EQ : (-1 == req->cmp ? LEAK_LT : LEAK_GT);
+        leakage_log.cmp('i', op, &req->left, &req->right, true, sizeof(EncInt));
     }
 
     return resp;
@@ -61,17 +48,18 @@ int enc_int32_calc(EncIntCalcRequestData* req)
     resp = encrypt_bytes((uint8_t*)&res, sizeof(res), (uint8_t*)&req->res, sizeof(req->res));
 
     {
+        LeakageOp op = LEAK_NONE;
         switch (req->common.reqType)
         {
-        case CMD_INT_PLUS:  outfile << "+ "; break;
-        case CMD_INT_MINUS: outfile << "- "; break;
-        case CMD_INT_MULT:  outfile << "* "; break;
-        case CMD_INT_DIV:   outfile << "/ "; break;
-        case CMD_INT_MOD:   outfile << "% "; break;
-        case CMD_INT_EXP:   outfile << "^ "; break;
+        case CMD_INT_PLUS:  op = LEAK_PLUS; break;
+        case CMD_INT_MINUS: op = LEAK_MINUS; break;
+        case CMD_INT_MULT:  op = LEAK_MULT; break;
+        case CMD_INT_DIV:   op = LEAK_DIV; break;
+        case CMD_INT_MOD:   op = LEAK_MOD; break;
+        case CMD_INT_EXP:   op = LEAK_EXP; break;
         default: break;
         }
-        outfile << b64_int(&req->left) << " " << b64_int(&req->right) << " " << b64_int(&req->res) << endl;
+        leakage_log.calc('i', op, &req->left, &req->right, &req->res, sizeof(EncInt));
     }
 
     return resp;
@@ -96,10 +84,10 @@ int enc_int32_bulk(EncIntBulkRequestData* req)
     resp = encrypt_bytes((uint8_t*)&res, sizeof(res), (uint8_t*)&req->res, sizeof(req->res));
 
     {
-        outfile << "SUM ";
+        leakage_log.bulk_begin('i', LEAK_SUM);
         for (int id = 0; id < req->bulk_size; id++)
-            outfile << b64_int(&array[id]) << " ";
-        outfile << b64_int(&req->res) << endl;
+            leakage_log.bulk_item(&array[id], sizeof(EncInt));
+        leakage_log.bulk_end(&req->res, sizeof(EncInt));
     }
 
     return resp;
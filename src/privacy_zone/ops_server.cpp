@@ -15,6 +15,7 @@
 #include "crypto.h"
 #include "debug.h"
 #include "enc_ops.h"
+#include "leakage_log.h"
 #include "ops_server.h"
 #include "request_types.h"
 #include "sync.h"
@@ -31,7 +32,7 @@
 #include <iostream>
 using namespace std;
 
-ofstream outfile("/tmp/privacy_zone.log", ios::app);
+LeakageLog leakage_log("/tmp/privacy_zone.log", false);
 
 struct alignas(128) Decrypt_args {
     bool inited;
@@ -172,7 +173,7 @@ int ivshm_fd;
 void ivshm_exit_handler()
 {
     close(ivshm_fd);
-    outfile.close();
+    leakage_log.close();
 }
 void* get_shmem_ivshm(size_t size)
 {
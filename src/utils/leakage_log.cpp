@@ -0,0 +1,483 @@
+#include "leakage_log.h"
+#include "base64.h"
+
+#include <fcntl.h> // open
+#include <sched.h>
+#include <signal.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/mman.h> // mmap
+#include <time.h>
+#include <algorithm>
+using namespace std;
+
+/* indexed by LeakageOp */
+static const char* op_names[] = {
+    "",
+    "+",
+    "-",
+    "*",
+    "/",
+    "%",
+    "^",
+    "SUM",
+    "AVG",
+    "MAX",
+    "MIN",
+    "==",
+    "!=",
+    "<",
+    "<=",
+    ">",
+    ">=",
+};
+
+static const size_t window_length = LEAKAGE_CHUNK_RECORDS * sizeof(LeakageRecord);
+
+static void copy_cipher(uint8_t* dst, const void* src, size_t size)
+{
+    if (size >= LEAKAGE_CIPHER_LENGTH) {
+        memcpy(dst, src, LEAKAGE_CIPHER_LENGTH);
+    } else {
+        memcpy(dst, src, size);
+        memset(dst + size, 0, LEAKAGE_CIPHER_LENGTH - size);
+    }
+}
+
+static uint64_t get_timestamp()
+{
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return ts.tv_sec * 1000000000UL + ts.tv_nsec;
+}
+
+static unsigned long env_ulong(const char* name, unsigned long fallback)
+{
+    const char* value = getenv(name);
+    return value != nullptr && *value != '\0' ? strtoul(value, nullptr, 10) : fallback;
+}
+
+LeakageLog::LeakageLog(const char* path, bool typed)
+    : path(path)
+    , typed(typed)
+    , binary(false)
+    , pid(0)
+    , write_fd(-1)
+    , text_buf(nullptr)
+    , text_len(0)
+    , window(nullptr)
+    , window_start(0)
+    , cursor(0)
+    , op_start(0)
+    , bulk_type(0)
+    , bulk_op(LEAK_NONE)
+    , bulk_queued(0)
+    , dropping_bulk(false)
+    , ring(nullptr)
+    , ring_size(0)
+    , drop(false)
+    , flush_ms(10)
+    , head(0)
+    , tail(0)
+    , stopping(false)
+    , writer_running(false)
+    , records(0)
+    , bytes(0)
+    , dropped(0)
+    , logging_ns(0)
+    , blocked_ns(0)
+    , writer_ns(0)
+{
+    const char* mode = getenv("HEDB_LEAKAGE_LOG");
+    binary = mode != nullptr && strcmp(mode, "binary") == 0;
+    if (!binary)
+        text_buf = (char*)malloc(LEAKAGE_TEXT_BUFFER);
+
+    unsigned long async = env_ulong("HEDB_LEAKAGE_LOG_ASYNC", 0);
+    if (async > 0) {
+        for (ring_size = 1; ring_size < async; ring_size <<= 1)
+            ;
+        ring = (LeakageRecord*)malloc(ring_size * sizeof(LeakageRecord));
+        if (ring == nullptr)
+            ring_size = 0;
+    }
+    const char* policy = getenv("HEDB_LEAKAGE_LOG_POLICY");
+    drop = policy != nullptr && strcmp(policy, "drop") == 0;
+    flush_ms = env_ulong("HEDB_LEAKAGE_LOG_FLUSH_MS", flush_ms);
+    if (flush_ms == 0)
+        flush_ms = 1;
+}
+
+LeakageLog::~LeakageLog()
+{
+    close();
+    free(ring);
+    free(text_buf);
+}
+
+void LeakageLog::open_sink()
+{
+    pid = getpid();
+    text_len = 0;
+    bulk_line.clear();
+    window = nullptr;
+    window_start = 0;
+    cursor = 0;
+    if (!binary) {
+        write_fd = open(path.c_str(), O_WRONLY | O_APPEND | O_CREAT, 0666);
+        return;
+    }
+    string prefix = path;
+    if (prefix.size() > 4 && prefix.compare(prefix.size() - 4, 4, ".log") == 0)
+        prefix.resize(prefix.size() - 4);
+    string filename = prefix + "-" + to_string(pid) + ".bin";
+    write_fd = open(filename.c_str(), O_RDWR | O_CREAT | O_TRUNC, 0666);
+}
+
+void LeakageLog::release_sink(bool owner)
+{
+    if (window != nullptr)
+        munmap(window, window_length);
+    window = nullptr;
+    if (write_fd == -1)
+        return;
+    /* a forked child must not cut the file of its parent */
+    if (binary && owner)
+        ftruncate(write_fd, cursor * sizeof(LeakageRecord));
+    ::close(write_fd);
+    write_fd = -1;
+}
+
+void LeakageLog::ensure_process()
+{
+    if (pid == getpid())
+        return;
+    if (pid != 0) {
+        /* forked: the sink, the buffers and the ring are copies of the parent's, which writes them itself */
+        release_sink(false);
+        writer_running = false;
+        records = bytes = dropped = logging_ns = blocked_ns = writer_ns = 0;
+    }
+    head.store(0, memory_order_relaxed);
+    tail.store(0, memory_order_relaxed);
+    dropping_bulk = false;
+    open_sink();
+    if (ring != nullptr)
+        start_writer();
+}
+
+void LeakageLog::start_writer()
+{
+    /* signals stay with the query thread (postgres handlers are not thread-safe) */
+    sigset_t all, old;
+    sigfillset(&all);
+    pthread_sigmask(SIG_SETMASK, &all, &old);
+    stopping.store(false, memory_order_relaxed);
+    writer_running = pthread_create(&writer, nullptr, writer_main, this) == 0;
+    pthread_sigmask(SIG_SETMASK, &old, nullptr);
+    if (!writer_running) {
+        /* fall back to logging synchronously */
+        free(ring);
+        ring = nullptr;
+        ring_size = 0;
+    }
+}
+
+void* LeakageLog::writer_main(void* arg)
+{
+    ((LeakageLog*)arg)->drain();
+    return nullptr;
+}
+
+void LeakageLog::drain()
+{
+    uint64_t last_flush = get_timestamp();
+    /* idle backoff, from 50us up to the flush interval */
+    unsigned long sleep_us = 50;
+    while (true) {
+        bool stop = stopping.load(memory_order_acquire);
+        uint64_t t = tail.load(memory_order_relaxed);
+        uint64_t h = head.load(memory_order_acquire);
+        if (t != h) {
+            uint64_t start = get_timestamp();
+            size_t written = 0;
+            for (uint64_t i = t; i != h; i++) {
+                written += write_record(ring[i & (ring_size - 1)]);
+                tail.store(i + 1, memory_order_release);
+            }
+            records += h - t;
+            bytes += written;
+            uint64_t now = get_timestamp();
+            if (now - last_flush >= flush_ms * 1000000UL) {
+                flush_text();
+                last_flush = now;
+            }
+            writer_ns += get_timestamp() - start;
+            sleep_us = 50;
+            continue;
+        }
+
+        if (text_len > 0) {
+            uint64_t start = get_timestamp();
+            flush_text();
+            last_flush = get_timestamp();
+            writer_ns += last_flush - start;
+        }
+        if (stop)
+            break;
+        struct timespec ts = { (time_t)(sleep_us / 1000000), (long)(sleep_us % 1000000) * 1000L };
+        nanosleep(&ts, nullptr);
+        sleep_us = min(sleep_us * 2, flush_ms * 1000);
+    }
+}
+
+LeakageRecord* LeakageLog::next_record()
+{
+    if (write_fd == -1)
+        return nullptr;
+
+    if (window == nullptr || cursor - window_start == LEAKAGE_CHUNK_RECORDS) {
+        if (window != nullptr) {
+            munmap(window, window_length);
+            window_start = cursor;
+        }
+        ftruncate(write_fd, window_start * sizeof(LeakageRecord) + window_length);
+        void* addr = mmap(NULL, window_length, PROT_READ | PROT_WRITE, MAP_SHARED, write_fd, window_start * sizeof(LeakageRecord));
+        if (addr == MAP_FAILED) {
+            window = nullptr;
+            return nullptr;
+        }
+        window = (LeakageRecord*)addr;
+        madvise(window, window_length, MADV_SEQUENTIAL);
+    }
+
+    return &window[cursor++ - window_start];
+}
+
+void LeakageLog::append(const char* str, size_t length)
+{
+    if (text_len + length > LEAKAGE_TEXT_BUFFER)
+        flush_text();
+    if (length > LEAKAGE_TEXT_BUFFER) {
+        write(write_fd, str, length);
+        return;
+    }
+    memcpy(text_buf + text_len, str, length);
+    text_len += length;
+}
+
+void LeakageLog::flush_text()
+{
+    size_t offset = 0;
+    while (offset < text_len) {
+        ssize_t n = write(write_fd, text_buf + offset, text_len - offset);
+        if (n <= 0)
+            break;
+        offset += n;
+    }
+    text_len = 0;
+}
+
+size_t LeakageLog::write_text(const LeakageRecord& record)
+{
+    /* "t op l r res\n" */
+    char line[8 + 3 * (2 * LEAKAGE_CIPHER_LENGTH + 1) + 2];
+    char* p = line;
+    if (record.type != 0) {
+        *p++ = record.type;
+        *p++ = ' ';
+    }
+    p = stpcpy(p, op_names[record.op]);
+    *p++ = ' ';
+
+    if (record.flags & LEAKAGE_DROPPED) {
+        bulk_line.clear();
+        return 0;
+    }
+    if (record.flags & LEAKAGE_ITEM) {
+        if (bulk_line.empty())
+            bulk_line.assign(line, p - line);
+        p = toBase64(record.left, LEAKAGE_CIPHER_LENGTH, line);
+        *p++ = ' ';
+        bulk_line.append(line, p - line);
+        return 0;
+    }
+    if (!bulk_line.empty()) {
+        p = toBase64(record.res, LEAKAGE_CIPHER_LENGTH, line);
+        *p++ = '\n';
+        bulk_line.append(line, p - line);
+        append(bulk_line.data(), bulk_line.size());
+        size_t length = bulk_line.size();
+        bulk_line.clear();
+        return length;
+    }
+
+    p = toBase64(record.left, LEAKAGE_CIPHER_LENGTH, p);
+    *p++ = ' ';
+    p = toBase64(record.right, LEAKAGE_CIPHER_LENGTH, p);
+    if (record.flags & LEAKAGE_BOOL) {
+        p = stpcpy(p, record.cond ? " True\n" : " False\n");
+    } else {
+        *p++ = ' ';
+        p = toBase64(record.res, LEAKAGE_CIPHER_LENGTH, p);
+        *p++ = '\n';
+    }
+    append(line, p - line);
+    return p - line;
+}
+
+size_t LeakageLog::write_record(const LeakageRecord& record)
+{
+    if (!binary)
+        return write_text(record);
+    LeakageRecord* slot = next_record();
+    if (slot == nullptr)
+        return 0;
+    *slot = record;
+    return sizeof(LeakageRecord);
+}
+
+LeakageRecord* LeakageLog::begin(uint8_t type, LeakageOp op, uint8_t flags, bool wait)
+{
+    op_start = get_timestamp();
+    ensure_process();
+    if (write_fd == -1)
+        return nullptr;
+
+    LeakageRecord* record = &scratch;
+    if (ring != nullptr) {
+        uint64_t h = head.load(memory_order_relaxed);
+        if (h - tail.load(memory_order_acquire) == ring_size) {
+            if (drop && !wait) {
+                dropped++;
+                logging_ns += get_timestamp() - op_start;
+                return nullptr;
+            }
+            uint64_t start = get_timestamp();
+            while (h - tail.load(memory_order_acquire) == ring_size)
+                sched_yield();
+            blocked_ns += get_timestamp() - start;
+        }
+        record = &ring[h & (ring_size - 1)];
+    }
+
+    record->timestamp = op_start;
+    record->type = typed ? type : 0;
+    record->op = op;
+    record->flags = flags;
+    record->cond = 0;
+    record->pid = pid;
+    return record;
+}
+
+void LeakageLog::commit(LeakageRecord* record)
+{
+    if (ring != nullptr) {
+        head.store(head.load(memory_order_relaxed) + 1, memory_order_release);
+    } else {
+        size_t written = write_record(*record);
+        if (!binary && !(record->flags & LEAKAGE_ITEM))
+            flush_text();
+        records++;
+        bytes += written;
+    }
+    logging_ns += get_timestamp() - op_start;
+}
+
+void LeakageLog::calc(uint8_t type, LeakageOp op, const void* left, const void* right, const void* res, size_t size)
+{
+    LeakageRecord* record = begin(type, op, 0, false);
+    if (record == nullptr)
+        return;
+    copy_cipher(record->left, left, size);
+    copy_cipher(record->right, right, size);
+    copy_cipher(record->res, res, size);
+    commit(record);
+}
+
+void LeakageLog::cmp(uint8_t type, LeakageOp op, const void* left, const void* right, bool res, size_t size)
+{
+    LeakageRecord* record = begin(type, op, LEAKAGE_BOOL, false);
+    if (record == nullptr)
+        return;
+    copy_cipher(record->left, left, size);
+    copy_cipher(record->right, right, size);
+    record->cond = res;
+    commit(record);
+}
+
+void LeakageLog::bulk_begin(uint8_t type, LeakageOp op)
+{
+    bulk_type = type;
+    bulk_op = op;
+    bulk_queued = 0;
+    dropping_bulk = false;
+}
+
+void LeakageLog::bulk_item(const void* item, size_t size)
+{
+    if (dropping_bulk) {
+        dropped++;
+        return;
+    }
+    LeakageRecord* record = begin(bulk_type, bulk_op, LEAKAGE_ITEM, false);
+    if (record == nullptr) {
+        dropping_bulk = true;
+        return;
+    }
+    copy_cipher(record->left, item, size);
+    commit(record);
+    bulk_queued++;
+}
+
+void LeakageLog::bulk_end(const void* res, size_t size)
+{
+    if (dropping_bulk && bulk_queued == 0) {
+        dropped++;
+        return;
+    }
+    /* the end of a partly dropped bulk op still goes through, so the items already queued are discarded */
+    LeakageRecord* record = begin(bulk_type, bulk_op, dropping_bulk ? LEAKAGE_DROPPED : 0, dropping_bulk);
+    if (record == nullptr)
+        return;
+    copy_cipher(record->res, res, size);
+    commit(record);
+}
+
+LeakageStats LeakageLog::stats() const
+{
+    LeakageStats s;
+    s.records = records;
+    s.bytes = bytes;
+    s.dropped = dropped;
+    s.logging_ns = logging_ns;
+    s.blocked_ns = blocked_ns;
+    s.writer_ns = writer_ns;
+    return s;
+}
+
+void LeakageLog::close()
+{
+    if (pid != getpid()) {
+        /* inherited from the parent and never used here */
+        release_sink(false);
+        return;
+    }
+    if (writer_running) {
+        stopping.store(true, memory_order_release);
+        pthread_join(writer, nullptr);
+        writer_running = false;
+    }
+    if (write_fd == -1)
+        return;
+    if (!binary)
+        flush_text();
+    release_sink(true);
+
+    if (ring != nullptr) {
+        LeakageStats s = stats();
+        fprintf(stderr, "[%d] leakage log: records: %lu, bytes: %lu, dropped: %lu, logging: %lu ns, blocked: %lu ns, writer: %lu ns\n",
+            getpid(), s.records, s.bytes, s.dropped, s.logging_ns, s.blocked_ns, s.writer_ns);
+    }
+}
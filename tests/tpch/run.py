@@ -5,18 +5,106 @@
 # python3 -m pip install psycopg2 tqdm
 
 import psycopg2
+import psycopg2.pool
 import argparse
+import csv
+import functools
+import hashlib
+import json
+import math
 import os
 import re
+import shutil
+import subprocess
+import tempfile
 import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
 from util_py3.ssh_util import *
 from util_py3.prop_util import *
+from verify import VerifyResults
 
 DEFAULT_TPCH_CONFIG="tpch-config.json"
 
 tables = ["nation", "part", "region", "partsupp", "customer", "supplier", "lineitem", "orders"]
 
+# dbgen -T option -> tables it generates in one pass
+DBGEN_TABLES = {
+    "l": ["nation", "region"],
+    "p": ["part", "partsupp"],
+    "s": ["supplier"],
+    "c": ["customer"],
+    "o": ["orders", "lineitem"],
+}
+# options whose tables are split into chunks (dbgen -C/-S)
+CHUNKED_TABLES = ["o"]
+
+def CopyFromPipe(connect, table, pipe, secure):
+    """COPY a pipe of dbgen into `table` on a connection of its own, returns the rows loaded"""
+    conn = connect()
+    try:
+        cur = conn.cursor()
+        if secure:
+            cur.execute('SELECT enable_client_mode();')
+        with open(pipe, "rb") as f:
+            cur.copy_expert(f"COPY {table} FROM stdin WITH DELIMITER AS '|';", f, size=1 << 20)
+        rows = cur.rowcount
+        conn.commit()
+        return rows
+    finally:
+        conn.close()
+
+def RunDbgen(option, dataSize, pipes, chunks=1, step=0):
+    cmd = ["./dbgen", "-f", "-q", "-s", str(dataSize), "-T", option]
+    if step:
+        cmd += ["-C", str(chunks), "-S", str(step)]
+    pipeDir = os.path.dirname(pipes[0])
+    try:
+        subprocess.run(cmd, cwd="dbgen", env=dict(os.environ, DSS_PATH=pipeDir), stdout=subprocess.DEVNULL, check=True)
+    finally:
+        # a COPY still waiting for dbgen to open its pipe reads no rows instead of waiting forever
+        for pipe in pipes:
+            try:
+                os.close(os.open(pipe, os.O_WRONLY | os.O_NONBLOCK))
+            except OSError:
+                pass
+
+def LoadTables(connect, dataSize, secure, chunks=1):
+    """
+    Streams dbgen into COPY through named pipes, without .tbl files: every
+    table loads on its own connection at the same time, orders and lineitem
+    in `chunks` parts on a connection per part. Returns the rows per table.
+    """
+    pipeDir = tempfile.mkdtemp(prefix="tpch-")
+    jobs = [] # (dbgen option, step, pipes of its tables)
+    for option, names in DBGEN_TABLES.items():
+        steps = range(1, chunks + 1) if option in CHUNKED_TABLES and chunks > 1 else [0]
+        for step in steps:
+            pipes = []
+            for table in names:
+                # the names dbgen writes to in DSS_PATH
+                pipe = os.path.join(pipeDir, f"{table}.tbl" + (f".{step}" if step else ""))
+                os.mkfifo(pipe)
+                pipes.append((table, pipe))
+            jobs.append((option, step, pipes))
+
+    rows = Counter()
+    try:
+        copies = sum(len(pipes) for _, _, pipes in jobs)
+        with ThreadPoolExecutor(copies + len(jobs)) as pool:
+            loads = [(table, pool.submit(CopyFromPipe, connect, table, pipe, secure))
+                     for _, _, pipes in jobs for table, pipe in pipes]
+            gens = [pool.submit(RunDbgen, option, dataSize, [pipe for _, pipe in pipes], chunks, step)
+                    for option, step, pipes in jobs]
+            for table, load in loads:
+                rows[table] += load.result()
+            for gen in gens:
+                gen.result()
+    finally:
+        shutil.rmtree(pipeDir)
+    return rows
+
 def PrepBenchmark(propFile = DEFAULT_TPCH_CONFIG):
     properties = loadPropertyFile(propFile)
     
@@ -27,9 +115,10 @@ def PrepBenchmark(propFile = DEFAULT_TPCH_CONFIG):
     dataSize = properties['data_size']
     secureQuery = properties['secure']
     
+    loadChunks = int(properties.get('load_chunks', 1))
+    
     # prepare data
-    executeCommand("cd dbgen && make && ./dbgen -v -f -s %s && mv *.tbl .. && cd .." % dataSize)
-    executeCommand("chmod a+rw *.tbl")
+    executeCommand("cd dbgen && make")
     
     # load data
     if secureQuery == "y": 
@@ -41,17 +130,56 @@ def PrepBenchmark(propFile = DEFAULT_TPCH_CONFIG):
         
     cmd = f"PGPASSWORD={pgPW} psql -h {pgIp} -p {pgPort} -U {pgUser} -f {schema}"
     executeCommand(cmd)
+
+    startTime = time.time()
+    connect = functools.partial(psycopg2.connect, database = pgDB, user = pgUser, password = pgPW, host = pgIp, port = pgPort)
+    rows = LoadTables(connect, dataSize, secureQuery == "y", loadChunks)
     for table in tables:
-        if secureQuery == "y":
-            cmd = f"cat {table}.tbl | PGPASSWORD={pgPW} psql -h {pgIp} -p {pgPort} -U {pgUser} -d {pgDB} -c \"SELECT enable_client_mode(); COPY {table} FROM stdin WITH DELIMITER AS '|';\""
-        else:
-            cmd = f"cat {table}.tbl | PGPASSWORD={pgPW} psql -h {pgIp} -p {pgPort} -U {pgUser} -d {pgDB} -c \"COPY {table} FROM stdin WITH DELIMITER AS '|';\""
-        executeCommand(cmd)
-        
-    executeCommand("find . -name \"*.tbl\" | xargs rm")
+        print(f"table {table}: {rows[table]} rows")
+    print(f"load: {int(time.time() - startTime)}s")
     
 
+# enc_*_encrypt(...) literals of the secure queries
+ENCRYPT_PATTERN = r'enc_[^)]*_encrypt\([^)]*\)'
+ENCRYPT_SUFFIX_PATTERN = r'_encrypt\(.*?\)'
+
+def KeyFingerprint(cur, cacheDir):
+    """
+    sha256 of a canary cipher of the current key, kept in cacheDir/key. When the
+    canary no longer decrypts, the key changed: the cache is emptied and a new
+    canary is made.
+    """
+    canaryFile = os.path.join(cacheDir, "key")
+    canary = open(canaryFile, "r").read().strip() if os.path.exists(canaryFile) else None
+    if canary:
+        try:
+            cur.execute('SELECT enc_int4_decrypt(%s::enc_int4);', (canary,))
+            if cur.fetchone()[0] != 0:
+                canary = None
+        except psycopg2.Error:
+            canary = None
+    if not canary:
+        shutil.rmtree(cacheDir)
+        os.makedirs(cacheDir)
+        cur.execute('SELECT enc_int4_encrypt(0);')
+        canary = cur.fetchone()[0]
+        with open(canaryFile, "w") as f:
+            f.write(canary)
+    return hashlib.sha256(canary.encode()).hexdigest()
+
+def LiteralDigest(fingerprint, literal):
+    """cache key of an enc_*_encrypt(...) literal, by key, data type and value"""
+    sqlType = re.sub(ENCRYPT_SUFFIX_PATTERN, '', literal)
+    return hashlib.sha256(f"{fingerprint}\0{sqlType}\0{literal}".encode()).hexdigest()
+
 def PrepProcess(propFile = DEFAULT_TPCH_CONFIG):
+    """
+    Writes the cipher queries, whose enc_*_encrypt(...) literals become base64
+    ciphers. Transformed queries are cached in cipher_query_dir/.cache by the
+    sha256 of the key fingerprint and the source SQL, and ciphers of literals by
+    key, data type and value: only new queries are transformed, and only their
+    new literals are encrypted, in a single SELECT.
+    """
     properties = loadPropertyFile(propFile)
 
     pgIp = properties['pg_ip']
@@ -62,41 +190,77 @@ def PrepProcess(propFile = DEFAULT_TPCH_CONFIG):
     cipherQueryDir = properties['cipher_query_dir']
     pgDB = "secure_test"
 
-    folder = os.path.exists(cipherQueryDir)
-    if not folder:
-        os.makedirs(cipherQueryDir)
+    cacheDir = os.path.join(cipherQueryDir, ".cache")
+    os.makedirs(cacheDir, exist_ok=True)
 
     queryRange = range(1, 23)
-    
-    for i in queryRange:
-        conn = psycopg2.connect(database = pgDB, user = pgUser, password = pgPW, host = pgIp, port = pgPort)
-        cur = conn.cursor()
 
-        queryFile = secureQueryDir + f"/Q{i}.sql"
-        current_query = open(queryFile, "r").read()
-
-        ### TODO: the following code is a rush, and needs repairment
-        # parse and transform
-        suffix_pattern = r'_encrypt\(.*?\)'
-        keyword_pattern = r'enc_[^)]*_encrypt\([^)]*\)'
-        matches = re.findall(keyword_pattern, current_query)
-        for match in matches:
-            cur.execute('SELECT %s;' % (match)) # fetch each cipher
-            prefix = re.sub(suffix_pattern, '', match)
-            replacement_value = '\'%s\'::%s' % (cur.fetchall()[0][0], prefix)
-            # print('%s => %s' % (match, replacement_value))
+    conn = psycopg2.connect(database = pgDB, user = pgUser, password = pgPW, host = pgIp, port = pgPort)
+    conn.autocommit = True
+    cur = conn.cursor()
+
+    fingerprint = KeyFingerprint(cur, cacheDir)
+    sources = {i: open(secureQueryDir + f"/Q{i}.sql", "r").read() for i in queryRange}
+    digests = {i: hashlib.sha256(f"{fingerprint}\0{sources[i]}".encode()).hexdigest() for i in queryRange}
+    todo = [i for i in queryRange if not os.path.exists(os.path.join(cacheDir, digests[i] + ".sql"))]
+
+    literalsFile = os.path.join(cacheDir, "literals.json")
+    literals = json.load(open(literalsFile, "r")) if os.path.exists(literalsFile) else {}
+    missing = {}
+    for i in todo:
+        for match in re.findall(ENCRYPT_PATTERN, sources[i]):
+            digest = LiteralDigest(fingerprint, match)
+            if digest not in literals:
+                missing[digest] = match
+    if missing:
+        # every cipher in one round trip
+        cur.execute('SELECT %s;' % ', '.join(missing.values()))
+        literals.update(zip(missing.keys(), cur.fetchone()))
+        with open(literalsFile, "w") as f:
+            json.dump(literals, f, indent=1)
+
+    cur.close()
+    conn.close()
+
+    for i in todo:
+        current_query = sources[i]
+        for match in set(re.findall(ENCRYPT_PATTERN, current_query)):
+            prefix = re.sub(ENCRYPT_SUFFIX_PATTERN, '', match)
+            replacement_value = '\'%s\'::%s' % (literals[LiteralDigest(fingerprint, match)], prefix)
             current_query = current_query.replace(match, replacement_value)
+        with open(os.path.join(cacheDir, digests[i] + ".sql"), "w") as f:
+            f.write(current_query)
 
-        # generate a =query whose constants become base64 cipher
-        outputQueryFile = open(cipherQueryDir + f"/Q{i}.sql", "w+");
-        outputQueryFile.write(current_query)
-        outputQueryFile.close()
+    # generate a =query whose constants become base64 cipher
+    for i in queryRange:
+        shutil.copyfile(os.path.join(cacheDir, digests[i] + ".sql"), cipherQueryDir + f"/Q{i}.sql")
 
-        # print(f"query Q{i}: done")
+    print(f"transform: {len(todo)} queries, {len(missing)} literals encrypted")
 
-        conn.commit()
-        cur.close()
-        conn.close()
+def StreamQuery(conn, query, itersize = 10000, writer = None):
+    """
+    Runs a query on a server-side cursor and hands its rows to `writer` (a
+    csv.writer) `itersize` rows at a time, so the client never holds the whole
+    result. Returns (rows, seconds until the first rows arrived, seconds
+    fetching and writing the others).
+    """
+    startTime = time.perf_counter()
+    cur = conn.cursor(name = "tpch_result")
+    cur.execute(query)
+    # the server runs the query on the first FETCH
+    batch = cur.fetchmany(itersize)
+    execTime = time.perf_counter() - startTime
+    if writer is not None:
+        writer.writerow([column.name for column in cur.description])
+    rows = 0
+    while batch:
+        rows += len(batch)
+        if writer is not None:
+            writer.writerows(batch)
+        batch = cur.fetchmany(itersize)
+    cur.close()
+    conn.commit()
+    return rows, execTime, time.perf_counter() - startTime - execTime
 
 def RunTest(propFile = DEFAULT_TPCH_CONFIG, query = 0, recordReplay='none', mode='seq'):
     properties = loadPropertyFile(propFile)
@@ -111,6 +275,7 @@ def RunTest(propFile = DEFAULT_TPCH_CONFIG, query = 0, recordReplay='none', mode
     cipherQueryDir = properties['cipher_query_dir']
     insecureQueryDir = properties['insecure_query_dir']
     outputDir = properties['output_dir']
+    itersize = int(properties.get('itersize', 10000))
     
     record = False
     replay = False
@@ -147,7 +312,7 @@ def RunTest(propFile = DEFAULT_TPCH_CONFIG, query = 0, recordReplay='none', mode
 
         queryStr = f"Q{i}"
         queryFile = queryDirectory + f"/Q{i}.sql" 
-        outputFile = open(outputDir + f"/Q{i}.out", "w+");
+        outputFile = open(outputDir + f"/Q{i}.csv", "w+", newline = "")
 
         if record:
             cur.execute('SELECT enable_record_mode(%s, %s);', (queryStr, pgLogDir))
@@ -155,23 +320,222 @@ def RunTest(propFile = DEFAULT_TPCH_CONFIG, query = 0, recordReplay='none', mode
         if replay:
             cur.execute('SELECT enable_replay_mode(%s, %s, %s);', (queryStr, pgLogDir, mode))
 
-        cur.execute(open(queryFile, "r").read())
-        result = cur.fetchall()
-
-        outputFile.write(str(cur.description) + '\n')
-        for row in result:
-            outputFile.write(str(row) + '\n')
+        rows, execTime, fetchTime = StreamQuery(conn, open(queryFile, "r").read(), itersize, csv.writer(outputFile))
 
         outputFile.close()
-        
-        conn.commit()
 
         endTime = time.time()
-        print(f"query Q{i}: {int((endTime - startTime) * 1000)}ms")
+        print(f"query Q{i}: {int((endTime - startTime) * 1000)}ms (exec {int(execTime * 1000)}ms, fetch {int(fetchTime * 1000)}ms, {rows} rows)")
 
         cur.close()
         conn.close()
 
+def LoadPermutations(path = "dbgen/permute.h"):
+    """query orders of the TPC-H streams, row n is the order of stream n"""
+    text = open(path, "r").read()
+    return [[int(q) for q in row.split(",")] for row in re.findall(r"\{([\d,\s]+)\}", text)]
+
+def OrderKeys(path):
+    """order keys of an update file of dbgen, the first field of every line"""
+    with open(path, "r") as f:
+        return [int(line.split("|")[0]) for line in f if line.strip()]
+
+def RefreshInsert(conn, updateDir, n, secure):
+    """RF1: inserts the new orders and lineitems of update set n"""
+    cur = conn.cursor()
+    if secure:
+        cur.execute('SELECT enable_client_mode();')
+    for table in ["orders", "lineitem"]:
+        with open(os.path.join(updateDir, f"{table}.tbl.u{n}"), "rb") as f:
+            cur.copy_expert(f"COPY {table} FROM stdin WITH DELIMITER AS '|';", f)
+    conn.commit()
+    cur.close()
+
+def RefreshDelete(conn, updateDir, n):
+    """RF2: deletes the old orders of update set n with their lineitems"""
+    keys = OrderKeys(os.path.join(updateDir, f"delete.{n}"))
+    cur = conn.cursor()
+    cur.execute('DELETE FROM lineitem WHERE l_orderkey = ANY(%s);', (keys,))
+    cur.execute('DELETE FROM orders WHERE o_orderkey = ANY(%s);', (keys,))
+    conn.commit()
+    cur.close()
+
+def SaveRefresh(conn, updateDir, sets):
+    """copies the rows RF2 of the update sets will delete, for UndoRefresh"""
+    cur = conn.cursor()
+    for n in sets:
+        keys = OrderKeys(os.path.join(updateDir, f"delete.{n}"))
+        for table, key in [("orders", "o_orderkey"), ("lineitem", "l_orderkey")]:
+            # ciphers are copied as base64, which reads back as the same ciphers outside client mode
+            select = cur.mogrify(f'SELECT * FROM {table} WHERE {key} = ANY(%s)', (keys,)).decode()
+            with open(os.path.join(updateDir, f"deleted.{table}.{n}"), "wb") as f:
+                cur.copy_expert(f"COPY ({select}) TO stdout WITH DELIMITER AS '|';", f)
+    conn.rollback()
+    cur.close()
+
+def UndoRefresh(conn, updateDir, sets):
+    """
+    Deletes the orders RF1 inserted and puts back the ones RF2 deleted, so the
+    tables are as loaded again: dbgen -U generates the same update sets on
+    every run, and RF1 would break the unique index o_ok on the next one.
+    """
+    cur = conn.cursor()
+    for n in sets:
+        # the saved rows replace whatever RF2 left, also when it did not run
+        keys = OrderKeys(os.path.join(updateDir, f"orders.tbl.u{n}")) + OrderKeys(os.path.join(updateDir, f"delete.{n}"))
+        cur.execute('DELETE FROM lineitem WHERE l_orderkey = ANY(%s);', (keys,))
+        cur.execute('DELETE FROM orders WHERE o_orderkey = ANY(%s);', (keys,))
+        for table in ["orders", "lineitem"]:
+            path = os.path.join(updateDir, f"deleted.{table}.{n}")
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    cur.copy_expert(f"COPY {table} FROM stdin WITH DELIMITER AS '|';", f)
+    conn.commit()
+    cur.close()
+
+def RunStream(pool, queries, order, itersize = 10000):
+    """runs the queries of `order` on a connection of the pool, returns [(query, seconds)]"""
+    conn = pool.getconn()
+    times = []
+    try:
+        for i in order:
+            _, execTime, fetchTime = StreamQuery(conn, queries[i], itersize)
+            times.append((f"Q{i}", execTime + fetchTime))
+    finally:
+        pool.putconn(conn)
+    return times
+
+def RunRefresh(pool, updateDir, sets, secure, steps = ("RF1", "RF2")):
+    """runs the refresh functions of the update sets one after another, returns [(function, seconds)]"""
+    conn = pool.getconn()
+    times = []
+    try:
+        for n in sets:
+            for step in steps:
+                startTime = time.perf_counter()
+                if step == "RF1":
+                    RefreshInsert(conn, updateDir, n, secure)
+                else:
+                    RefreshDelete(conn, updateDir, n)
+                times.append((step, time.perf_counter() - startTime))
+    finally:
+        # client mode must not leak to the query streams
+        pool.putconn(conn, close=True)
+    return times
+
+def GeometricMean(seconds):
+    # like the TPC-H power metric, timings under 0.1% of the longest one count as that
+    floor = max(seconds) / 1000
+    return math.exp(sum(math.log(max(t, floor, 1e-6)) for t in seconds) / len(seconds))
+
+def ThroughputTest(propFile = DEFAULT_TPCH_CONFIG, streams = 2, refresh = True):
+    """
+    TPC-H style power and throughput tests: the power test runs the 22 queries
+    in the order of stream 0 between RF1 and RF2, then the throughput test runs
+    `streams` query streams at the same time, each on a connection of its own
+    and in the order of its stream, while one refresh stream runs a pair of
+    refresh functions per query stream. Reports Power@Size, Throughput@Size and
+    QphH@Size, and writes every timing to output_dir/throughput.csv. The
+    refresh functions are undone at the end, so the test can be run again on
+    the same tables.
+    """
+    properties = loadPropertyFile(propFile)
+
+    pgIp = properties['pg_ip']
+    pgPort = properties['pg_port']
+    pgUser = properties['pg_user']
+    pgPW = properties['pg_password']
+    dataSize = properties['data_size']
+    secureQuery = properties['secure']
+    cipherQueryDir = properties['cipher_query_dir']
+    insecureQueryDir = properties['insecure_query_dir']
+    outputDir = properties['output_dir']
+    itersize = int(properties.get('itersize', 10000))
+    scale = float(dataSize)
+
+    if secureQuery == 'y':
+        pgDB = 'secure_test'
+        queryDirectory = cipherQueryDir
+        PrepProcess(propFile)
+    else:
+        pgDB = 'insecure_test'
+        queryDirectory = insecureQueryDir
+
+    if not os.path.exists(outputDir):
+        os.makedirs(outputDir)
+
+    permutations = LoadPermutations()
+    if streams >= len(permutations):
+        raise ValueError(f"dbgen has query orders for {len(permutations) - 1} streams")
+    queries = {i: open(queryDirectory + f"/Q{i}.sql", "r").read() for i in range(1, 23)}
+
+    # update sets 1 for the power test, 2..streams+1 for the throughput test
+    updateDir = tempfile.mkdtemp(prefix="tpch-")
+    if refresh:
+        executeCommand(f"cd dbgen && make && DSS_PATH={updateDir} ./dbgen -f -q -s {dataSize} -U {streams + 1}")
+
+    pool = psycopg2.pool.ThreadedConnectionPool(1, streams + 1, database = pgDB, user = pgUser, password = pgPW, host = pgIp, port = pgPort)
+    if refresh:
+        conn = pool.getconn()
+        cur = conn.cursor()
+        cur.execute('SELECT 1 FROM orders WHERE o_orderkey = %s LIMIT 1;', (OrderKeys(os.path.join(updateDir, "orders.tbl.u1"))[0],))
+        leftover = cur.fetchone() is not None
+        cur.close()
+        if not leftover:
+            SaveRefresh(conn, updateDir, range(1, streams + 2))
+        pool.putconn(conn)
+        if leftover:
+            pool.closeall()
+            shutil.rmtree(updateDir)
+            raise RuntimeError("the orders of update set 1 are still loaded by an interrupted run, reload the tables (run without -sg)")
+    rows = []
+    try:
+        # power test
+        power = []
+        if refresh:
+            power += RunRefresh(pool, updateDir, [1], secureQuery == 'y', ("RF1",))
+        power += RunStream(pool, queries, permutations[0], itersize)
+        if refresh:
+            power += RunRefresh(pool, updateDir, [1], secureQuery == 'y', ("RF2",))
+        rows += [("power", 0, step, seconds) for step, seconds in power]
+
+        # throughput test
+        startTime = time.perf_counter()
+        with ThreadPoolExecutor(streams + 1) as executor:
+            runs = [executor.submit(RunStream, pool, queries, permutations[s], itersize) for s in range(1, streams + 1)]
+            if refresh:
+                runs.append(executor.submit(RunRefresh, pool, updateDir, range(2, streams + 2), secureQuery == 'y'))
+            results = [run.result() for run in runs]
+        elapsed = time.perf_counter() - startTime
+        for s, result in enumerate(results):
+            # the refresh stream is stream 0 of the throughput test
+            stream = s + 1 if s < streams else 0
+            rows += [("throughput", stream, step, seconds) for step, seconds in result]
+    finally:
+        if refresh:
+            conn = pool.getconn()
+            UndoRefresh(conn, updateDir, range(1, streams + 2))
+            pool.putconn(conn)
+        pool.closeall()
+        shutil.rmtree(updateDir)
+
+    with open(outputDir + "/throughput.csv", "w", newline = "") as f:
+        writer = csv.writer(f)
+        writer.writerow(["test", "stream", "step", "ms"])
+        for test, stream, step, seconds in rows:
+            writer.writerow([test, stream, step, int(seconds * 1000)])
+
+    for i in range(1, 23):
+        alone = [seconds for test, _, step, seconds in rows if test == "power" and step == f"Q{i}"]
+        loaded = [seconds for test, _, step, seconds in rows if test == "throughput" and step == f"Q{i}"]
+        print(f"query Q{i}: {int(alone[0] * 1000)}ms alone, {int(sum(loaded) / len(loaded) * 1000)}ms in {streams} streams")
+    powerSize = 3600 * scale / GeometricMean([seconds for _, seconds in power])
+    throughputSize = streams * 22 * 3600 / elapsed * scale
+    print(f"throughput test: {elapsed:.2f}s for {streams} streams")
+    print(f"Power@{dataSize}: {powerSize:.2f}")
+    print(f"Throughput@{dataSize}: {throughputSize:.2f}")
+    print(f"QphH@{dataSize}: {math.sqrt(powerSize * throughputSize):.2f}")
+
 def main():
     # parse arguments 
     parser = argparse.ArgumentParser(description='Run test.')
@@ -183,6 +547,9 @@ def main():
     parser.add_argument('-Q', '--query', type=int, default=0, help='run the given query')
     parser.add_argument('-m', '--mode', type=str, default='seq', help='\'seq\' mode for essential replay, \'perf\' mode for performance replay')
     parser.add_argument('-t', '--transform', action='store_true', help='construct cipher queries')
+    parser.add_argument('-V', '--verify', action='store_true', help='check the results against dbgen/answers (scale factor 1)')
+    parser.add_argument('-S', '--streams', type=int, default=0, help='run the power and throughput tests with this many concurrent query streams')
+    parser.add_argument('-nr', '--no-refresh', action='store_true', help='run the power and throughput tests without refresh functions')
     args = parser.parse_args()
 
     if args.transform:
@@ -192,8 +559,12 @@ def main():
     if not args.skip_generate:
         PrepBenchmark()
     
-    if not args.load:
+    if not args.load and args.streams:
+        ThroughputTest(streams=args.streams, refresh=not args.no_refresh)
+    elif not args.load:
         RunTest(query=args.query, recordReplay=args.record_replay, mode=args.mode)
+        if args.verify:
+            VerifyResults(query=args.query)
 
 if __name__ == '__main__':
     main()
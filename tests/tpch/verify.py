@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# python3 -m pip install psycopg2
+#
+# Checks the Q*.csv results of run.py against the reference answers of dbgen
+# (dbgen/answers/q*.out, for scale factor 1), or against the Q*.csv of another
+# run, e.g. an insecure one. Columns are compared like dbgen/check_answers:
+# exactly, or within the tolerance of their kind in colprecision.txt.
+# $ python3 verify.py [-Q 3] [-e dbgen/answers] [-a output]
+
+import argparse
+import csv
+import hashlib
+import os
+import re
+import struct
+import sys
+from itertools import islice, zip_longest
+
+import psycopg2
+
+from util_py3.prop_util import *
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../tools"))
+from oracle import CipherOracle
+
+DEFAULT_TPCH_CONFIG="tpch-config.json"
+COLUMN_PRECISION_FILE="dbgen/check_answers/colprecision.txt"
+
+# encrypted type -> type of the oracle
+ORACLE_TYPES = {
+    "enc_int4": "int",
+    "enc_float4": "float",
+    "enc_text": "text",
+    "enc_timestamp": "timestamp",
+}
+# column kinds of colprecision.txt that must match exactly, the others have a tolerance
+EXACT_KINDS = ("str", "int", "cnt", "num")
+# queries whose ORDER BY only has exact columns, so their rows are compared one
+# by one in order; the others are compared as multisets
+ORDERED_QUERIES = {1, 2, 4, 6, 7, 8, 9, 12, 13, 14, 15, 16, 17, 19, 20, 21, 22}
+MAX_REPORTED = 10
+DIGEST_MODULUS = 1 << 256
+
+def LoadColumnKinds(path = COLUMN_PRECISION_FILE):
+    """column kinds of every query, row i - 1 is Q{i}"""
+    with open(path, "r") as f:
+        return [line.split() for line in f if line.strip()]
+
+def ReadAnswer(path):
+    """rows of a dbgen answer: a header line, then fields separated by |"""
+    with open(path, "r") as f:
+        next(f, None)
+        for line in f:
+            if line.strip():
+                yield [field.strip() for field in line.rstrip("\n").split("|")]
+
+def ReadResult(path):
+    """rows of a Q*.csv of run.py, without its header"""
+    with open(path, "r", newline = "") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        yield from reader
+
+def ReadRows(path):
+    return ReadAnswer(path) if path.endswith(".out") else ReadResult(path)
+
+def ColumnTypes(cur, query):
+    """SQL type names of the columns of a query, without running it"""
+    cur.execute('SELECT * FROM (%s) AS q LIMIT 0;' % query.strip().rstrip(";"))
+    oids = [column.type_code for column in cur.description]
+    cur.execute('SELECT oid, typname FROM pg_type WHERE oid = ANY(%s);', (oids,))
+    names = dict(cur.fetchall())
+    return [names[oid] for oid in oids]
+
+def DecryptRows(rows, types, oracle, batchSize = 1024):
+    """rows with their encrypted columns decrypted, one oracle batch per type every batchSize rows"""
+    encrypted = [(col, ORACLE_TYPES[t]) for col, t in enumerate(types or []) if t in ORACLE_TYPES]
+    if not encrypted:
+        yield from rows
+        return
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batchSize))
+        if not batch:
+            return
+        plains = {}
+        for oracleType in set(t for _, t in encrypted):
+            ciphers = [row[col] for row in batch for col, t in encrypted if t == oracleType and row[col]]
+            plains[oracleType] = oracle.decrypt_many(ciphers, oracleType)
+        for row in batch:
+            for col, t in encrypted:
+                if row[col]:
+                    row[col] = str(plains[t][row[col]])
+            yield row
+
+def Normalize(kind, value, float32 = False):
+    """the value of a cell as it is compared, rounded to a float4 first for float32 columns"""
+    value = value.strip()
+    if kind == "str":
+        # decrypted timestamps of date columns
+        return re.sub(r"^(\d{4}-\d{2}-\d{2})[ T]00:00:00$", r"\1", value)
+    number = float(value)
+    if float32:
+        # e.g. 555285.16 of the answers is stored as 555285.1875
+        number = struct.unpack("f", struct.pack("f", number))[0]
+    if kind in ("int", "cnt"):
+        return int(number)
+    if kind == "num":
+        return "%.2f" % number
+    return round(number, 2)
+
+def CellMatches(kind, expected, actual):
+    """the rules of dbgen/check_answers/cmpq.pl"""
+    if kind in EXACT_KINDS:
+        return expected == actual
+    if kind == "sum":
+        return abs(expected - actual) <= 100
+    if kind == "avg":
+        return abs(expected - actual) <= abs(expected) / 100
+    return abs(expected - actual) <= 1 # rat
+
+class MultisetDigest():
+    """
+    Order-insensitive digest of rows in constant memory: the sum of the sha256
+    of their exact columns, and the sum of each of their other columns.
+    """
+
+    def __init__(self, kinds) -> None:
+        self.kinds = kinds
+        self.rows = 0
+        self.hash = 0
+        self.sums = [0.0] * len(kinds)
+
+    def add(self, row):
+        exact = "\0".join(str(value) for kind, value in zip(self.kinds, row) if kind in EXACT_KINDS)
+        self.hash = (self.hash + int(hashlib.sha256(exact.encode()).hexdigest(), 16)) % DIGEST_MODULUS
+        for col, kind in enumerate(self.kinds):
+            if kind not in EXACT_KINDS:
+                self.sums[col] += row[col]
+        self.rows += 1
+
+    def mismatches(self, actual):
+        if self.rows != actual.rows:
+            return [f"{self.rows} rows expected, {actual.rows} rows"]
+        result = []
+        if self.hash != actual.hash:
+            result.append("exact columns differ")
+        for col, kind in enumerate(self.kinds):
+            if kind in EXACT_KINDS:
+                continue
+            # the tolerance of a cell, for every row
+            expected, got = self.sums[col] / max(self.rows, 1), actual.sums[col] / max(self.rows, 1)
+            if not CellMatches(kind, expected, got):
+                result.append(f"column {col} ({kind}): {expected:.2f} expected on average, {got:.2f}")
+        return result
+
+def VerifyQuery(i, kinds, expectedRows, actualRows, types = None):
+    """(mismatches, rows) of Q{i}, comparing the rows one by one when its order is exact"""
+    mismatches = []
+    rows = 0
+    # both sides go through float32 where the result is an enc_float4
+    float32 = [t == "enc_float4" for t in types] if types else [False] * len(kinds)
+    normalize = lambda row: [Normalize(kind, value, f) for kind, f, value in zip(kinds, float32, row)]
+    if i in ORDERED_QUERIES:
+        for expected, actual in zip_longest(expectedRows, actualRows):
+            rows += 1
+            if expected is None or actual is None:
+                mismatches.append(f"row {rows}: {'extra' if expected is None else 'missing'} row")
+                continue
+            if len(expected) != len(kinds) or len(actual) != len(kinds):
+                mismatches.append(f"row {rows}: {len(actual)} columns, {len(kinds)} expected")
+                continue
+            try:
+                expected, actual = normalize(expected), normalize(actual)
+            except (ValueError, OverflowError) as e:
+                mismatches.append(f"row {rows}: {e}")
+                continue
+            for col, kind in enumerate(kinds):
+                if not CellMatches(kind, expected[col], actual[col]):
+                    mismatches.append(f"row {rows} column {col} ({kind}): {expected[col]} expected, {actual[col]}")
+            # keep the memory constant
+            del mismatches[MAX_REPORTED:]
+        return mismatches, rows
+
+    expectedDigest = MultisetDigest(kinds)
+    actualDigest = MultisetDigest(kinds)
+    for digest, source in ((expectedDigest, expectedRows), (actualDigest, actualRows)):
+        for row in source:
+            if len(row) != len(kinds):
+                return [f"{len(row)} columns, {len(kinds)} expected"], digest.rows
+            try:
+                digest.add(normalize(row))
+            except (ValueError, OverflowError) as e:
+                return [f"row {digest.rows + 1}: {e}"], digest.rows
+    return expectedDigest.mismatches(actualDigest), actualDigest.rows
+
+def VerifyResults(propFile = DEFAULT_TPCH_CONFIG, query = 0, expectedDir = "dbgen/answers", actualDir = None):
+    """verifies the results of RunTest, returns the number of queries that do not match"""
+    properties = loadPropertyFile(propFile)
+
+    pgIp = properties['pg_ip']
+    pgPort = properties['pg_port']
+    pgUser = properties['pg_user']
+    pgPW = properties['pg_password']
+    dataSize = properties['data_size']
+    secureQuery = properties['secure']
+    cipherQueryDir = properties['cipher_query_dir']
+    actualDir = actualDir or properties['output_dir']
+
+    if os.path.exists(os.path.join(expectedDir, "q1.out")) and float(dataSize) != 1:
+        print(f"warning: the answers of dbgen are for scale factor 1, not {dataSize}")
+
+    conn = None
+    oracle = None
+    if secureQuery == 'y':
+        conn = psycopg2.connect(database = 'secure_test', user = pgUser, password = pgPW, host = pgIp, port = pgPort)
+        conn.autocommit = True
+        # cached plaintexts are only needed within a batch
+        oracle = CipherOracle(database = 'secure_test', user = pgUser, password = pgPW, host = pgIp, port = pgPort,
+                              cache_size = 4096)
+
+    columnKinds = LoadColumnKinds()
+    queryRange = range(query, query + 1) if query else range(1, 23)
+    failed = 0
+    for i in queryRange:
+        expectedPath = os.path.join(expectedDir, f"q{i}.out")
+        if not os.path.exists(expectedPath):
+            expectedPath = os.path.join(expectedDir, f"Q{i}.csv")
+        actualPath = os.path.join(actualDir, f"Q{i}.csv")
+
+        types = None
+        if conn is not None:
+            cur = conn.cursor()
+            types = ColumnTypes(cur, open(cipherQueryDir + f"/Q{i}.sql", "r").read())
+            cur.close()
+        mismatches, rows = VerifyQuery(i, columnKinds[i - 1], ReadRows(expectedPath),
+                                       DecryptRows(ReadRows(actualPath), types, oracle), types)
+
+        mode = "ordered" if i in ORDERED_QUERIES else "multiset"
+        print(f"query Q{i}: {'ok' if not mismatches else 'MISMATCH'} ({rows} rows, {mode})")
+        for mismatch in mismatches[:MAX_REPORTED]:
+            print(f"    {mismatch}")
+        failed += bool(mismatches)
+
+    if conn is not None:
+        print(oracle.stats())
+        oracle.close()
+        conn.close()
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(description='Verify TPC-H results.')
+    parser.add_argument('-Q', '--query', type=int, default=0, help='verify the given query')
+    parser.add_argument('-e', '--expected', type=str, default='dbgen/answers', help='directory of q*.out answers or Q*.csv results')
+    parser.add_argument('-a', '--actual', type=str, default=None, help='directory of the Q*.csv results (default: output_dir)')
+    args = parser.parse_args()
+
+    failed = VerifyResults(query=args.query, expectedDir=args.expected, actualDir=args.actual)
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
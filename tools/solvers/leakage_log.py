@@ -0,0 +1,129 @@
+# $ python3 -m pip install numpy
+#
+# Reader of the binary leakage log that the I-Zone and the ops server write
+# with HEDB_LEAKAGE_LOG=binary (src/utils/leakage_log.cpp), one
+# `<zone>-<pid>.bin` file per process.
+# $ python3 leakage_log.py /tmp/privacy_zone-*.bin    # print it as text lines
+
+import argparse, base64, glob, os
+
+import numpy as np
+
+# indexed by LeakageOp
+OPS = ("", "+", "-", "*", "/", "%", "^", "SUM", "AVG", "MAX", "MIN", "==", "!=", "<", "<=", ">", ">=")
+
+# record flags
+ITEM = 0x1
+BOOL = 0x2
+DROPPED = 0x4
+
+CIPHER_LENGTH = 32
+
+# struct LeakageRecord
+RECORD = np.dtype([
+    ("timestamp", "<u8"),
+    ("type", "u1"),
+    ("op", "u1"),
+    ("flags", "u1"),
+    ("cond", "u1"),
+    ("pid", "<u4"),
+    ("left", f"V{CIPHER_LENGTH}"),
+    ("right", f"V{CIPHER_LENGTH}"),
+    ("res", f"V{CIPHER_LENGTH}"),
+])
+assert RECORD.itemsize == 112
+
+
+def load(path: str) -> np.ndarray:
+    """Maps one .bin file read-only, without the unwritten tail of its last window."""
+    count = os.path.getsize(path) // RECORD.itemsize
+    if count == 0:
+        return np.empty(0, dtype=RECORD)
+    records = np.memmap(path, dtype=RECORD, mode="r", shape=(count,))
+    written = np.flatnonzero(records["op"])
+    return records[:written[-1] + 1] if len(written) else records[:0]
+
+
+def paths(pattern: str) -> list:
+    """The .bin files of `pattern`, which may be a glob like /tmp/privacy_zone-*.bin"""
+    return sorted(glob.glob(pattern)) or [pattern]
+
+
+def b64(cipher) -> str:
+    return base64.b64encode(cipher.tobytes()).decode()
+
+
+def lines(records: np.ndarray):
+    """The records as the text lines of the default log format."""
+    items = []
+    for record in records:
+        op = OPS[record["op"]]
+        prefix = f"{chr(record['type'])} {op}" if record["type"] else op
+        flags = record["flags"]
+        if flags & ITEM:
+            items.append(b64(record["left"]))
+        elif flags & DROPPED:
+            # the writer ran out of ring space in the middle of this bulk op
+            items = []
+        elif items:
+            yield f"{prefix} {' '.join(items)} {b64(record['res'])}"
+            items = []
+        elif flags & BOOL:
+            yield f"{prefix} {b64(record['left'])} {b64(record['right'])} {'True' if record['cond'] else 'False'}"
+        else:
+            yield f"{prefix} {b64(record['left'])} {b64(record['right'])} {b64(record['res'])}"
+
+
+class LeakageReader():
+    """
+    Hands out micro-batches of text lines from binary logs, like a LogFollower
+    that does not follow.
+    """
+
+    def __init__(self, pattern: str, batch_size: int = 256) -> None:
+        self.paths = paths(pattern)
+        self.batch_size = batch_size
+        self.follow = False
+        self.min_sleep = self.max_sleep = 0
+        self.pending = self.read_batches()
+
+    def read_batches(self):
+        for path in self.paths:
+            batch = []
+            for line in lines(load(path)):
+                batch.append(line)
+                if len(batch) == self.batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+    def poll(self) -> list:
+        """Next micro-batch; [] once every file is consumed."""
+        return next(self.pending, [])
+
+    def batches(self):
+        yield from self.pending
+
+    def close(self):
+        self.pending.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", help="Binary leakage logs", nargs="+")
+    parser.add_argument("-s", "--stats", help="Only count records per op", action="store_true")
+    args = parser.parse_args()
+
+    for pattern in args.paths:
+        for path in paths(pattern):
+            records = load(path)
+            if args.stats:
+                ops, counts = np.unique(records["op"], return_counts=True)
+                print(path, ", ".join(f"{OPS[op]}: {count}" for op, count in zip(ops, counts)))
+                continue
+            for line in lines(records):
+                print(line)
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,14 @@
-import argparse, logging, datetime, signal
-import time
+import argparse, logging, datetime, signal, functools
+import multiprocessing, threading
+from collections import OrderedDict, deque
+import os, sys, time
 
-import psycopg2
 import z3
 
-con: "psycopg2.connection" = psycopg2.connect(
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from oracle import CipherOracle
+
+cipher_oracle = CipherOracle(
     database='secure_test', 
     user='postgres', 
     password='postgres', 
@@ -14,7 +18,6 @@ con: "psycopg2.connection" = psycopg2.connect(
 
 variable_table: dict = {}
 r_variable_table: dict = {}
-logs: list = []
 tag = 'x'
 idx = 0
 
@@ -27,130 +30,897 @@ logging.basicConfig(
 
 
 def handler(signum: "signal._SIGNUM", frame):
-    if signal.SIGINT == signum:
+    if signum in (signal.SIGINT, signal.SIGTERM):
+        logging.info(session.stats())
+        logging.info(cipher_oracle.stats())
+        print(session.stats())
         print("Goodbye!")
         exit(0)
 
 
-def oracle(enc_var: str) -> str:
-    if enc_var.lower() in ["true", "false"]:
+def c_div(a, b):
+    """C integer division truncates toward zero while z3 floors, so divide magnitudes."""
+    return z3.If(a >= 0, z3.If(b > 0, a / b, -(a / -b)), z3.If(b > 0, -(-a / b), -a / -b))
+
+
+def c_rem(a, b):
+    return a - b * c_div(a, b)
+
+
+class Sort():
+    """
+    How one type tag of the log maps onto z3: the variable and literal
+    constructors, the oracle type, and the primitive operations it supports.
+    Operations z3 cannot express exactly (e.g. pow) are uninterpreted
+    functions, which keeps them functional without claiming more.
+    """
+
+    def __init__(self, name: str, oracle_type: str, var, val, ops: dict, uninterpreted: dict = {},
+                 logged: dict = {}) -> None:
+        self.name = name
+        self.oracle_type = oracle_type
+        self.var = var
+        self.val = val
+        self.ops = dict(ops)
+        # builders of the ops whose UDF logs something else than OPERATORS assumes
+        self.logged = dict(logged)
+        z3_sort = var("_").sort()
+        for op, fname in uninterpreted.items():
+            self.ops[op] = z3.Function(f"{name}_{fname}", z3_sort, z3_sort, z3_sort)
+
+
+RNE = z3.RNE()
+FLOAT32 = z3.Float32()
+FLOAT64 = z3.Float64()
+BULK_SIZE = 256  # src/include/defs.h
+
+
+def chunked(add_chunk):
+    """
+    SUM as the UDFs send it to the ops server: BULK_SIZE items per request,
+    each request after the first starting with the sum of the previous one.
+    """
+    def total(args: tuple):
+        result = args[0]
+        for start in range(1, len(args), BULK_SIZE - 1):
+            result = add_chunk((result,) + tuple(args[start:start + BULK_SIZE - 1]))
+        return result
+    return total
+
+
+def int_chunk(items: tuple):
+    result = items[0]
+    for item in items[1:]:
+        result = result + item
+    return result
+
+
+def float_chunk(items: tuple):
+    # plain_float_bulk adds the floats in a double, rounded to a float once
+    result = z3.FPVal(0.0, FLOAT64)
+    for item in items:
+        result = z3.fpAdd(RNE, result, z3.fpToFP(RNE, item, FLOAT64))
+    return z3.fpToFP(RNE, result, FLOAT32)
+
+
+def select(picks_left: bool):
+    # the result is `left > right ? left : right`, or the other one
+    def build(sort: "Sort", args: tuple, result) -> list:
+        gt = sort.ops[">"](args[0], args[1])
+        return [result == (z3.If(gt, args[0], args[1]) if picks_left else z3.If(gt, args[1], args[0]))]
+    return build
+
+
+SORTS = {
+    "i": Sort("int", "int", z3.Int, z3.IntVal, {
+        "+": lambda a, b: a + b,
+        "-": lambda a, b: a - b,
+        "*": lambda a, b: a * b,
+        "/": c_div,
+        "%": c_rem,
+        "==": lambda a, b: a == b,
+        "!=": lambda a, b: a != b,
+        "<": lambda a, b: a < b,
+        "<=": lambda a, b: a <= b,
+        ">": lambda a, b: a > b,
+        ">=": lambda a, b: a >= b,
+        "nonzero": lambda b: b != 0,
+        "sum": chunked(int_chunk),
+    }, uninterpreted={"^": "pow"}),
+    "f": Sort("float", "float", lambda n: z3.FP(n, FLOAT32), lambda v: z3.FPVal(v, FLOAT32), {
+        "+": lambda a, b: z3.fpAdd(RNE, a, b),
+        "-": lambda a, b: z3.fpSub(RNE, a, b),
+        "*": lambda a, b: z3.fpMul(RNE, a, b),
+        "/": lambda a, b: z3.fpDiv(RNE, a, b),
+        "==": z3.fpEQ,
+        "!=": z3.fpNEQ,
+        "<": z3.fpLT,
+        "<=": z3.fpLEQ,
+        ">": z3.fpGT,
+        ">=": z3.fpGEQ,
+        "sum": chunked(float_chunk),
+    }, uninterpreted={"%": "mod", "^": "pow"},
+        # enc_float4_min logs `cmp == 1 ? f1 : f2`, the greater operand
+        logged={"MIN": select(True)}),
+    "s": Sort("text", "text", z3.String, z3.StringVal, {
+        "==": lambda a, b: a == b,
+        "!=": lambda a, b: a != b,
+        "<": lambda a, b: a < b,
+        "<=": lambda a, b: a <= b,
+        ">": lambda a, b: b < a,
+        ">=": lambda a, b: b <= a,
+    }),
+}
+DEFAULT_SORT = "i"  # privacy-zone lines carry no type tag
+
+
+def binary(op: str):
+    def build(sort: "Sort", args: tuple, result) -> list:
+        cons = [sort.ops[op](args[0], args[1]) == result]
+        if op in ("/", "%") and "nonzero" in sort.ops:
+            cons.append(sort.ops["nonzero"](args[1]))
+        return cons
+    return build
+
+
+def compare(op: str):
+    def build(sort: "Sort", args: tuple, result) -> list:
+        cmp = sort.ops[op](args[0], args[1])
+        return [cmp if result else z3.Not(cmp)]
+    return build
+
+
+def bulk_sum(sort: "Sort", args: tuple, result) -> list:
+    return [sort.ops["sum"](args) == result]
+
+
+def bulk_avg(sort: "Sort", args: tuple, result) -> list:
+    # the count is summed the same way, which is exact
+    return [sort.ops["/"](sort.ops["sum"](args), sort.val(len(args))) == result]
+
+
+# op -> (arity or None for variadic, primitives it needs, builder, returns a boolean)
+OPERATORS = {
+    "+": (2, ("+",), binary("+"), False),
+    "-": (2, ("-",), binary("-"), False),
+    "*": (2, ("*",), binary("*"), False),
+    "/": (2, ("/",), binary("/"), False),
+    "%": (2, ("%",), binary("%"), False),
+    "^": (2, ("^",), binary("^"), False),
+    "SUM": (None, ("sum",), bulk_sum, False),
+    "AVG": (None, ("sum", "/"), bulk_avg, False),
+    "MAX": (2, (">",), select(True), False),
+    "MIN": (2, (">",), select(False), False),
+    "==": (2, ("==",), compare("=="), True),
+    "!=": (2, ("!=",), compare("!="), True),
+    "<": (2, ("<",), compare("<"), True),
+    "<=": (2, ("<=",), compare("<="), True),
+    ">": (2, (">",), compare(">"), True),
+    ">=": (2, (">=",), compare(">="), True),
+}
+
+# compiled once: (type tag, op) -> (arity, translator, returns a boolean)
+TRANSLATORS = {
+    (tag, op): (arity, functools.partial(sort.logged.get(op, build), sort), boolean)
+    for tag, sort in SORTS.items()
+    for op, (arity, needs, build, boolean) in OPERATORS.items()
+    if all(n in sort.ops for n in needs)
+}
+
+
+def is_cipher(token: str) -> bool:
+    return token.lower() not in ["true", "false"]
+
+
+def split(raw_line: str) -> tuple:
+    """[f/i/s] op var1 var2 ... res -> (tag, op, operands)"""
+    tokens = raw_line.strip().split()
+    if tokens and tokens[0] in SORTS:
+        return tokens[0], tokens[1] if len(tokens) > 1 else "", tokens[2:]
+    return DEFAULT_SORT, tokens[0] if tokens else "", tokens[1:]
+
+
+def oracle(enc_var: str, type: str = "int") -> str:
+    if not is_cipher(enc_var):
         return enc_var
-    with con:
-        cur = con.cursor()
-        cur.execute(f"SELECT enc_int4_decrypt('{enc_var}');")
-        ret = cur.fetchall()[0][0]
-    return ret
+    return cipher_oracle.decrypt(enc_var, type)
+
+
+def prefetch(raw_lines: list):
+    """Decrypt every unseen cipher of `raw_lines` in one batch per type; later oracle() calls hit the cache."""
+    ciphers: dict = {}
+    for line in raw_lines:
+        tag, _, operands = split(line)
+        ciphers.setdefault(SORTS[tag].oracle_type, []).extend(
+            v for v in operands if v not in variable_table and is_cipher(v))
+    for type, cs in ciphers.items():
+        if cs:
+            cipher_oracle.decrypt_many(cs, type)
+
+
+def truth(var):
+    """Ground truth of `var` as a z3 literal of its sort."""
+    value = r_variable_table[var]
+    if z3.is_fp(var):
+        return z3.FPVal(value, var.sort())
+    if z3.is_string(var):
+        return z3.StringVal(value)
+    return value
 
 
 class OpLog():
 
-    def __init__(self, op: str, vars: tuple, result) -> None:
+    def __init__(self, op: str, vars: tuple, result, sort: str = DEFAULT_SORT) -> None:
         self.op = op
         self.vars = vars
         self.result = result
+        self.sort = sort
 
     def __repr__(self) -> str:
-        s = f"({self.op}"
+        s = f"({self.sort} {self.op}"
         for v in self.vars:
             s += f" {v}"
         s += f") -> {self.result}"
         return s
 
+    def variables(self) -> set:
+        candidate = set(self.vars)
+        if not isinstance(self.result, bool):
+            candidate.add(self.result)
+        return candidate
+
+    def to_record(self) -> tuple:
+        """Picklable form (z3 terms are not) with the ground truth of every variable."""
+        result = self.result if isinstance(self.result, bool) else str(self.result)
+        return (self.sort, self.op, tuple(str(v) for v in self.vars), result,
+                {str(v): r_variable_table[v] for v in self.variables()})
+
+    @staticmethod
+    def from_record(record: tuple) -> "OpLog":
+        sort, op, names, result, truths = record
+        vars = {}
+        for name, value in truths.items():
+            tmp = SORTS[sort].var(name)
+            r_variable_table[tmp] = value
+            vars[name] = tmp
+        result = result if isinstance(result, bool) else vars[result]
+        return OpLog(op, tuple(vars[n] for n in names), result, sort)
+
+
+def variable(enc_var: str, sort: "Sort"):
+    global idx
+    if enc_var not in variable_table:
+        tmp = sort.var(f"{tag}{idx}")
+        idx = idx + 1
+        variable_table[enc_var] = tmp
+        r_variable_table[tmp] = oracle(enc_var, sort.oracle_type)
+    return variable_table[enc_var]
+
 
 def transform(raw_line: str):
-    global idx
-    # TODO: Change code to apply for new format
-    # format: op var1 var2 result (old)
-    # new format: [f/i/s] op var1 var2 ... res(val/True/False)
-    #             op: [+,-,*,/,%,^,SUM,AVG,MAX,MIN,>,<,==,<=,>=,!=]
-    tokens = raw_line.strip().split()
-    op = tokens[0]
-    
-    vars = []
-    for v in tokens[1:]:
-        if v not in variable_table:
-            # TODO: recognize type
-            tmp = z3.Int(f"{tag}{idx}")
-            idx = idx + 1
-            variable_table[v] = tmp
-            r_variable_table[tmp] = oracle(v)
-        else:
-            tmp = variable_table[v]
-        vars.append(tmp)
+    # format: op var1 var2 result (privacy zone)
+    #         [f/i/s] op var1 var2 ... res(val/True/False) (integrity zone)
+    #         op: [+,-,*,/,%,^,SUM,AVG,MAX,MIN,>,<,==,<=,>=,!=]
+    tag, op, operands = split(raw_line)
+    if (tag, op) not in TRANSLATORS:
+        logging.debug(f"unsupported: {raw_line}")
+        return None
+    arity, _, boolean = TRANSLATORS[(tag, op)]
+    if len(operands) < 2 or (arity is not None and len(operands) != arity + 1):
+        logging.debug(f"malformed: {raw_line}")
+        return None
+
+    prefetch([raw_line])
+    sort = SORTS[tag]
+    vars = tuple(variable(v, sort) for v in operands[:-1])
+    if boolean:
+        result = operands[-1].lower() == "true"
+    else:
+        result = variable(operands[-1], sort)
+
+    return OpLog(op, vars, result, tag)
+
+
+def constraints(log: "OpLog") -> list:
+    return TRANSLATORS[(log.sort, log.op)][1](log.vars, log.result)
+
+
+class Cluster():
+    """
+    A connected component of variables. Its constraints are asserted once into
+    its own solver, so independent components are solved separately.
+    """
+
+    def __init__(self, var) -> None:
+        self.members: list = [var]
+        self.logs: list = []
+        self.constraints: list = []
+        self.solver = z3.Solver()
+
+    def absorb(self, other: "Cluster"):
+        self.members.extend(other.members)
+        self.logs.extend(other.logs)
+        self.constraints.extend(other.constraints)
+        self.solver.add(other.constraints)
+
+
+class VariableClusters():
+    """Disjoint-set index over the z3 variables of variable_table, keyed by name."""
+
+    def __init__(self, factory=Cluster) -> None:
+        self.parent: dict = {}
+        self.clusters: dict = {}
+        self.factory = factory
+
+    def find(self, var) -> str:
+        name = str(var)
+        if name not in self.parent:
+            self.parent[name] = name
+            self.clusters[name] = self.factory(var)
+            return name
+        root = name
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[name] != root:
+            self.parent[name], name = root, self.parent[name]
+        return root
+
+    def roots(self, vars) -> list:
+        """Distinct roots of `vars`, largest cluster first."""
+        roots = {self.find(v) for v in vars}
+        return sorted(roots, key=lambda r: len(self.clusters[r].members), reverse=True)
+
+    def union(self, roots: list) -> "Cluster":
+        """Merge `roots` into the first (largest) one; the smaller ones are replayed into its solver."""
+        root = roots[0]
+        cluster = self.clusters[root]
+        for other in roots[1:]:
+            cluster.absorb(self.clusters.pop(other))
+            self.parent[other] = root
+        return cluster
+
+
+class SolverSession():
+    """
+    Accepted logs stay asserted at the base scope of their cluster's solver,
+    so a new line only adds its own constraints instead of replaying the
+    history, and only touches the component it belongs to; push/pop is used
+    for the "is this value forced?" probes only.
+    """
+
+    def __init__(self) -> None:
+        self.clusters = VariableClusters()
+        self.lines = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def probe(self, solver: "z3.Solver", need_check: list) -> bool:
+        pending = set(need_check)
+        while pending:
+            var = pending.pop()
+            solver.push()
+            solver.add(var != truth(var))
+            ret = solver.check()
+            if ret == z3.unsat:
+                logging.info(f"{var} is forced to {r_variable_table[var]}")
+                return False
+            if ret == z3.sat:
+                # a model that moves other variables off their true values
+                # proves they are not forced either, so skip their probes
+                model = solver.model()
+                pending = {
+                    v for v in pending
+                    if not z3.is_true(model.eval(v != truth(v), model_completion=True))
+                }
+                logging.debug(f"{model}")
+            solver.pop()
+        return True
+
+    def check(self, input_log: "OpLog") -> bool:
+        candidate = input_log.variables()
+        roots = self.clusters.roots(candidate)
+        clusters = [self.clusters.clusters[r] for r in roots]
+
+        # every variable of the merged component, not only the direct neighbours
+        need_check = [v for c in clusters for v in c.members]
+        logging.debug(f"candidate: {candidate}")
+        logging.debug(f"need check: {len(need_check)} vars in {len(clusters)} clusters")
+
+        cons = constraints(input_log)
+        solver = clusters[0].solver
+        scopes = solver.num_scopes()
+        solver.push()
+        for other in clusters[1:]:
+            solver.add(other.constraints)
+        solver.add(cons)
+        try:
+            exposed = not self.probe(solver, need_check)
+        finally:
+            solver.pop(solver.num_scopes() - scopes)
+
+        if exposed:
+            return False
 
-    return OpLog(op, tuple(vars[:-1]), vars[-1])
+        self.accept(input_log, cons)
+        return True
 
+    def accept(self, input_log: "OpLog", cons: list):
+        cluster = self.clusters.union(self.clusters.roots(input_log.variables()))
+        cluster.logs.append(input_log)
+        cluster.constraints.extend(cons)
+        cluster.solver.add(cons)
 
-def analyze(input_log: "OpLog"):
+    def adopt(self, logs: list):
+        """Assert logs that were already checked elsewhere, e.g. migrated from another worker."""
+        for log in logs:
+            self.accept(log, constraints(log))
 
-    need_check = set()
-    candidate = set(input_log.vars)
-    candidate.add(input_log.result)
-    need_check.update(candidate)
-    
-    logging.debug(f"candidate: {candidate}")
-    solver = z3.Solver()
-
-    def check_op(log: "OpLog"):
-        nonlocal solver
-        if log.op == "+":
-            # z3.Sum()
-            solver.add(log.vars[0] + log.vars[1] == log.result)
-        elif log.op == "-":
-            # if log.vars[0] == log.vars[1]:
-            #     solver.add(log.vars[0] - log.vars[1] == 0)
-            # else:
-            #     solver.add(log.vars[0] - log.vars[1] == log.result)
-            solver.add(log.vars[0] - log.vars[1] == log.result)
-        elif log.op == "/":
-            solver.add(log.vars[0] / log.vars[1] == log.result)
-            solver.add(log.vars[1] != 0)
-        elif log.op == "*":
-            solver.add(log.vars[0] * log.vars[1] == log.result)
-
-    check_op(input_log)
-    for log in logs:
-        log_candidate = set(log.vars)
-        log_candidate.add(log.result)
-
-        if candidate.intersection(log_candidate):
-            need_check.update(log_candidate)
-            check_op(log)
-    
-    logging.debug(f"need check: {need_check}")
+    def records(self) -> list:
+        return [log.to_record() for cluster in self.clusters.clusters.values() for log in cluster.logs]
 
-    for var in need_check:
-        solver.push()
-        solver.add(var != r_variable_table[var])
-        if solver.check() == z3.CheckSatResult(z3.Z3_L_FALSE):
-            logging.info(f"{solver}")
-            return False
-        logging.info(f"{solver}")
-        logging.info(f"{solver.model()}")
-        solver.pop()
+    def record(self, elapsed_ns: int):
+        self.lines += 1
+        self.total_ns += elapsed_ns
+        self.max_ns = max(self.max_ns, elapsed_ns)
 
-    return True
+    def stats(self) -> str:
+        avg = self.total_ns / self.lines if self.lines else 0
+        return (f"lines: {self.lines}, total: {self.total_ns/1000/1000:.4f}ms, "
+                f"avg: {avg/1000/1000:.4f}ms, max: {self.max_ns/1000/1000:.4f}ms")
 
 
-def run(integrity_zone: str, privacy_zone: str):
-    with open(integrity_zone, "r") as integrity_fp, open(privacy_zone, "r") as privacy_fp:
-        while True:
-            if not privacy_fp.readable():
-                    continue
-            line = privacy_fp.readline().strip()
+session = SolverSession()
+
+
+def analyze(input_log: "OpLog"):
+    st = time.perf_counter_ns()
+    result = session.check(input_log)
+    et = time.perf_counter_ns()
+
+    session.record(et - st)
+    logging.info(f"solve latency: {(et - st)/1000/1000:.4f}ms")
+    return result
+
+
+class LogFollower():
+    """
+    Tails a log like `tail -F`: hands out micro-batches of complete lines,
+    sleeps with an exponential backoff while nothing arrives, and reopens the
+    file after it is rotated or truncated.
+    """
+
+    def __init__(self, path: str, follow: bool = True, batch_size: int = 256,
+                 min_sleep: float = 0.01, max_sleep: float = 1.0) -> None:
+        self.path = path
+        self.follow = follow
+        self.batch_size = batch_size
+        self.min_sleep = min_sleep
+        self.max_sleep = max_sleep
+        self.fp = None
+        self.inode = None
+        self.partial = b""
+
+    def open(self) -> bool:
+        try:
+            self.fp = open(self.path, "rb")
+        except FileNotFoundError:
+            return False
+        self.inode = os.fstat(self.fp.fileno()).st_ino
+        self.partial = b""
+        return True
+
+    def close(self):
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
+
+    def rotated(self) -> bool:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            # moved away and not recreated yet, keep the old file
+            return False
+        return st.st_ino != self.inode or st.st_size < self.fp.tell()
+
+    def read_batch(self) -> list:
+        lines = []
+        while len(lines) < self.batch_size:
+            line = self.fp.readline()
+            if not line:
+                break
+            if not line.endswith(b"\n"):
+                # the writer has not finished this line yet
+                self.partial += line
+                break
+            line = (self.partial + line).decode(errors="replace").strip()
+            self.partial = b""
             if line:
+                lines.append(line)
+        return lines
+
+    def poll(self) -> list:
+        """Next micro-batch without waiting; [] when nothing new has arrived."""
+        if self.fp is None and not self.open():
+            return []
+        lines = self.read_batch()
+        if not lines and self.follow and self.rotated():
+            logging.info(f"{self.path} rotated or truncated, reopen it")
+            self.close()
+        return lines
+
+    def batches(self):
+        sleep = self.min_sleep
+        while True:
+            lines = self.poll()
+            if lines:
+                sleep = self.min_sleep
+                yield lines
+                continue
+
+            if not self.follow:
+                return
+            time.sleep(sleep)
+            sleep = min(sleep * 2, self.max_sleep)
+
+
+def open_log(path: str, follow: bool, batch_size: int):
+    """LogFollower for a text log, LeakageReader for binary `.bin` logs (never followed)."""
+    if path.endswith(".bin"):
+        from leakage_log import LeakageReader
+        return LeakageReader(path, batch_size=batch_size)
+    return LogFollower(path, follow=follow, batch_size=batch_size)
+
+
+class Composite():
+    """
+    An integrity-zone SUM/AVG, which the ops server runs as several requests
+    (chunked SUMs, the `a / a` unit, the final division). Privacy-zone ops
+    whose operands all derive from its items belong to it; it is complete
+    once one of them produces its result.
+    """
+
+    def __init__(self, lineno: int, raw: str, ops: tuple, items: list, result: str) -> None:
+        self.lineno = lineno
+        self.raw = raw
+        self.ops = ops
+        self.taint = set(items)
+        self.result = result
+        self.done = False
+
+
+class Correlator():
+    """
+    Windowed hash join of integrity-zone and privacy-zone ops on their base64
+    operands. At most `window` unmatched ops are kept per side; the oldest is
+    reported as a mismatch when the window overflows, so memory stays bounded
+    however large the logs are.
+    """
+
+    # the privacy zone only logs integer ops (enc_int_ops.cpp)
+    SORTS = (DEFAULT_SORT,)
+    COMPARES = ("==", "!=", "<", "<=", ">", ">=", "MAX", "MIN")
+    # composite -> the privacy-zone ops it is made of
+    COMPOSITES = {"SUM": ("SUM", "+"), "AVG": ("SUM", "/")}
+
+    def __init__(self, window: int = 1 << 16) -> None:
+        self.window = window
+        self.seq = 0
+        # side -> seq -> (key, lineno, raw, operands, result)
+        self.pending = {"integrity": OrderedDict(), "privacy": OrderedDict()}
+        # side -> key -> deque of seq
+        self.index = {"integrity": {}, "privacy": {}}
+        # pending privacy ops by operand, to be claimed by a later composite
+        self.by_cipher: dict = {}
+        self.composites: OrderedDict = OrderedDict()
+        self.taint: dict = {}
+        self.matched = 0
+        self.mismatched = 0
+        self.skipped = 0
+
+    @classmethod
+    def key(cls, op: str, operands: list) -> tuple:
+        # every comparison (and MAX/MIN) reaches the ops server as one CMP request
+        if op in cls.COMPARES:
+            return ("cmp",) + tuple(operands[:2])
+        return (op,) + tuple(operands)
+
+    def feed(self, side: str, lineno: int, raw: str):
+        tag, op, operands = split(raw)
+        if tag not in self.SORTS or len(operands) < 2:
+            self.skipped += 1
+            return
+        if side == "integrity" and op in self.COMPOSITES:
+            self.add_composite(lineno, raw, self.COMPOSITES[op], operands[:-1], operands[-1])
+            return
+
+        key = self.key(op, operands)
+        other = "privacy" if side == "integrity" else "integrity"
+        seqs = self.index[other].get(key)
+        if seqs:
+            self.remove(other, seqs[0])
+            self.matched += 1
+            return
+        if side == "privacy" and self.claim(op, operands[:-1], operands[-1]):
+            return
+        self.add(side, key, lineno, raw, operands)
+
+    def add(self, side: str, key: tuple, lineno: int, raw: str, operands: list):
+        self.seq += 1
+        self.pending[side][self.seq] = (key, lineno, raw, operands)
+        self.index[side].setdefault(key, deque()).append(self.seq)
+        if side == "privacy":
+            for c in operands[:-1]:
+                self.by_cipher.setdefault(c, set()).add(self.seq)
+        while len(self.pending[side]) > self.window:
+            self.report(side, self.remove(side, next(iter(self.pending[side]))))
+
+    def remove(self, side: str, seq: int) -> tuple:
+        entry = self.pending[side].pop(seq)
+        key, _, _, operands = entry
+        seqs = self.index[side][key]
+        seqs.remove(seq)
+        if not seqs:
+            del self.index[side][key]
+        if side == "privacy":
+            for c in operands[:-1]:
+                claimed = self.by_cipher.get(c)
+                if claimed is not None:
+                    claimed.discard(seq)
+                    if not claimed:
+                        del self.by_cipher[c]
+        return entry
+
+    def claim(self, op: str, operands: list, result: str) -> bool:
+        """Attribute a privacy-zone op to a pending composite all its operands derive from."""
+        for cid in list(self.taint.get(operands[0], ())):
+            composite = self.composites.get(cid)
+            if composite is None or op not in composite.ops or not all(c in composite.taint for c in operands):
+                continue
+            self.extend(cid, composite, result)
+            return True
+        return False
+
+    def extend(self, cid: int, composite: "Composite", cipher: str):
+        composite.taint.add(cipher)
+        self.taint.setdefault(cipher, set()).add(cid)
+        if cipher == composite.result:
+            composite.done = True
+            self.matched += 1
+            self.retire(cid)
+
+    def add_composite(self, lineno: int, raw: str, ops: tuple, items: list, result: str):
+        self.seq += 1
+        cid = self.seq
+        composite = Composite(lineno, raw, ops, items, result)
+        self.composites[cid] = composite
+        for c in composite.taint:
+            self.taint.setdefault(c, set()).add(cid)
+
+        # the privacy-zone side is usually logged first, claim what is already pending
+        work = list(items)
+        while work and not composite.done:
+            cipher = work.pop()
+            for seq in list(self.by_cipher.get(cipher, ())):
+                key, _, _, operands = self.pending["privacy"][seq]
+                if key[0] in ops and all(c in composite.taint for c in operands[:-1]):
+                    self.remove("privacy", seq)
+                    self.extend(cid, composite, operands[-1])
+                    work.append(operands[-1])
+                    if composite.done:
+                        break
+
+        while len(self.composites) > self.window:
+            old = next(iter(self.composites))
+            self.report("integrity", (None, self.composites[old].lineno, self.composites[old].raw, None))
+            self.retire(old)
+
+    def retire(self, cid: int):
+        composite = self.composites.pop(cid, None)
+        if composite is None:
+            return
+        for c in composite.taint:
+            owners = self.taint.get(c)
+            if owners is not None:
+                owners.discard(cid)
+                if not owners:
+                    del self.taint[c]
+
+    def report(self, side: str, entry: tuple):
+        _, lineno, raw, _ = entry
+        self.mismatched += 1
+        if side == "privacy":
+            logging.warning(f"correlate: ops server ran an op no query issued, privacy line {lineno}: {raw}")
+        else:
+            logging.warning(f"correlate: query op never reached the ops server, integrity line {lineno}: {raw}")
+
+    def flush(self):
+        for side in ("integrity", "privacy"):
+            while self.pending[side]:
+                self.report(side, self.remove(side, next(iter(self.pending[side]))))
+        while self.composites:
+            cid = next(iter(self.composites))
+            self.report("integrity", (None, self.composites[cid].lineno, self.composites[cid].raw, None))
+            self.retire(cid)
+
+    def stats(self) -> str:
+        return f"matched: {self.matched}, mismatched: {self.mismatched}, skipped: {self.skipped}"
+
+
+def run_correlate(integrity: "LogFollower", privacy: "LogFollower", window: int) -> "Correlator":
+    correlator = Correlator(window)
+    lineno = {"integrity": 0, "privacy": 0}
+    followers = {"integrity": integrity, "privacy": privacy}
+    sleep = integrity.min_sleep
+    while True:
+        idle = True
+        for side, follower in followers.items():
+            for line in follower.poll():
+                idle = False
+                lineno[side] += 1
+                correlator.feed(side, lineno[side], line)
+        if not idle:
+            sleep = integrity.min_sleep
+            continue
+        if not integrity.follow:
+            break
+        time.sleep(sleep)
+        sleep = min(sleep * 2, integrity.max_sleep)
+
+    correlator.flush()
+    logging.info(correlator.stats())
+    print(correlator.stats())
+    return correlator
+
+
+class Shard():
+    """Parser-side view of a cluster: its members and the worker that owns it."""
+
+    def __init__(self, var) -> None:
+        self.members: list = [var]
+        self.worker = None
+
+    def absorb(self, other: "Shard"):
+        self.members.extend(other.members)
+
+
+def solve_worker(index: int, inbox, migrate: list, results):
+    """
+    Owns a disjoint set of clusters, one SolverSession per parser-side root.
+    A cluster merged into one owned by another worker is exported to that
+    worker through its migrate queue.
+    """
+    sessions: dict = {}
+    arrived: dict = {}
+    lines, total_ns, max_ns = 0, 0, 0
+
+    while True:
+        msg = inbox.get()
+        if msg[0] == "check":
+            _, lineno, raw, cid, record = msg
+            log = OpLog.from_record(record)
+            st = time.perf_counter_ns()
+            result = sessions.setdefault(cid, SolverSession()).check(log)
+            et = time.perf_counter_ns()
+            lines, total_ns, max_ns = lines + 1, total_ns + et - st, max(max_ns, et - st)
+            if not result:
+                results.put(("exposed", lineno, raw))
+        elif msg[0] == "export":
+            _, cid, dest = msg
+            session = sessions.pop(cid, None)
+            migrate[dest].put((cid, session.records() if session else []))
+        elif msg[0] == "absorb":
+            _, cid, other, src = msg
+            if src is None:
+                session = sessions.pop(other, None)
+                records = session.records() if session else []
+            else:
+                # wait for the state exported by `src`, other clusters may arrive first
+                while other not in arrived:
+                    c, r = migrate[index].get()
+                    arrived[c] = r
+                records = arrived.pop(other)
+            sessions.setdefault(cid, SolverSession()).adopt([OpLog.from_record(r) for r in records])
+        elif msg[0] == "stop":
+            results.put(("stats", index, lines, total_ns, max_ns))
+            return
+
+
+def collect(results, jobs: int):
+    stopped = 0
+    lines, total_ns, max_ns = 0, 0, 0
+    while stopped < jobs:
+        msg = results.get()
+        if msg[0] == "exposed":
+            _, lineno, raw = msg
+            logging.warning(f"analyze result: Secret exposed! line {lineno}: {raw}")
+        elif msg[0] == "stats":
+            _, index, l, t, m = msg
+            logging.info(f"worker {index}: lines: {l}, total: {t/1000/1000:.4f}ms, max: {m/1000/1000:.4f}ms")
+            stopped += 1
+            lines, total_ns, max_ns = lines + l, total_ns + t, max(max_ns, m)
+    session.lines, session.total_ns, session.max_ns = lines, total_ns, max_ns
+
+
+def run_parallel(privacy: "LogFollower", jobs: int):
+    """
+    The parser (this process) transforms each line and assigns it to a
+    cluster; `jobs` solver workers each own a disjoint set of clusters and
+    report findings back to a collector thread.
+    """
+    ctx = multiprocessing.get_context("fork")
+    inboxes = [ctx.Queue(maxsize=4096) for _ in range(jobs)]
+    migrate = [ctx.Queue() for _ in range(jobs)]
+    results = ctx.Queue()
+    workers = [
+        ctx.Process(target=solve_worker, args=(i, inboxes[i], migrate, results), daemon=True)
+        for i in range(jobs)
+    ]
+    for w in workers:
+        w.start()
+    collector = threading.Thread(target=collect, args=(results, jobs), daemon=True)
+    collector.start()
+
+    shards = VariableClusters(factory=Shard)
+    lineno, next_worker = 0, 0
+    for batch in privacy.batches():
+        prefetch(batch)
+        for line in batch:
+            lineno += 1
+            new_log = transform(line)
+            if new_log is None:
+                continue
+
+            roots = shards.roots(new_log.variables())
+            dest = shards.clusters[roots[0]]
+            if dest.worker is None:
+                dest.worker = next_worker
+                next_worker = (next_worker + 1) % jobs
+            for other in roots[1:]:
+                src = shards.clusters[other]
+                if src.worker is None:
+                    continue  # fresh variable, nothing to migrate
+                if src.worker == dest.worker:
+                    inboxes[dest.worker].put(("absorb", roots[0], other, None))
+                else:
+                    inboxes[src.worker].put(("export", other, dest.worker))
+                    inboxes[dest.worker].put(("absorb", roots[0], other, src.worker))
+            shards.union(roots)
+            inboxes[dest.worker].put(("check", lineno, line, roots[0], new_log.to_record()))
+
+    for inbox in inboxes:
+        inbox.put(("stop",))
+    collector.join()
+    for w in workers:
+        w.join()
+
+
+def run(integrity_zone: str, privacy_zone: str, follow: bool = True, batch_size: int = 256, jobs: int = 1,
+        correlate: int = 0):
+    privacy = open_log(privacy_zone, follow, batch_size)
+    if correlate:
+        integrity = open_log(integrity_zone, follow, batch_size)
+        run_correlate(integrity, privacy, correlate)
+        integrity.close()
+        privacy.close()
+        return
+    if jobs > 1:
+        run_parallel(privacy, jobs)
+        privacy.close()
+        return
+    with open(integrity_zone, "r") as integrity_fp:
+        for batch in privacy.batches():
+            prefetch(batch)
+            for line in batch:
                 logging.debug(f"raw: {line}")
                 new_log = transform(line)
                 logging.debug(f"transform: {new_log}")
+                if new_log is None:
+                    continue
                 
                 result = analyze(new_log)
                 if not result:
                     logging.warning(f"analyze result: Secret exposed!")
-                else:
-                    logs.append(new_log)
-
-            # time.sleep(1)
-            input("next>")
+    privacy.close()
 
 
 def main():
@@ -158,13 +928,22 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("-i", "--integrity", help="Path of intergrity.log", type=str, required=True)
     parser.add_argument("-p", "--privacy", help="Path of privacy.log", type=str, required=True)
+    parser.add_argument("-f", "--follow", help="Keep tailing privacy.log instead of stopping at EOF", action="store_true")
+    parser.add_argument("-b", "--batch", help="Lines per micro-batch", type=int, default=256)
+    parser.add_argument("-j", "--jobs", help="Number of solver worker processes", type=int, default=1)
+    parser.add_argument("-c", "--correlate", help="Pair integrity.log with privacy.log instead of solving, "
+                        "keeping at most this many unmatched ops per side", type=int, default=0)
     args = parser.parse_args()
 
     logging.debug(f"i: {args.integrity}, p: {args.privacy}")
 
     signal.signal(signal.SIGINT, handler=handler)
+    signal.signal(signal.SIGTERM, handler=handler)
 
-    run(args.integrity, args.privacy)
+    run(args.integrity, args.privacy, args.follow, args.batch, args.jobs, args.correlate)
+    logging.info(session.stats())
+    logging.info(cipher_oracle.stats())
+    print(session.stats())
     
 
 """
@@ -0,0 +1,57 @@
+# $ python3 -m pytest tools/solvers/test_log_check.py
+
+import os
+import sys
+from unittest import mock
+
+import pytest
+
+z3 = pytest.importorskip("z3")
+psycopg2_pool = pytest.importorskip("psycopg2.pool")
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+with mock.patch.object(psycopg2_pool, "ThreadedConnectionPool"):
+    import log_check
+
+# ciphers of an integrity_zone.log, and what the oracle decrypts them to
+PLAINS = {
+    "AAECAwQFBgcICQoLDA0ODxAREhMUFRYXGBkaGxwdHh8gISIjJCUmJyg=": 1.5,
+    "KCcmJSQjIiEgHx4dHBsaGRgXFhUUExIREA8ODQwLCgkIBwYFBAMCAQA=": 2.5,
+    "ERERERERERERERERERERERERERERERERERERERERERERERERERERERE=": 16777216.0,
+    "IiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiI=": 1.0,
+    "MzMzMzMzMzMzMzMzMzMzMzMzMzMzMzMzMzMzMzMzMzMzMzMzMzMzMzM=": 16777218.0,
+}
+
+
+@pytest.fixture(autouse=True)
+def oracle():
+    log_check.cipher_oracle.cache.update(PLAINS)
+    yield
+    log_check.cipher_oracle.cache.clear()
+    log_check.variable_table.clear()
+    log_check.r_variable_table.clear()
+
+
+def consistent(log) -> bool:
+    """the constraints of `log` hold on the plaintexts of its variables"""
+    solver = z3.Solver()
+    solver.add(log_check.constraints(log))
+    solver.add([v == log_check.truth(v) for v in log.variables()])
+    return solver.check() == z3.sat
+
+
+def test_float_min_logs_the_greater_operand():
+    # enc_float4_min(1.5, 2.5) logs 2.5
+    log = log_check.transform("f MIN AAECAwQFBgcICQoLDA0ODxAREhMUFRYXGBkaGxwdHh8gISIjJCUmJyg= "
+                              "KCcmJSQjIiEgHx4dHBsaGRgXFhUUExIREA8ODQwLCgkIBwYFBAMCAQA= "
+                              "KCcmJSQjIiEgHx4dHBsaGRgXFhUUExIREA8ODQwLCgkIBwYFBAMCAQA=")
+    assert consistent(log)
+
+
+def test_float_sum_rounds_once_per_bulk():
+    # 2^24 + 1 + 1 is exact in a double, but 2^24 in Float32 steps
+    log = log_check.transform("f SUM ERERERERERERERERERERERERERERERERERERERERERERERERERERERE= "
+                              "IiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiI= "
+                              "IiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiIiI= "
+                              "MzMzMzMzMzMzMzMzMzMzMzMzMzMzMzMzMzMzMzMzMzMzMzMzMzMzMzM=")
+    assert consistent(log)